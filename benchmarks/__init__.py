@@ -0,0 +1,6 @@
+"""
+Parse and build benchmarks for the bundled protocols and formats.
+
+Run with ``python -m benchmarks``; see ``python -m benchmarks --help``.
+"""
+from harness import Case, measure_case, measure_import, run
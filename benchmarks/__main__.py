@@ -0,0 +1,68 @@
+"""
+Run the benchmarks and write the results as JSON.
+
+    python -m benchmarks -o results.json
+    python -m benchmarks --compare old.json new.json
+"""
+import sys
+from optparse import OptionParser
+try:
+    import json
+except ImportError:
+    # before Python 2.6
+    import simplejson as json
+
+from harness import run, compare
+from cases import all_cases, imports
+
+
+def log(line):
+    print >>sys.stderr, line
+
+def load(path):
+    f = open(path)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def main(args = None):
+    parser = OptionParser(usage = "%prog [options] [case ...]")
+    parser.add_option("-o", "--output", metavar = "FILE",
+        help = "write the JSON report to FILE instead of stdout")
+    parser.add_option("--min-time", type = "float", default = 0.2,
+        help = "minimum duration of a timed batch, in seconds")
+    parser.add_option("--repeat", type = "int", default = 3,
+        help = "number of timed batches per measurement; the best is kept")
+    parser.add_option("--no-imports", action = "store_true",
+        help = "skip the import time measurements")
+    parser.add_option("--compare", action = "store_true",
+        help = "compare two JSON reports given as arguments")
+    options, args = parser.parse_args(args)
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error("--compare takes two reports")
+        old = load(args[0])
+        new = load(args[1])
+        for name, what, o, n, ratio in compare(old, new):
+            print "%-24s %-6s %12.4g %12.4g %6.2fx" % (name, what, o, n, ratio)
+        return
+
+    cases = all_cases()
+    if args:
+        cases = [c for c in cases if c.name in args]
+    report = run(cases, [] if options.no_imports else imports,
+        options.min_time, options.repeat, log)
+    text = json.dumps(report, indent = 2, sort_keys = True)
+    if options.output:
+        f = open(options.output, "w")
+        try:
+            f.write(text + "\n")
+        finally:
+            f.close()
+    else:
+        print text
+
+if __name__ == "__main__":
+    main()
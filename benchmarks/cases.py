@@ -0,0 +1,202 @@
+"""
+The benchmark cases: the bundled protocols and formats, run over the sample
+files in construct/tests and over synthetic records.
+"""
+import os
+import struct
+from random import Random
+
+from construct import (Struct, Sequence, Select, LazyBound, IndexingAdapter,
+    Array)
+from construct.text import (Whitespace, Literal, Identifier, DecNumber,
+    QuotedString, CharOf, Line)
+from harness import Case
+
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "construct", "tests")
+
+def sample(*names):
+    """
+    A records function returning the contents of sample files, one record
+    per file.
+    """
+    def records():
+        result = []
+        for name in names:
+            f = open(os.path.join(SAMPLES, name), "rb")
+            try:
+                result.append(f.read())
+            finally:
+                f.close()
+        return result
+    return records
+
+
+#===============================================================================
+# synthetic records
+#===============================================================================
+def tcp_frames(count = 1000, seed = 0):
+    """
+    Ethernet/IPv4/TCP frames with payloads of random sizes.
+    """
+    rand = Random(seed)
+    frames = []
+    for i in xrange(count):
+        payload = "".join(chr(rand.randrange(256))
+            for j in xrange(rand.randrange(1461)))
+        ethernet = struct.pack(">6s6sH", "\x00\x11\x50\x8c\x28\x3c",
+            "\x00\x11\x50\x88\x6b\x57", 0x0800)
+        ipv4 = struct.pack(">BBHHHBBH4s4s", 0x45, 0, 40 + len(payload),
+            i & 0xffff, 0x4000, 64, 6, 0, "\xc0\xa8\x02\x02",
+            "\x52\x5e\xed\xda")
+        tcp = struct.pack(">HHIIBBHHH", rand.randrange(1024, 65536), 80,
+            rand.randrange(2 ** 32), rand.randrange(2 ** 32), 5 << 4, 0x18,
+            0x4470, 0, 0)
+        frames.append(ethernet + ipv4 + tcp + payload)
+    return frames
+
+def mbr_sectors(count = 100, seed = 0):
+    """
+    Master boot records with four partition entries each.
+    """
+    rand = Random(seed)
+    sectors = []
+    for i in xrange(count):
+        code = "".join(chr(rand.randrange(256)) for j in xrange(446))
+        partitions = "".join(
+            struct.pack("<B3sB3s", 0x80 if j == 0 else 0, "\x01\x01\x00",
+                rand.choice([0x06, 0x07, 0x0b, 0x83]), "\xfe\xff\xff") +
+            struct.pack(">II", rand.randrange(2 ** 20),
+                rand.randrange(2 ** 24))
+            for j in xrange(4))
+        sectors.append(code + partitions + "\x55\xaa")
+    return sectors
+
+dns_messages = [(
+    "2624010000010000000000000377777706676f6f676c6503636f6d0000010001"
+    ).decode("hex"), (
+    "2624818000010005000600060377777706676f6f676c6503636f6d0000010001c00c00"
+    "05000100089065000803777777016cc010c02c0001000100000004000440e9b768c02c"
+    "0001000100000004000440e9b793c02c0001000100000004000440e9b763c02c000100"
+    "0100000004000440e9b767c030000200010000a88600040163c030c030000200010000"
+    "a88600040164c030c030000200010000a88600040165c030c030000200010000a88600"
+    "040167c030c030000200010000a88600040161c030c030000200010000a88600040162"
+    "c030c0c00001000100011d0c0004d8ef3509c0d0000100010000ca7c000440e9b309c0"
+    "80000100010000c4c5000440e9a109c0900001000100004391000440e9b709c0a00001"
+    "00010000ca7c000442660b09c0b00001000100000266000440e9a709"
+    ).decode("hex"),
+]
+
+
+#===============================================================================
+# text grammars
+#===============================================================================
+ws = Whitespace(" \t")
+
+assignment = Struct("assignment",
+    ws,
+    Identifier("key"),
+    ws,
+    Literal("="),
+    ws,
+    Select("value",
+        DecNumber("number"),
+        QuotedString("string"),
+    ),
+    ws,
+)
+
+term = Select("term",
+    DecNumber("dec"),
+    Identifier("symbol"),
+    IndexingAdapter(
+        Sequence("expr",
+            Literal("("),
+            ws,
+            LazyBound("expr", lambda: expr),
+            ws,
+            Literal(")"),
+        ),
+        0
+    ),
+)
+
+product = Select("product",
+    Sequence("node", term, ws, CharOf("binop", "*/"), ws,
+        LazyBound("rhs", lambda: product)),
+    term,
+)
+
+expr = Select("expr",
+    Sequence("node", product, ws, CharOf("binop", "+-"), ws,
+        LazyBound("rhs", lambda: expr)),
+    product,
+)
+
+lines = Array(100, Line("lines"))
+
+def assignments(count = 1000, seed = 0):
+    rand = Random(seed)
+    records = []
+    for i in xrange(count):
+        if rand.random() < 0.5:
+            value = str(rand.randrange(10 ** 6))
+        else:
+            value = '"%s"' % ("x" * rand.randrange(40),)
+        records.append("  option_%d = %s" % (i, value))
+    return records
+
+def expressions(count = 200, seed = 0):
+    rand = Random(seed)
+    def gen(depth):
+        if depth == 0 or rand.random() < 0.3:
+            return rand.choice([str(rand.randrange(1000)), "x", "count"])
+        if rand.random() < 0.2:
+            return "(%s)" % (gen(depth - 1),)
+        return "%s %s %s" % (gen(depth - 1), rand.choice("+-*/"),
+            gen(depth - 1))
+    return [gen(5) for i in xrange(count)]
+
+def text_blocks(count = 20, seed = 0):
+    rand = Random(seed)
+    return ["".join("%s\n" % ("w" * rand.randrange(80),)
+        for j in xrange(100)) for i in xrange(count)]
+
+
+#===============================================================================
+# the cases
+#===============================================================================
+def all_cases():
+    from construct.protocols.ipstack import ip_stack
+    from construct.protocols.application.dns import dns
+    from construct.formats.data.cap import cap_file
+    from construct.formats.executable.pe32 import pe32_file
+    from construct.formats.graphics.bmp import bitmap_file
+    from construct.formats.graphics.emf import emf_file
+    from construct.formats.graphics.wmf import wmf_file
+    from construct.formats.filesystem.mbr import mbr
+
+    return [
+        Case("ip_stack", ip_stack, tcp_frames),
+        Case("cap_file", cap_file, sample("cap2.cap")),
+        Case("pe32", pe32_file, sample("NOTEPAD.EXE")),
+        Case("bmp1", bitmap_file, sample("bitmap1.bmp")),
+        Case("bmp4", bitmap_file, sample("bitmap4.bmp")),
+        Case("bmp8", bitmap_file, sample("bitmap8.bmp")),
+        Case("bmp24", bitmap_file, sample("bitmap24.bmp")),
+        Case("emf", emf_file, sample("emf1.emf")),
+        Case("wmf", wmf_file, sample("wmf1.wmf")),
+        Case("mbr", mbr, mbr_sectors),
+        Case("dns", dns, lambda: dns_messages),
+        Case("text_assignment", assignment, assignments),
+        Case("text_expr", expr, expressions),
+        Case("text_lines", lines, text_blocks),
+    ]
+
+imports = [
+    "construct",
+    "construct.protocols.ipstack",
+    "construct.formats.executable.pe32",
+    "construct.protocols.layer3.dhcpv4",
+]
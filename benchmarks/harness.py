@@ -0,0 +1,194 @@
+"""
+The benchmark harness: timing, counts of retained objects and JSON
+reports.
+"""
+import gc
+import sys
+import time
+import platform
+from subprocess import Popen, PIPE
+
+import construct
+from construct.lib import Container, LazyContainer
+
+
+class Case(object):
+    """
+    A benchmark case: a construct and the records it is run over.
+
+    :param str name: the name of the case
+    :param ``Construct`` con: the construct being measured
+    :param callable records: a function returning the list of records
+                             (strings); called lazily, so that defining the
+                             cases costs nothing
+    :param bool build: whether to measure building as well
+    """
+    __slots__ = ["name", "con", "records", "build"]
+    def __init__(self, name, con, records, build = True):
+        self.name = name
+        self.con = con
+        self.records = records
+        self.build = build
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.name)
+
+def _time(func, args, min_time, repeat):
+    """
+    Time a function over a list of arguments, returning the best time per
+    pass. Passes are batched until a batch takes at least ``min_time``.
+    """
+    loops = 1
+    while True:
+        start = time.time()
+        for i in xrange(loops):
+            for arg in args:
+                func(arg)
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for i in xrange(repeat - 1):
+        start = time.time()
+        for j in xrange(loops):
+            for arg in args:
+                func(arg)
+        best = min(best, (time.time() - start) / loops)
+    return best
+
+def _retained_objects(func, args):
+    """
+    The number of gc-tracked objects (containers, lists, instances) that the
+    results of one pass hold on to.
+    """
+    gc.collect()
+    before = len(gc.get_objects())
+    results = [func(arg) for arg in args]
+    gc.collect()
+    after = len(gc.get_objects())
+    # the results list itself and the list returned by get_objects
+    return after - before - 2
+
+def _force(obj):
+    """
+    Read the lazy values (OnDemand, OnDemandPointer) of a parsed object, so
+    that parsing them is measured too.
+    """
+    todo = [obj]
+    while todo:
+        obj = todo.pop()
+        if isinstance(obj, LazyContainer):
+            todo.append(obj.value)
+        elif isinstance(obj, Container):
+            todo.extend(value for name, value in obj.iteritems())
+        elif isinstance(obj, list):
+            todo.extend(obj)
+
+def _throughput(seconds, count, size):
+    return {
+        "seconds" : seconds,
+        "records_per_sec" : count / seconds,
+        "mb_per_sec" : size / seconds / 1e6,
+    }
+
+def measure_case(case, min_time = 0.2, repeat = 3):
+    """
+    Measure parsing (and building, where supported) of a case. Lazy values
+    are read as part of parsing.
+
+    :returns: a dict of results
+    """
+    records = case.records()
+    size = sum(len(r) for r in records)
+    result = {
+        "records" : len(records),
+        "bytes" : size,
+    }
+    def parse(data):
+        obj = case.con.parse(data)
+        _force(obj)
+        return obj
+    seconds = _time(parse, records, min_time, repeat)
+    result["parse"] = _throughput(seconds, len(records), size)
+    result["parse"]["retained_objects_per_record"] = (
+        _retained_objects(parse, records) / float(len(records)))
+    if case.build:
+        objs = [parse(r) for r in records]
+        try:
+            case.con.build(objs[0])
+        except Exception, ex:
+            result["build"] = {"error" : "%s: %s" % (type(ex).__name__, ex)}
+        else:
+            seconds = _time(case.con.build, objs, min_time, repeat)
+            result["build"] = _throughput(seconds, len(objs), size)
+    return result
+
+def measure_import(module, repeat = 5):
+    """
+    Measure the time it takes a fresh interpreter to import a module.
+    """
+    code = ("import time; t = time.time(); import %s; "
+        "print time.time() - t" % (module,))
+    best = None
+    for i in xrange(repeat):
+        p = Popen([sys.executable, "-c", code], stdout = PIPE)
+        output = p.communicate()[0]
+        if p.returncode != 0:
+            raise RuntimeError("failed to import %s" % (module,))
+        seconds = float(output)
+        if best is None or seconds < best:
+            best = seconds
+    return {"seconds" : best}
+
+def environment():
+    return {
+        "construct" : construct.__version__,
+        "python" : platform.python_version(),
+        "implementation" : platform.python_implementation(),
+        "platform" : platform.platform(),
+        "time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def run(cases, imports = (), min_time = 0.2, repeat = 3, log = None):
+    """
+    Run benchmark cases and import timings, returning a JSON-able report.
+
+    :param list cases: the ``Case`` objects to run
+    :param list imports: names of modules whose import time is measured
+    :param callable log: called with a line of progress text per result
+    """
+    report = {
+        "environment" : environment(),
+        "cases" : {},
+        "imports" : {},
+    }
+    for case in cases:
+        result = measure_case(case, min_time, repeat)
+        report["cases"][case.name] = result
+        if log:
+            log("%-24s parse %10.1f rec/s %8.2f MB/s" % (case.name,
+                result["parse"]["records_per_sec"],
+                result["parse"]["mb_per_sec"]))
+    for module in imports:
+        result = measure_import(module, repeat)
+        report["imports"][module] = result
+        if log:
+            log("%-24s import %.4f s" % (module, result["seconds"]))
+    return report
+
+def compare(old, new):
+    """
+    Compare two reports, yielding (name, measurement, old, new, ratio) for
+    every throughput or time present in both; a ratio above 1 means the new
+    report is faster.
+    """
+    for name in sorted(set(old["cases"]) & set(new["cases"])):
+        for op in ("parse", "build"):
+            o = old["cases"][name].get(op, {}).get("records_per_sec")
+            n = new["cases"][name].get(op, {}).get("records_per_sec")
+            if o and n:
+                yield name, op, o, n, n / o
+    for module in sorted(set(old["imports"]) & set(new["imports"])):
+        o = old["imports"][module]["seconds"]
+        n = new["imports"][module]["seconds"]
+        yield module, "import", o, n, o / n
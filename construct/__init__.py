@@ -33,7 +33,7 @@ Hands-on example:
 from construct.core import *
 from construct.adapters import *
 from construct.macros import *
-from debug import Probe, Debugger
+from debug import Probe, Debugger, Profile, Profiler, Trace
 
 
 #===============================================================================
@@ -85,25 +85,28 @@ __all__ = [
     'Anchor', 'Array', 'ArrayError', 'BFloat32', 'BFloat64', 'Bit', 'BitField',
     'BitIntegerAdapter', 'BitIntegerError', 'BitStruct', 'Bits', 'Bitwise',
     'Buffered', 'Byte', 'Bytes', 'CString', 'CStringAdapter', 'Const',
-    'ConstAdapter', 'ConstError', 'Construct', 'ConstructError', 'Container',
+    'Checksum', 'ChecksumError', 'ConstAdapter', 'ConstError', 'Construct',
+    'ConstructError', 'Container', 'Decompressed',
     'Debugger', 'Embed', 'Embedded', 'EmbeddedBitStruct', 'Enum', 'ExprAdapter',
     'Field', 'FieldError', 'Flag', 'FlagsAdapter', 'FlagsContainer',
     'FlagsEnum', 'FormatField', 'GreedyRange', 'GreedyRepeater',
     'HexDumpAdapter', 'If', 'IfThenElse', 'IndexingAdapter', 'LFloat32',
     'LFloat64', 'LazyBound', 'LengthValueAdapter', 'ListContainer',
-    'MappingAdapter', 'MappingError', 'MetaArray', 'MetaBytes', 'MetaField',
-    'MetaRepeater', 'NFloat32', 'NFloat64', 'Nibble', 'NoneOf',
+    'MappingAdapter', 'MappingError', 'Memoize', 'MetaArray', 'MetaBytes',
+    'MetaField', 'MetaRepeater', 'NFloat32', 'NFloat64', 'Nibble', 'NoneOf',
     'NoneOfValidator', 'Octet', 'OnDemand', 'OnDemandPointer', 'OneOf',
     'OneOfValidator', 'OpenRange', 'Optional', 'OptionalGreedyRange',
-    'OptionalGreedyRepeater', 'PaddedStringAdapter', 'Padding',
+    'OptionalGreedyRepeater', 'Packrat', 'PaddedStringAdapter', 'Padding',
     'PaddingAdapter', 'PaddingError', 'PascalString', 'Pass', 'Peek',
-    'Pointer', 'PrefixedArray', 'Probe', 'Range', 'RangeError', 'Reconfig',
-    'Rename', 'RepeatUntil', 'Repeater', 'Restream', 'SBInt16', 'SBInt32',
+    'Pointer', 'PrefixedArray', 'Probe', 'Profile', 'Profiler', 'Range',
+    'RangeError', 'Reconfig', 'Rename', 'RepeatUntil', 'Repeater', 'Restream',
+    'SBInt16', 'SBInt32',
     'SBInt64', 'SBInt8', 'SLInt16', 'SLInt32', 'SLInt64', 'SLInt8', 'SNInt16',
     'SNInt32', 'SNInt64', 'SNInt8', 'Select', 'SelectError', 'Sequence',
     'SizeofError', 'SlicingAdapter', 'StaticField', 'StrictRepeater', 'String',
     'StringAdapter', 'Struct', 'Subconstruct', 'Switch', 'SwitchError',
-    'SymmetricMapping', 'Terminator', 'TerminatorError', 'Tunnel',
+    'SymmetricMapping', 'TerminatedField', 'Terminator', 'TerminatorError',
+    'Trace', 'Tunnel',
     'TunnelAdapter', 'UBInt16', 'UBInt32', 'UBInt64', 'UBInt8', 'ULInt16',
     'ULInt32', 'ULInt64', 'ULInt8', 'UNInt16', 'UNInt32', 'UNInt64', 'UNInt8',
     'Union', 'ValidationError', 'Validator', 'Value', "Magic",
@@ -1,4 +1,4 @@
-from core import Adapter, AdaptationError, Pass
+from core import Adapter, AdaptationError, Pass, _finish_checksums
 from lib import int_to_bin, bin_to_int, swap_bytes, StringIO
 from lib import FlagsContainer, HexString
 
@@ -265,6 +265,7 @@ class TunnelAdapter(Adapter):
     def _encode(self, obj, context):
         stream = StringIO()
         self.inner_subcon._build(obj, stream, context)
+        _finish_checksums(stream)
         return stream.getvalue()
 
 class ExprAdapter(Adapter):
@@ -0,0 +1,118 @@
+"""
+A persistent cache of artifacts derived from schemas.
+
+Anything that is expensive to derive from a construct tree (compiled code,
+lookup tables, indexes) can be stored here once and loaded by every later
+process, much like ``.pyc`` files. Entries are keyed by the structural
+fingerprint of the schema, and live in a directory per library version, so
+changing either the schema or the library invalidates them.
+"""
+import os
+import errno
+import cPickle as pickle
+from tempfile import mkstemp
+
+from schema import fingerprint
+
+
+def default_directory():
+    """
+    The default cache directory: ``$CONSTRUCT_CACHE`` if set, otherwise
+    ``~/.cache/construct``.
+    """
+    directory = os.environ.get("CONSTRUCT_CACHE")
+    if directory:
+        return directory
+    return os.path.join(os.path.expanduser("~"), ".cache", "construct")
+
+class SchemaCache(object):
+    """
+    An on-disk cache of schema artifacts.
+
+    :param str directory: the cache directory; see ``default_directory``
+    :param str version: the library version the entries belong to; defaults
+                        to ``construct.__version__``
+
+    >>> cache = SchemaCache()
+    >>> code = cache.get(pe32_file, "compiled", compile_schema) # doctest: +SKIP
+    """
+    __slots__ = ["directory", "version"]
+    def __init__(self, directory = None, version = None):
+        if directory is None:
+            directory = default_directory()
+        if version is None:
+            from construct import __version__ as version
+        self.directory = directory
+        self.version = version
+    def __repr__(self):
+        return "%s(%r, %r)" % (self.__class__.__name__, self.directory,
+            self.version)
+
+    def path(self, con, kind):
+        """
+        The file an artifact of the given kind for a construct is kept in.
+        """
+        return os.path.join(self.directory, self.version,
+            "%s-%s.pickle" % (kind, fingerprint(con)))
+
+    def load(self, con, kind):
+        """
+        Load a cached artifact. Raises KeyError if there is none (or if the
+        entry cannot be read).
+        """
+        path = self.path(con, kind)
+        try:
+            f = open(path, "rb")
+            try:
+                return pickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, ImportError, AttributeError,
+                pickle.UnpicklingError):
+            raise KeyError(kind, path)
+
+    def store(self, con, kind, value):
+        """
+        Store an artifact. The entry is written to a temporary file and
+        renamed into place, so concurrent readers never see half an entry.
+        """
+        path = self.path(con, kind)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError, ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        fd, tmppath = mkstemp(dir = directory, suffix = ".tmp")
+        try:
+            f = os.fdopen(fd, "wb")
+            try:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            os.rename(tmppath, path)
+        except:
+            os.unlink(tmppath)
+            raise
+
+    def get(self, con, kind, factory):
+        """
+        Load a cached artifact, or derive it by calling ``factory(con)`` and
+        store it for next time.
+        """
+        try:
+            return self.load(con, kind)
+        except KeyError:
+            value = factory(con)
+            self.store(con, kind, value)
+            return value
+
+    def clear(self):
+        """
+        Remove all the entries of this cache's library version.
+        """
+        directory = os.path.join(self.directory, self.version)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            os.unlink(os.path.join(directory, name))
@@ -1,7 +1,11 @@
+import sys
 from struct import Struct as Packer
+from thread import _local as local
 
-from lib import StringIO
-from lib import Container, ListContainer, LazyContainer
+from lib import StringIO, BitStreamReader
+from lib import Container, ListContainer, LazyContainer, Context
+from lib.compression import (DecompressingReader, CompressingWriter,
+    codecs as compression_codecs, resolve_codec)
 
 
 #===============================================================================
@@ -25,6 +29,8 @@ class SelectError(ConstructError):
     __slots__ = []
 class TerminatorError(ConstructError):
     __slots__ = []
+class ChecksumError(ConstructError):
+    __slots__ = []
 
 #===============================================================================
 # abstract constructs
@@ -188,7 +194,7 @@ class Construct(object):
         by this method.
         """
 
-        return self._parse(stream, Container())
+        return self._parse(stream, Context())
 
     def _parse(self, stream, context):
         """
@@ -211,7 +217,18 @@ class Construct(object):
         Build an object directly into a stream.
         """
 
-        self._build(obj, stream, Container())
+        # checksums whose spans are not built yet are patched at the end
+        outer = getattr(_checksums, "pending", None)
+        _checksums.pending = []
+        try:
+            self._build(obj, stream, Context())
+            if _checksums.pending:
+                _patch_checksums(stream, None)
+            if _checksums.pending:
+                raise ChecksumError("checksums left in an inner stream",
+                    [entry[0] for entry in _checksums.pending])
+        finally:
+            _checksums.pending = outer
 
     def _build(self, obj, stream, context):
         """
@@ -235,7 +252,7 @@ class Construct(object):
         """
 
         if context is None:
-            context = Container()
+            context = Context()
         try:
             return self._sizeof(context)
         except Exception, e:
@@ -394,6 +411,124 @@ class MetaField(Construct):
     def _sizeof(self, context):
         return self.lengthfunc(context)
 
+def _scan_position(stream):
+    """
+    The position of a byte stream that can seek, to scan it a chunk at a
+    time, or None. A bit stream tells its position in bytes but reads and
+    seeks in bits, so it is read an element at a time.
+    """
+    if isinstance(stream, BitStreamReader):
+        return None
+    try:
+        return stream.tell()
+    except Exception:
+        return None
+
+class TerminatedField(Construct):
+    """
+    A byte field that stretches up to the first of a set of terminator bytes.
+
+    The stream is scanned a chunk at a time, and positioned right after the
+    field once the terminator is found, so a long field costs a few reads
+    instead of one read per byte. Streams that cannot tell their position,
+    and bit streams, are read a byte at a time.
+
+    :param str name: name of the field
+    :param str terminators: the terminator bytes; the field ends at
+                            whichever comes first in the data, and is built
+                            with the first of them
+    :param bool include_terminator: whether the terminator is consumed and
+                                    kept at the end of the field
+    :param bool consume_terminator: whether the terminator is consumed (but
+                                    not kept); otherwise it is left in the
+                                    stream
+    :param bool allow_eof: whether the end of the stream may end the field
+                           instead of a terminator
+
+    >>> TerminatedField("foo", "\\x00").parse("hello\\x00world")
+    'hello'
+    >>> TerminatedField("foo", "XY", include_terminator = True).parse("helloY")
+    'helloY'
+    """
+
+    __slots__ = ["terminators", "include_terminator", "consume_terminator",
+        "allow_eof"]
+    chunksize = 64
+    max_chunksize = 8192
+    def __init__(self, name, terminators, include_terminator = False,
+                 consume_terminator = False, allow_eof = False):
+        Construct.__init__(self, name)
+        self.terminators = terminators
+        self.include_terminator = include_terminator
+        self.consume_terminator = consume_terminator or include_terminator
+        self.allow_eof = allow_eof
+        self._set_flag(self.FLAG_DYNAMIC)
+    def _find(self, data):
+        index = -1
+        for term in self.terminators:
+            if index < 0:
+                index = data.find(term)
+            else:
+                i = data.find(term, 0, index)
+                if i >= 0:
+                    index = i
+        return index
+    def _parse(self, stream, context):
+        pos = _scan_position(stream)
+        if pos is None:
+            return self._parse_bytes(stream)
+        chunks = []
+        size = self.chunksize
+        while True:
+            chunk = stream.read(size)
+            index = self._find(chunk)
+            if index >= 0:
+                break
+            chunks.append(chunk)
+            pos += len(chunk)
+            if len(chunk) < size:
+                if not self.allow_eof:
+                    raise ArrayError("missing terminator")
+                return "".join(chunks)
+            size = min(size * 2, self.max_chunksize)
+        if self.include_terminator:
+            chunks.append(chunk[:index + 1])
+        else:
+            chunks.append(chunk[:index])
+        if self.consume_terminator:
+            index += 1
+        stream.seek(pos + index)
+        return "".join(chunks)
+    def _parse_bytes(self, stream):
+        data = []
+        while True:
+            char = stream.read(1)
+            if not char:
+                if not self.allow_eof:
+                    raise ArrayError("missing terminator")
+                return "".join(data)
+            if char in self.terminators:
+                break
+            data.append(char)
+        if self.include_terminator:
+            data.append(char)
+        elif not self.consume_terminator:
+            raise FieldError("cannot leave the terminator in a stream "
+                "that cannot seek")
+        return "".join(data)
+    def _build(self, obj, stream, context):
+        index = self._find(obj)
+        if self.include_terminator:
+            if index < 0:
+                raise ArrayError("missing terminator")
+            stream.write(obj[:index + 1])
+        else:
+            if index >= 0:
+                obj = obj[:index]
+            stream.write(obj)
+            if self.consume_terminator:
+                stream.write(self.terminators[0])
+
 
 #===============================================================================
 # arrays and repeaters
@@ -562,6 +697,10 @@ class RepeatUntil(Subconstruct):
         self._clear_flag(self.FLAG_COPY_CONTEXT)
         self._set_flag(self.FLAG_DYNAMIC)
     def _parse(self, stream, context):
+        if type(self.subcon) is StaticField and self.subcon.length == 1:
+            pos = _scan_position(stream)
+            if pos is not None:
+                return self._parse_bytes(stream, context, pos)
         obj = []
         try:
             if self.subcon.conflags & self.FLAG_COPY_CONTEXT:
@@ -579,6 +718,26 @@ class RepeatUntil(Subconstruct):
         except ConstructError, ex:
             raise ArrayError("missing terminator", ex)
         return obj
+    def _parse_bytes(self, stream, context, pos):
+        # the elements are single bytes: read them a chunk at a time, and
+        # give back what follows the terminator
+        predicate = self.predicate
+        obj = []
+        size = TerminatedField.chunksize
+        while True:
+            chunk = stream.read(size)
+            for char in chunk:
+                obj.append(char)
+                try:
+                    stop = predicate(char, context)
+                except ConstructError, ex:
+                    raise ArrayError("missing terminator", ex)
+                if stop:
+                    stream.seek(pos + len(obj))
+                    return obj
+            if len(chunk) < size:
+                raise ArrayError("missing terminator")
+            size = min(size * 2, TerminatedField.max_chunksize)
     def _build(self, obj, stream, context):
         terminated = False
         if self.subcon.conflags & self.FLAG_COPY_CONTEXT:
@@ -589,7 +748,7 @@ class RepeatUntil(Subconstruct):
                     break
         else:
             for subobj in obj:
-                self.subcon._build(subobj, stream, context.__copy__())
+                self.subcon._build(subobj, stream, context)
                 if self.predicate(subobj, context):
                     terminated = True
                     break
@@ -639,7 +798,7 @@ class Struct(Construct):
         else:
             obj = Container()
             if self.nested:
-                context = Container(_ = context)
+                context = Context(_ = context)
         for sc in self.subcons:
             if sc.conflags & self.FLAG_EMBED:
                 context["<obj>"] = obj
@@ -654,7 +813,7 @@ class Struct(Construct):
         if "<unnested>" in context:
             del context["<unnested>"]
         elif self.nested:
-            context = Container(_ = context)
+            context = Context(_ = context)
         for sc in self.subcons:
             if sc.conflags & self.FLAG_EMBED:
                 context["<unnested>"] = True
@@ -667,7 +826,7 @@ class Struct(Construct):
             sc._build(subobj, stream, context)
     def _sizeof(self, context):
         if self.nested:
-            context = Container(_ = context)
+            context = Context(_ = context)
         return sum(sc._sizeof(context) for sc in self.subcons)
 
 class Sequence(Struct):
@@ -699,7 +858,7 @@ class Sequence(Struct):
         else:
             obj = ListContainer()
             if self.nested:
-                context = Container(_ = context)
+                context = Context(_ = context)
         for sc in self.subcons:
             if sc.conflags & self.FLAG_EMBED:
                 context["<obj>"] = obj
@@ -714,7 +873,7 @@ class Sequence(Struct):
         if "<unnested>" in context:
             del context["<unnested>"]
         elif self.nested:
-            context = Container(_ = context)
+            context = Context(_ = context)
         objiter = iter(obj)
         for sc in self.subcons:
             if sc.conflags & self.FLAG_EMBED:
@@ -896,14 +1055,20 @@ class Select(Construct):
                     sc._build(obj, stream, context)
                     return
         else:
+            pending = getattr(_checksums, "pending", None)
             for sc in self.subcons:
                 stream2 = StringIO()
                 context2 = context.__copy__()
+                if pending is not None:
+                    saved = pending[:]
                 try:
                     sc._build(obj, stream2, context2)
                 except Exception:
-                    pass
+                    # drop the checksums of the abandoned alternative
+                    if pending is not None:
+                        pending[:] = saved
                 else:
+                    _finish_checksums(stream2)
                     context.__update__(context2)
                     stream.write(stream2.getvalue())
                     return
@@ -911,6 +1076,71 @@ class Select(Construct):
     def _sizeof(self, context):
         raise SizeofError("can't calculate size")
 
+_packrat = local()
+
+class Packrat(Subconstruct):
+    """
+    Packrat parsing: while the subcon is being parsed, every Memoize within
+    it remembers its result (or its failure) at each stream position, so
+    backtracking through Select never parses the same rule at the same
+    position twice. This keeps backtracking grammars linear in the size of
+    the input. The memo table lives for one parse only.
+
+    Notes:
+    * requires a seekable stream.
+    * has no effect on building.
+
+    Parameters:
+    * subcon - the grammar to parse
+
+    Example:
+    expr = Memoize(Select("expr", ...))
+    program = Packrat(GreedyRange(expr))
+    """
+    __slots__ = []
+    def _parse(self, stream, context):
+        outer = getattr(_packrat, "table", None)
+        _packrat.table = {}
+        try:
+            return self.subcon._parse(stream, context)
+        finally:
+            _packrat.table = outer
+
+class Memoize(Subconstruct):
+    """
+    A rule whose parse results are remembered by the enclosing Packrat,
+    keyed by stream position; outside of a Packrat it does nothing. The
+    remembered object is returned as is (not copied) and the context is not
+    updated, so the subcon should neither depend on the context nor modify
+    it, and the object should not be modified once parsed.
+
+    Parameters:
+    * subcon - the rule to memoize
+
+    Example:
+    term = Memoize(Select("term", number, call, symbol))
+    """
+    __slots__ = []
+    def _parse(self, stream, context):
+        table = getattr(_packrat, "table", None)
+        if table is None:
+            return self.subcon._parse(stream, context)
+        key = (id(self), stream, stream.tell())
+        try:
+            obj, pos, ex = table[key]
+        except KeyError:
+            try:
+                obj = self.subcon._parse(stream, context)
+            except ConstructError, ex:
+                table[key] = (None, None, ex)
+                raise
+            table[key] = (obj, stream.tell(), None)
+            return obj
+        if ex is not None:
+            raise ex
+        stream.seek(pos)
+        return obj
+
 
 #===============================================================================
 # stream manipulation
@@ -1073,6 +1303,7 @@ class Buffered(Subconstruct):
         size = self._sizeof(context)
         stream2 = StringIO()
         self.subcon._build(obj, stream2, context)
+        _finish_checksums(stream2)
         data = self.encoder(stream2.getvalue())
         assert len(data) == size
         _write_stream(stream, self._sizeof(context), data)
@@ -1123,10 +1354,262 @@ class Restream(Subconstruct):
     def _build(self, obj, stream, context):
         stream2 = self.stream_writer(stream)
         self.subcon._build(obj, stream2, context)
+        _finish_checksums(stream2, False)
         stream2.close()
     def _sizeof(self, context):
         return self.resizer(self.subcon._sizeof(context))
 
+class Decompressed(Subconstruct):
+    """
+    Compressed data, parsed and built by the subcon as it is decompressed
+    or compressed: the compressed data is never held in memory as a whole,
+    unlike a TunnelAdapter over an encoded string, so streams of any size
+    are parsed and built in constant memory.
+
+    Notes:
+    * the subcon can seek back only within the last 64KB it read, and can
+      not seek while building (so no pointers inside).
+    * without a length, the data read past the end of the compressed data
+      is seeked back over, which requires a seekable stream.
+    * when building with a length, the compressed data must come out that
+      long (it can not be known before it is built).
+
+    Parameters:
+    * subcon - the construct of the decompressed data
+    * codec - "zlib", "gzip", "deflate" (raw) or "bz2"
+    * length - the number of bytes of compressed data, as a number or a
+      function that takes the context. default is None, meaning the end
+      is marked by the codec.
+    * level - the compression level. default is that of the codec.
+
+    Example:
+    Struct("foo",
+        UBInt32("length"),
+        Decompressed(GreedyRange(UBInt16("elements")), "zlib",
+            lambda ctx: ctx.length),
+    )
+    """
+    __slots__ = ["codec", "lengthfunc", "level"]
+    def __init__(self, subcon, codec = "zlib", length = None, level = None):
+        Subconstruct.__init__(self, subcon)
+        if codec not in compression_codecs:
+            raise ValueError("unknown codec", codec)
+        self.codec = codec
+        self.lengthfunc = length
+        self.level = level
+        self._set_flag(self.FLAG_DYNAMIC)
+    def _length(self, context):
+        if callable(self.lengthfunc):
+            return self.lengthfunc(context)
+        return self.lengthfunc
+    def _parse(self, stream, context):
+        length = self._length(context)
+        error = resolve_codec(self.codec)[2]
+        stream2 = DecompressingReader(stream, self.codec, length)
+        try:
+            obj = self.subcon._parse(stream2, context)
+            stream2.close()
+        except (error, IOError, EOFError), ex:
+            raise FieldError("bad %s data: %s" % (self.codec, ex))
+        return obj
+    def _build(self, obj, stream, context):
+        stream2 = CompressingWriter(stream, self.codec, self.level)
+        try:
+            self.subcon._build(obj, stream2, context)
+        except IOError, ex:
+            raise FieldError(str(ex))
+        _finish_checksums(stream2, False)
+        stream2.close()
+        length = self._length(context)
+        if length is not None and stream2.size != length:
+            raise FieldError("compressed to %d bytes, expected %d" %
+                (stream2.size, length))
+    def _sizeof(self, context):
+        raise SizeofError("can't calculate the size of compressed data")
+
+def internet_checksum(data):
+    """
+    The Internet checksum (RFC 1071): the one's complement of the one's
+    complement sum of the data, as 16-bit big endian words.
+    """
+    from array import array
+    if len(data) % 2:
+        data += "\x00"
+    # the sum is independent of byte order, up to a swap of its bytes
+    total = sum(array("H", data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    if sys.byteorder == "little":
+        total = ((total & 0xff) << 8) | (total >> 8)
+    return ~total & 0xffff
+
+checksum_algorithms = {
+    "internet" : internet_checksum,
+}
+
+def _checksum_function(algorithm):
+    # the modules of the algorithms are imported once they are asked for
+    if callable(algorithm):
+        return algorithm
+    if algorithm in checksum_algorithms:
+        return checksum_algorithms[algorithm]
+    if algorithm in ("crc32", "adler32"):
+        import zlib
+        func = getattr(zlib, algorithm)
+        checksum_algorithms[algorithm] = lambda data: func(data) & 0xffffffff
+        return checksum_algorithms[algorithm]
+    import hashlib
+    # raises ValueError for unknown algorithms
+    hashlib.new(algorithm)
+    return lambda data: hashlib.new(algorithm, data).digest()
+
+# the checksums of the build in progress whose spans were not built yet:
+# tuples of (checksum, stream, position, start, end, context)
+_checksums = local()
+
+def _patch_checksums(stream, limit):
+    """
+    Patch the pending checksums of the stream whose spans end before limit
+    (all of them if limit is None). A checksum is patched only once the
+    checksums within its span are.
+    """
+    pending = _checksums.pending
+    while True:
+        for entry in pending:
+            checksum, stream2, pos, start, end, context = entry
+            if stream2 is not stream or (limit is not None and end > limit):
+                continue
+            if any(other is not entry and other[1] is stream and
+                    start <= other[2] < end for other in pending):
+                continue
+            pending.remove(entry)
+            checksum._patch(stream, pos, start, end, context)
+            break
+        else:
+            break
+    if limit is None and any(entry[1] is stream for entry in pending):
+        raise ChecksumError("checksums cover each other")
+
+def _finish_checksums(stream, seekable = True):
+    """
+    Patch the pending checksums of an inner stream (of Buffered, Restream
+    and the like) whose build is done; the rest of the build goes to
+    another stream, so they can not be patched later. If the stream is not
+    seekable, they can not be patched at all, and ChecksumError is raised.
+    """
+    pending = getattr(_checksums, "pending", None)
+    if not pending or not any(entry[1] is stream for entry in pending):
+        return
+    if not seekable:
+        raise ChecksumError("checksum in a stream that can not be patched",
+            [entry[0] for entry in pending if entry[1] is stream])
+    _patch_checksums(stream, None)
+
+class Checksum(Subconstruct):
+    """
+    A checksum (or digest) field, computed over the raw bytes of a span of
+    the stream, as they were read or written; the span is not built again.
+    If the field lies within its span, it is taken as zeros (as in the
+    Internet checksum of IPv4). When parsing, the checksum is verified
+    (optionally); when building, it is computed and the given value is
+    ignored. The checksum of a span that is not built yet is written once
+    the build is done (or once a later checksum is built), by seeking back.
+
+    Notes:
+    * requires a seekable stream, which must also be readable for building.
+    * the span and the field must be in the same stream: not within
+      Buffered, TunnelAdapter or Select, unless the span is too. Checksums can
+      not be built within Restream (nor Bitwise of large subcons).
+
+    Parameters:
+    * subcon - the checksum field (e.g. UBInt32 for crc32, Bytes for
+      digests)
+    * algorithm - "crc32", "adler32", "internet" (the 16-bit one's
+      complement sum), the name of a hashlib digest, or a function taking
+      the bytes of the span and returning the checksum
+    * span - a function that takes the context and returns the start and
+      end of the span, relative to the position of the field
+    * verify - whether to verify the checksum when parsing; a mismatch
+      raises ChecksumError
+
+    Example:
+    Struct("chunk",
+        UBInt32("length"),
+        String("type", 4),
+        Field("data", lambda ctx: ctx.length),
+        Checksum(UBInt32("crc"), "crc32", lambda ctx: (-4 - ctx.length, 0)),
+    )
+    """
+    __slots__ = ["algorithm", "func", "span", "verify", "placeholder"]
+    def __init__(self, subcon, algorithm, span, verify = True):
+        Subconstruct.__init__(self, subcon)
+        self.algorithm = algorithm
+        self.func = _checksum_function(algorithm)
+        self.span = span
+        self.verify = verify
+        empty = self.func("")
+        if isinstance(empty, str):
+            self.placeholder = "\x00" * len(empty)
+        else:
+            self.placeholder = 0
+        self._set_flag(self.FLAG_DYNAMIC)
+    def __getstate__(self):
+        attrs = Subconstruct.__getstate__(self)
+        del attrs["func"]
+        return attrs
+    def __setstate__(self, attrs):
+        Subconstruct.__setstate__(self, attrs)
+        self.func = _checksum_function(self.algorithm)
+    def _compute(self, stream, pos, size, start, end):
+        stream.seek(start)
+        data = stream.read(end - start)
+        if len(data) != end - start:
+            raise ChecksumError("span beyond the end of the stream",
+                start, end)
+        if start <= pos < end:
+            data = (data[:pos - start] + "\x00" * size +
+                data[pos - start + size:])
+        return self.func(data)
+    def _parse(self, stream, context):
+        pos = stream.tell()
+        obj = self.subcon._parse(stream, context)
+        if self.verify:
+            after = stream.tell()
+            start, end = self.span(context)
+            expected = self._compute(stream, pos, after - pos, pos + start,
+                pos + end)
+            stream.seek(after)
+            if obj != expected:
+                raise ChecksumError("checksum mismatch", obj, expected)
+        return obj
+    def _build(self, obj, stream, context):
+        pos = stream.tell()
+        start, end = self.span(context)
+        pending = getattr(_checksums, "pending", None)
+        if pending is None:
+            # built outside of build_stream, so nothing can be patched
+            if end > 0:
+                raise ChecksumError("span not built yet")
+            value = self._compute(stream, pos, 0, pos + start, pos + end)
+            stream.seek(pos)
+            self.subcon._build(value, stream, context)
+            return
+        if pending:
+            _patch_checksums(stream, pos)
+        self.subcon._build(self.placeholder, stream, context)
+        pending.append((self, stream, pos, pos + start, pos + end, context))
+    def _patch(self, stream, pos, start, end, context):
+        after = stream.tell()
+        stream.seek(pos)
+        self.subcon._build(self.placeholder, stream, context)
+        size = stream.tell() - pos
+        value = self._compute(stream, pos, size, start, end)
+        stream.seek(pos)
+        self.subcon._build(value, stream, context)
+        stream.seek(after)
+    def _sizeof(self, context):
+        return self.subcon._sizeof(context)
+
 
 #===============================================================================
 # miscellaneous
@@ -2,17 +2,17 @@
 Debugging utilities for constructs
 """
 import sys
-import traceback
-import pdb
-import inspect
-from core import Construct, Subconstruct
-from lib import HexString, Container, ListContainer
+from time import time
+from thread import get_ident
+from core import Construct, Subconstruct, LazyBound
+from lib import HexString, Container, ListContainer, LazyContainer
 
 
 class Probe(Construct):
     """
     A probe: dumps the context, stack frames, and stream content to the screen
-    to aid the debugging process.
+    to aid the debugging process. Probes are slow; to leave instrumentation
+    in a schema, use Trace.
     See also Debugger.
     
     Parameters:
@@ -75,6 +75,8 @@ class Probe(Construct):
             obj.context = context
         
         if self.show_stack:
+            # imported here, as inspect is slow to import and rarely needed
+            import inspect
             obj.stack = ListContainer()
             frames = [s[0] for s in inspect.stack()][1:-1]
             frames.reverse()
@@ -123,6 +125,8 @@ class Debugger(Subconstruct):
         except Exception:
             self.handle_exc()
     def handle_exc(self, msg = None):
+        import traceback
+        import pdb
         print "=" * 80
         print "Debugging exception of %s:" % (self.subcon,)
         print "".join(traceback.format_exception(*sys.exc_info())[1:])
@@ -132,29 +136,463 @@ class Debugger(Subconstruct):
         print "=" * 80
 
 
+#===============================================================================
+# tracing
+#===============================================================================
+class HookRegistry(object):
+    """
+    The registry of tracing hooks, called by Trace constructs. The events
+    and the arguments their callbacks receive are:
+    * on_parse_enter - (construct, offset)
+    * on_parse_exit - (construct, offset, obj); offset is where parsing
+      ended, obj is the parsed object
+    * on_build_enter - (construct, offset, obj)
+    * on_error - (construct, offset, exception); offset is where parsing or
+      building started. the exception is re-raised after the callbacks.
+
+    Example:
+    def show(con, offset, obj):
+        print con.name, offset, obj
+    hooks.register("on_parse_exit", show)
+    """
+    events = ("on_parse_enter", "on_parse_exit", "on_build_enter", "on_error")
+
+    def __init__(self):
+        self.enabled = False
+        for event in self.events:
+            setattr(self, event, ())
+    def register(self, event, callback):
+        """
+        Register a callback for an event; returns the callback, so this
+        can be used as a decorator factory.
+        """
+        if event not in self.events:
+            raise ValueError("unknown event", event)
+        setattr(self, event, getattr(self, event) + (callback,))
+        self.enabled = True
+        return callback
+    def unregister(self, event, callback):
+        """
+        Unregister a callback of an event.
+        """
+        callbacks = list(getattr(self, event))
+        callbacks.remove(callback)
+        setattr(self, event, tuple(callbacks))
+        self.enabled = any(getattr(self, e) for e in self.events)
+    def clear(self):
+        """
+        Unregister all callbacks.
+        """
+        self.__init__()
+
+hooks = HookRegistry()
+
+class Trace(Subconstruct):
+    """
+    Calls the registered tracing hooks (see HookRegistry) when its subcon is
+    parsed or built. When no hooks are registered, a trace costs a single
+    attribute check, so traces can be left in production schemas.
+
+    Parameters:
+    * subcon - the subcon to trace
+
+    Example:
+    Struct("packet",
+        Trace(UBInt16("length")),
+        Trace(Field("data", lambda ctx: ctx.length)),
+    )
+    """
+    __slots__ = []
+    def _parse(self, stream, context):
+        if not hooks.enabled:
+            return self.subcon._parse(stream, context)
+        offset = stream.tell()
+        for callback in hooks.on_parse_enter:
+            callback(self.subcon, offset)
+        try:
+            obj = self.subcon._parse(stream, context)
+        except Exception, ex:
+            for callback in hooks.on_error:
+                callback(self.subcon, offset, ex)
+            raise
+        if hooks.on_parse_exit:
+            offset = stream.tell()
+            for callback in hooks.on_parse_exit:
+                callback(self.subcon, offset, obj)
+        return obj
+    def _build(self, obj, stream, context):
+        if not hooks.enabled:
+            return self.subcon._build(obj, stream, context)
+        offset = stream.tell()
+        for callback in hooks.on_build_enter:
+            callback(self.subcon, offset, obj)
+        try:
+            self.subcon._build(obj, stream, context)
+        except Exception, ex:
+            for callback in hooks.on_error:
+                callback(self.subcon, offset, ex)
+            raise
+
+
+#===============================================================================
+# profiling
+#===============================================================================
+def _construct_classes():
+    classes = []
+    todo = [Construct]
+    while todo:
+        cls = todo.pop()
+        classes.append(cls)
+        todo.extend(cls.__subclasses__())
+    return classes
+
+def _instrumented(func):
+    def _parse(self, stream, context):
+        profiler = Profiler.active
+        if profiler is None or profiler.thread != get_ident():
+            return func(self, stream, context)
+        frame = profiler.enter(self, stream)
+        try:
+            obj = func(self, stream, context)
+        except:
+            profiler.exit(frame, stream, None)
+            raise
+        profiler.exit(frame, stream, obj)
+        return obj
+    _parse.__name__ = func.__name__
+    _parse.__doc__ = func.__doc__
+    _parse.original = func
+    return _parse
+
+# the original _parse methods of the instrumented classes
+_originals = {}
+
+def _profiled_classes(root):
+    """the construct classes whose _parse methods parsing root can call
+    (all of them if root is None)"""
+    if root is None:
+        return _construct_classes()
+    # construct imports this module, but needs schema only for profiling
+    from schema import walk
+    classes = set()
+    for con in walk(root):
+        for cls in type(con).__mro__:
+            if "_parse" in cls.__dict__ and issubclass(cls, Construct):
+                classes.add(cls)
+    return classes
 
+def _instrument(classes):
+    for cls in classes:
+        if cls not in _originals:
+            func = cls.__dict__.get("_parse")
+            if func is not None:
+                _originals[cls] = func
+                cls._parse = _instrumented(func)
 
+def _uninstrument():
+    for cls, func in _originals.iteritems():
+        cls._parse = func
+    _originals.clear()
 
+class ProfileEntry(object):
+    """
+    The statistics of one schema path: the number of calls, the inclusive
+    and exclusive time, and the number of bytes consumed.
+    """
+    __slots__ = ["calls", "inclusive", "exclusive", "bytes"]
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.bytes = 0
+    def __repr__(self):
+        return "%s(calls = %d, inclusive = %f, exclusive = %f, bytes = %d)" % (
+            self.__class__.__name__, self.calls, self.inclusive,
+            self.exclusive, self.bytes)
 
+class Profiler(object):
+    """
+    A parsing profiler. While a profiler is active (in a ``with`` block),
+    every construct parsed by the thread that activated it is measured, and
+    the results are keyed by schema path: the dotted names of the nested
+    constructs, e.g. ``ip_stack.next.layer3_ipv4.header.tos``.
 
+    Unnamed constructs (padding, embedded structs) and the constructs
+    wrapped by adapters and other subconstructs do not start path
+    components of their own; they are accounted to the enclosing path.
+    Within ``Bitwise`` constructs, the bytes consumed are counted in bits.
 
+    While profiling, the ``_parse`` methods of the construct classes are
+    replaced by measuring wrappers, and restored when the profiler exits;
+    only one profiler can be active at a time. Given the root of the
+    profiled tree, only the classes within it are instrumented (constructs
+    made while parsing are then not measured); otherwise all of them are.
 
+    :param ``Construct`` root: the construct that will be parsed, or None
 
+    Example:
+    profiler = Profiler(ip_stack)
+    with profiler:
+        ip_stack.parse(data)
+    print profiler.report()
+    """
+    active = None
 
+    def __init__(self, root = None):
+        self.root = root
+        self.classes = None
+        self.stats = {}
+        self.thread = None
+        self.nesting = 0
+        self._nodes = []
+        self._frames = []
 
+    def __enter__(self):
+        if Profiler.active is not None and Profiler.active is not self:
+            raise ValueError("another profiler is active")
+        if self.nesting == 0:
+            self.thread = get_ident()
+            Profiler.active = self
+            if self.classes is None or self.root is None:
+                self.classes = _profiled_classes(self.root)
+            _instrument(self.classes)
+        self.nesting += 1
+        return self
+    def __exit__(self, t, v, tb):
+        self.nesting -= 1
+        if self.nesting == 0:
+            Profiler.active = None
+            _uninstrument()
 
+    def _path(self, node):
+        """
+        The schema path of a construct being entered, or None if it belongs
+        to the path of its parent.
+        """
+        if not self._nodes:
+            return node.name or node.__class__.__name__
+        parent = self._nodes[-1]
+        if (node.name is None or
+                isinstance(parent, Subconstruct) and parent.subcon is node or
+                isinstance(parent, LazyBound) and parent.bound is node):
+            return None
+        return "%s.%s" % (self._frames[-1][0], node.name)
 
+    def enter(self, node, stream):
+        path = self._path(node)
+        self._nodes.append(node)
+        if path is None:
+            return None
+        try:
+            pos = stream.tell()
+        except Exception:
+            pos = None
+        # path, start time, time spent in children, start position
+        frame = [path, time(), 0.0, pos]
+        self._frames.append(frame)
+        return frame
 
+    def exit(self, frame, stream, obj):
+        self._nodes.pop()
+        if frame is None:
+            return
+        elapsed = time() - frame[1]
+        self._frames.pop()
+        if self._frames:
+            self._frames[-1][2] += elapsed
+        entry = self.stats.get(frame[0])
+        if entry is None:
+            entry = self.stats[frame[0]] = ProfileEntry()
+        entry.calls += 1
+        entry.inclusive += elapsed
+        entry.exclusive += elapsed - frame[2]
+        if frame[3] is not None:
+            try:
+                entry.bytes += stream.tell() - frame[3]
+            except Exception:
+                pass
 
+    def report(self, sort = "inclusive", limit = None):
+        """
+        A text table of the statistics, one line per schema path.
 
+        :param str sort: the column to sort by (descending): "calls",
+                         "inclusive", "exclusive", "bytes" or "path"
+        :param int limit: the maximal number of lines
+        """
+        if sort == "path":
+            items = sorted(self.stats.items())
+        else:
+            items = sorted(self.stats.items(),
+                key = lambda item: getattr(item[1], sort), reverse = True)
+        if limit is not None:
+            items = items[:limit]
+        lines = ["%10s %12s %12s %12s  %s" % ("calls", "inclusive",
+            "exclusive", "bytes", "path")]
+        for path, entry in items:
+            lines.append("%10d %12.6f %12.6f %12d  %s" % (entry.calls,
+                entry.inclusive, entry.exclusive, entry.bytes, path))
+        return "\n".join(lines)
 
+    def folded(self):
+        """
+        The statistics as folded stacks (one "a;b;c microseconds" line per
+        schema path, weighted by exclusive time), as accepted by flame graph
+        tools.
+        """
+        lines = []
+        for path, entry in sorted(self.stats.items()):
+            lines.append("%s %d" % (path.replace(".", ";"),
+                round(entry.exclusive * 1e6)))
+        return "\n".join(lines)
 
+class AllocationEntry(object):
+    """
+    The allocations of one schema path: the number of calls, the number of
+    bytes retained by the objects it returned, and the number of result
+    objects created, by class.
+    """
+    __slots__ = ["calls", "bytes", "objects"]
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.objects = {}
+    def __repr__(self):
+        return "%s(calls = %d, bytes = %d, objects = %r)" % (
+            self.__class__.__name__, self.calls, self.bytes, self.objects)
 
+def _getsizeof(obj):
+    """stands in for sys.getsizeof, which Python 2.5 lacks"""
+    return 0
 
+_getsizeof = getattr(sys, "getsizeof", _getsizeof)
 
+class AllocationProfiler(Profiler):
+    """
+    A profiler that accounts for the memory of parse results rather than
+    time. For every schema path, it counts the Container, ListContainer,
+    LazyContainer and HexString objects the path returned, and the bytes
+    (as given by sys.getsizeof) of everything the path's results hold that
+    no nested path already accounted for. Objects that are created and then
+    dropped (e.g. by a Select alternative that fails) are not counted.
+    Before Python 2.6, which added sys.getsizeof, only objects are counted.
 
+    The results are kept alive while the profiler is active, so that the
+    accounting does not mistake new objects for dead ones.
 
+    Example:
+    profiler = AllocationProfiler()
+    with profiler:
+        cap_file.parse_stream(f)
+    print profiler.report()
+    """
+    counted = (Container, ListContainer, LazyContainer, HexString)
 
+    def __init__(self, root = None):
+        Profiler.__init__(self, root)
+        self._seen = {}
 
+    def __exit__(self, t, v, tb):
+        Profiler.__exit__(self, t, v, tb)
+        if self.nesting == 0:
+            self._seen.clear()
 
+    def exit(self, frame, stream, obj):
+        self._nodes.pop()
+        if frame is None:
+            return
+        self._frames.pop()
+        entry = self.stats.get(frame[0])
+        if entry is None:
+            entry = self.stats[frame[0]] = AllocationEntry()
+        entry.calls += 1
+        self._account(entry, obj)
 
+    def _account(self, entry, obj):
+        seen = self._seen
+        todo = [obj]
+        while todo:
+            obj = todo.pop()
+            if id(obj) in seen:
+                continue
+            seen[id(obj)] = obj
+            entry.bytes += _getsizeof(obj)
+            for cls in self.counted:
+                if isinstance(obj, cls):
+                    name = cls.__name__
+                    entry.objects[name] = entry.objects.get(name, 0) + 1
+                    break
+            if isinstance(obj, Container):
+                seen[id(obj.__dict__)] = obj.__dict__
+                entry.bytes += _getsizeof(obj.__dict__)
+                todo.extend(obj.__dict__.itervalues())
+            elif isinstance(obj, (list, tuple)):
+                todo.extend(obj)
+            elif isinstance(obj, LazyContainer):
+                # the stream and context are not owned by the result
+                if obj.has_value:
+                    todo.append(obj.value)
+
+    def report(self, sort = "bytes", limit = None):
+        """
+        A text table of the allocations, one line per schema path.
+
+        :param str sort: the column to sort by (descending): "calls",
+                         "bytes", "path", or the name of a counted class
+        :param int limit: the maximal number of lines
+        """
+        names = [cls.__name__ for cls in self.counted]
+        if sort == "path":
+            items = sorted(self.stats.items())
+        elif sort in names:
+            items = sorted(self.stats.items(),
+                key = lambda item: item[1].objects.get(sort, 0),
+                reverse = True)
+        else:
+            items = sorted(self.stats.items(),
+                key = lambda item: getattr(item[1], sort), reverse = True)
+        if limit is not None:
+            items = items[:limit]
+        lines = ["%10s %12s %s  %s" % ("calls", "bytes",
+            " ".join("%13s" % (name,) for name in names), "path")]
+        for path, entry in items:
+            lines.append("%10d %12d %s  %s" % (entry.calls, entry.bytes,
+                " ".join("%13d" % (entry.objects.get(name, 0),)
+                    for name in names), path))
+        return "\n".join(lines)
+
+    def folded(self):
+        """
+        The allocations as folded stacks, weighted by bytes retained.
+        """
+        lines = []
+        for path, entry in sorted(self.stats.items()):
+            lines.append("%s %d" % (path.replace(".", ";"), entry.bytes))
+        return "\n".join(lines)
+
+class Profile(Subconstruct):
+    """
+    Profiles the parsing of a subcon; the statistics accumulate in the
+    ``profiler`` attribute. See Profiler.
+
+    Parameters:
+    * subcon - the subcon to profile
+    * profiler - the Profiler to use. default is a new one.
+
+    Example:
+    p = Profile(ip_stack)
+    p.parse(data)
+    print p.profiler.report()
+    """
+    __slots__ = ["profiler"]
+    def __init__(self, subcon, profiler = None):
+        Subconstruct.__init__(self, subcon)
+        if profiler is None:
+            profiler = Profiler(subcon)
+        self.profiler = profiler
+    def _parse(self, stream, context):
+        self.profiler.__enter__()
+        try:
+            return self.subcon._parse(stream, context)
+        finally:
+            self.profiler.__exit__(None, None, None)
@@ -0,0 +1,12 @@
+"""
+all sorts of file formats
+"""
+from construct.lib.lazymodule import LazyModule
+
+
+LazyModule.install(__name__, {
+    "data"       : "data",
+    "executable" : "executable",
+    "filesystem" : "filesystem",
+    "graphics"   : "graphics",
+})
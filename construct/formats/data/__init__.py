@@ -1,3 +1,16 @@
 """
 all sorts of raw data serialization (tcpdump capture files, etc.)
 """
+from construct.lib.lazymodule import LazyModule
+
+
+LazyModule.install(__name__, {
+    "cap"         : "cap",
+    "snoop"       : "snoop",
+    "cap_file"    : ("cap", "cap_file"),
+    "CapReader"   : ("cap", "CapReader"),
+    "CapWriter"   : ("cap", "CapWriter"),
+    "snoop_file"  : ("snoop", "snoop_file"),
+    "SnoopReader" : ("snoop", "SnoopReader"),
+    "SnoopWriter" : ("snoop", "SnoopWriter"),
+})
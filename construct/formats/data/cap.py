@@ -2,7 +2,11 @@
 tcpdump capture file
 """
 from construct import *
+import os
 import time
+import mmap
+import struct
+from bisect import bisect_left
 from datetime import datetime
 
 
@@ -10,46 +14,405 @@ class MicrosecAdapter(Adapter):
     def _decode(self, obj, context):
         return datetime.fromtimestamp(obj[0] + (obj[1] / 1000000.0))
     def _encode(self, obj, context):
-        offset = time.mktime(*obj.timetuple())
-        sec = int(offset)
-        usec = (offset - sec) * 1000000
-        return (sec, usec)
-
-packet = Struct("packet",
-    MicrosecAdapter(
-        Sequence("time", 
-            ULInt32("time"),
-            ULInt32("usec"),
+        return (int(time.mktime(obj.timetuple())), obj.microsecond)
+
+class NanosecAdapter(Adapter):
+    def _decode(self, obj, context):
+        return datetime.fromtimestamp(obj[0] + (obj[1] / 1000000000.0))
+    def _encode(self, obj, context):
+        return (int(time.mktime(obj.timetuple())), obj.microsecond * 1000)
+
+# the magic of a capture file gives its byte order and the resolution of its
+# timestamps
+byte_orders = {
+    "\xd4\xc3\xb2\xa1" : ("<", 1e-6),
+    "\xa1\xb2\xc3\xd4" : (">", 1e-6),
+    "\x4d\x3c\xb2\xa1" : ("<", 1e-9),
+    "\xa1\xb2\x3c\x4d" : (">", 1e-9),
+}
+
+def CapHeader(UInt16, UInt32, SInt32):
+    return Struct("header",
+        OneOf(Bytes("magic", 4), byte_orders.keys()),
+        UInt16("version_major"),
+        UInt16("version_minor"),
+        SInt32("thiszone"),
+        UInt32("sigfigs"),
+        UInt32("snaplen"),
+        UInt32("linktype"),
+    )
+
+def CapPacket(UInt32, TimeAdapter):
+    return Struct("packet",
+        TimeAdapter(
+            Sequence("time",
+                UInt32("time"),
+                UInt32("usec"),
+            )
+        ),
+        UInt32("length"),
+        UInt32("original_length"),
+        HexDumpAdapter(Field("data", lambda ctx: ctx.length)),
+    )
+
+# the packets of the usual files: little endian, microseconds
+packet = CapPacket(ULInt32, MicrosecAdapter)
+
+cap_header = Struct("header",
+    Peek(Bytes("magic", 4)),
+    Embedded(
+        Switch("header", lambda ctx: byte_orders[ctx.magic][0],
+            {
+                "<" : CapHeader(ULInt16, ULInt32, SLInt32),
+                ">" : CapHeader(UBInt16, UBInt32, SBInt32),
+            }
         )
     ),
-    ULInt32("length"),
-    Padding(4),
-    HexDumpAdapter(Field("data", lambda ctx: ctx.length)),
+)
+
+cap_packet = Switch("packets", lambda ctx: byte_orders[ctx.header.magic],
+    {
+        ("<", 1e-6) : packet,
+        (">", 1e-6) : CapPacket(UBInt32, MicrosecAdapter),
+        ("<", 1e-9) : CapPacket(ULInt32, NanosecAdapter),
+        (">", 1e-9) : CapPacket(UBInt32, NanosecAdapter),
+    }
 )
 
 cap_file = Struct("cap_file",
-    Padding(24),
-    Rename("packets", OptionalGreedyRange(packet)),
+    cap_header,
+    OptionalGreedyRange(cap_packet),
 )
 
 
-if __name__ == "__main__":
-    obj = cap_file.parse_stream(open("../../tests/cap2.cap", "rb"))
-    print len(obj.packets)
+#===============================================================================
+# reading and writing
+#===============================================================================
+class CapError(ConstructError):
+    __slots__ = []
+
+def _timestamp(seconds, resolution):
+    """splits a timestamp into whole seconds and units of the resolution"""
+    if isinstance(seconds, tuple):
+        return seconds
+    whole = int(seconds // 1)
+    frac = int(round((seconds - whole) / resolution))
+    if frac * resolution >= 1:
+        whole += 1
+        frac = 0
+    return whole, frac
 
+class CapIndex(object):
+    """
+    The sidecar index of a capture file: the offset and timestamp of every
+    packet, 16 bytes each, so that packet N is found in O(1) and the
+    packets of a time in O(log n). The index is a file next to the capture
+    (with ".idx" appended to its name), which records how much of the
+    capture it covers; it is extended when the capture grows, and rebuilt
+    when the capture shrinks.
+    """
+    __slots__ = ["path", "mapped", "count", "times"]
+    magic = "CAPIDX\x00\x02"
+    # the tag, the size covered, the magic and the first packet header of
+    # the capture
+    header = struct.Struct("<8sQ4s16s")
+    entry = struct.Struct("<Qd")
+    batch = 4096
 
+    def __init__(self, reader):
+        self.path = reader.path + ".idx"
+        covered = self._covered(reader)
+        if covered < reader.size:
+            self._extend(reader, covered)
+        f = open(self.path, "rb")
+        try:
+            self.mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            f.close()
+        self.count = (len(self.mapped) - self.header.size) // self.entry.size
+        self.times = _IndexTimes(self)
 
+    def _identity(self, reader):
+        """the first packet header of the capture, which tells captures
+        apart"""
+        return reader.mapped[reader.first:reader.first + 16].ljust(16, "\x00")
 
+    def _covered(self, reader):
+        """how much of the capture the index covers; 0 if there is no
+        index, or it is not of this capture"""
+        try:
+            f = open(self.path, "rb")
+        except IOError:
+            return 0
+        try:
+            head = f.read(self.header.size)
+            if len(head) < self.header.size:
+                return 0
+            tag, covered, magic, first = self.header.unpack(head)
+            if tag != self.magic or magic != reader.header.magic or \
+                    covered > reader.size or \
+                    (covered > reader.first and
+                    first != self._identity(reader)):
+                return 0
+            f.seek(0, 2)
+            count = (f.tell() - self.header.size) // self.entry.size
+            if count == 0:
+                return covered if covered <= reader.first else 0
+            # the last indexed packet must still be there, and end where
+            # the index does
+            f.seek(self.header.size + (count - 1) * self.entry.size)
+            offset, timestamp = self.entry.unpack(f.read(self.entry.size))
+        finally:
+            f.close()
+        if offset + 16 > reader.size:
+            return 0
+        sec, frac, length, orig = reader.packet_header.unpack_from(
+            reader.mapped, offset)
+        if sec + frac * reader.resolution != timestamp or \
+                offset + 16 + length != covered:
+            return 0
+        return covered
 
+    def _extend(self, reader, covered):
+        if covered == 0:
+            f = open(self.path, "wb")
+            f.write(self.header.pack(self.magic, 0, reader.header.magic,
+                self._identity(reader)))
+            covered = reader.first
+        else:
+            f = open(self.path, "r+b")
+            f.seek(0, 2)
+        try:
+            pack = self.entry.pack
+            entries = []
+            try:
+                for offset, timestamp, length, orig in \
+                        reader.records(covered):
+                    entries.append(pack(offset, timestamp))
+                    covered = offset + 16 + length
+                    if len(entries) >= self.batch:
+                        f.write("".join(entries))
+                        del entries[:]
+            except CapError:
+                # the last packet is incomplete (perhaps still being
+                # written); it is indexed once it is complete
+                pass
+            f.write("".join(entries))
+            f.seek(0)
+            f.write(self.header.pack(self.magic, covered, reader.header.magic,
+                self._identity(reader)))
+        finally:
+            f.close()
 
+    def close(self):
+        self.mapped.close()
 
+    def __len__(self):
+        return self.count
 
+    def __getitem__(self, n):
+        """the offset and timestamp of packet n"""
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError(n)
+        return self.entry.unpack_from(self.mapped,
+            self.header.size + n * self.entry.size)
 
+class _IndexTimes(object):
+    """the timestamps of an index, as a sequence (for bisection)"""
+    __slots__ = ["index"]
+    def __init__(self, index):
+        self.index = index
+    def __len__(self):
+        return self.index.count
+    def __getitem__(self, n):
+        return self.index[n][1]
 
+class CapReader(object):
+    """
+    A fast reader of capture files (both byte orders, microsecond and
+    nanosecond timestamps). The file is mapped into memory, and the data of
+    packets are buffers into the mapping, so nothing is copied; no datetime
+    objects are made either, timestamps are seconds since the epoch, as
+    floats. Use cap_file to parse a capture into containers instead.
 
+    Parameters:
+    * path - the path of the capture file
+    * index - whether to use a sidecar index (see CapIndex), which is
+      created or updated as needed. it is required for indexing and
+      seek_time(), and makes len() O(1).
 
+    Example:
+    with CapReader("capture.cap", index = True) as cap:
+        for timestamp, data in cap.iter_from(cap.seek_time(start)):
+            ...
+    """
+    def __init__(self, path, index = False):
+        self.path = path
+        f = open(path, "rb")
+        try:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size < 24:
+                raise CapError("not a capture file", path)
+            self.mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            f.close()
+        magic = self.mapped[:4]
+        if magic not in byte_orders:
+            self.mapped.close()
+            raise CapError("bad magic", magic)
+        self.byteorder, self.resolution = byte_orders[magic]
+        self.header = cap_header.parse(self.mapped[:24])
+        self.packet_header = struct.Struct(self.byteorder + "IIII")
+        self.first = 24
+        self.index = CapIndex(self) if index else None
 
+    def close(self):
+        self.mapped.close()
+        if self.index is not None:
+            self.index.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
 
+    def records(self, offset = None):
+        """
+        The records of the packets: tuples of (offset, timestamp, length,
+        original length), from the given offset (default is the first
+        packet) on. The data of a packet is at offset + 16.
+        """
+        if offset is None:
+            offset = self.first
+        unpack_from = self.packet_header.unpack_from
+        resolution = self.resolution
+        mapped = self.mapped
+        end = self.size - 16
+        while offset <= end:
+            sec, frac, length, orig = unpack_from(mapped, offset)
+            if offset + 16 + length > self.size:
+                raise CapError("truncated packet at %d" % (offset,))
+            yield offset, sec + frac * resolution, length, orig
+            offset += 16 + length
+        if offset < self.size:
+            raise CapError("truncated packet at %d" % (offset,))
 
+    def __iter__(self):
+        return self.iter_from(0)
 
+    def iter_from(self, n):
+        """
+        Iterate over (timestamp, data) of the packets, from packet n on.
+        Without an index, n must be 0.
+        """
+        if n == 0:
+            offset = self.first
+        elif self.index is None:
+            raise CapError("no index")
+        elif n >= len(self.index):
+            return
+        else:
+            offset = self.index[n][0]
+        mapped = self.mapped
+        for offset, timestamp, length, orig in self.records(offset):
+            yield timestamp, buffer(mapped, offset + 16, length)
 
+    def __len__(self):
+        if self.index is None:
+            return sum(1 for record in self.records())
+        return len(self.index)
+
+    def __getitem__(self, n):
+        """(timestamp, data) of packet n"""
+        if self.index is None:
+            raise CapError("no index")
+        offset, timestamp = self.index[n]
+        length = self.packet_header.unpack_from(self.mapped, offset)[2]
+        return timestamp, buffer(self.mapped, offset + 16, length)
+
+    def seek_time(self, timestamp):
+        """
+        The number of the first packet at or after the given time. The
+        packets must be in the order of their timestamps.
+        """
+        if self.index is None:
+            raise CapError("no index")
+        return bisect_left(self.index.times, timestamp)
+
+class CapWriter(object):
+    """
+    Writes capture files a packet at a time, without holding the packets
+    in memory. Appending to an existing file keeps its byte order and
+    timestamp resolution (and the given ones are ignored).
+
+    Parameters:
+    * path - the path of the capture file
+    * linktype - the link type of the packets (1 is ethernet)
+    * snaplen - the most bytes kept of a packet
+    * byteorder - "<" or ">"
+    * resolution - the resolution of timestamps, 1e-6 or 1e-9
+    * append - whether to append to the file, if it exists
+
+    Example:
+    with CapWriter("out.cap", append = True) as cap:
+        cap.write(data, time.time())
+    """
+    def __init__(self, path, linktype = 1, snaplen = 65535, byteorder = "<",
+                 resolution = 1e-6, append = False):
+        self.path = path
+        if append and os.path.exists(path) and os.path.getsize(path) >= 24:
+            self.file = open(path, "r+b")
+            magic = self.file.read(4)
+            if magic not in byte_orders:
+                self.file.close()
+                raise CapError("bad magic", magic)
+            byteorder, resolution = byte_orders[magic]
+            self.file.seek(0, 2)
+        else:
+            for magic, params in byte_orders.iteritems():
+                if params == (byteorder, resolution):
+                    break
+            else:
+                raise ValueError("bad byte order or resolution",
+                    byteorder, resolution)
+            self.file = open(path, "wb")
+            self.file.write(magic + struct.pack(byteorder + "HHiIII", 2, 4,
+                0, 0, snaplen, linktype))
+        self.byteorder = byteorder
+        self.resolution = resolution
+        self.packet_header = struct.Struct(byteorder + "IIII")
+
+    def write(self, data, timestamp = None, original_length = None):
+        """
+        Write a packet.
+
+        Parameters:
+        * data - the data of the packet
+        * timestamp - seconds since the epoch, as a number or a tuple of
+          (seconds, units of the resolution). default is now.
+        * original_length - the length of the packet on the wire. default
+          is the length of data.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        sec, frac = _timestamp(timestamp, self.resolution)
+        if original_length is None:
+            original_length = len(data)
+        self.file.write(self.packet_header.pack(sec, frac, len(data),
+            original_length))
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+    def close(self):
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    obj = cap_file.parse_stream(open("../../tests/cap2.cap", "rb"))
+    print len(obj.packets)
@@ -5,8 +5,12 @@ what : snoop v2 capture file.
 """
 
 import time
+import struct
 from construct import (
         Adapter,
+        ConstructError,
+        Container,
+        Embedded,
         Enum,
         Field,
         GreedyRange,
@@ -52,9 +56,172 @@ datalink_type = Enum(UBInt32("datalink"),
         UNASSIGNED = 10,
     )
 
-snoop_file = Struct("snoop",
+snoop_header = Struct("snoop",
         Magic("snoop\x00\x00\x00"),
         UBInt32("version"), # snoop v1 is deprecated
         datalink_type,
+    )
+
+snoop_file = Struct("snoop",
+        Embedded(snoop_header),
         OptionalGreedyRange(packet_record),
     )
+
+
+#===============================================================================
+# streaming
+#===============================================================================
+class SnoopError(ConstructError):
+    __slots__ = []
+
+_record_header = struct.Struct(">IIIIII")
+
+class SnoopRecord(object):
+    """
+    A record of a snoop capture, as read by SnoopReader. The timestamp is
+    kept as the integers of the file, and converted only when asked for;
+    data is a buffer into the block the record was read from.
+    """
+    __slots__ = ["original_length", "cumulative_drops", "seconds",
+        "microseconds", "data"]
+    def __init__(self, original_length, cumulative_drops, seconds,
+                 microseconds, data):
+        self.original_length = original_length
+        self.cumulative_drops = cumulative_drops
+        self.seconds = seconds
+        self.microseconds = microseconds
+        self.data = data
+    def __repr__(self):
+        return "%s(%d bytes at %d.%06d)" % (self.__class__.__name__,
+            len(self.data), self.seconds, self.microseconds)
+    @property
+    def included_length(self):
+        return len(self.data)
+    @property
+    def timestamp(self):
+        """seconds since the epoch, as a float"""
+        return self.seconds + self.microseconds / 1000000.0
+    @property
+    def ctime(self):
+        """the local time of the record, as given by time.ctime"""
+        return time.ctime(self.seconds)
+
+class SnoopReader(object):
+    """
+    Reads the records of a snoop capture from a stream, a block at a time,
+    without parsing them into containers (see snoop_file for that). The
+    data of the records are buffers into the blocks, and the padding of
+    records is skipped by their record length, unread.
+
+    Parameters:
+    * stream - the stream, positioned at the start of the capture
+    * blocksize - the size of the reads from the stream
+
+    Example:
+    reader = SnoopReader(open("capture.snoop", "rb"))
+    for record in reader:
+        ...
+    """
+    __slots__ = ["stream", "blocksize", "version", "datalink", "block",
+        "pos"]
+    def __init__(self, stream, blocksize = 1 << 20):
+        self.stream = stream
+        self.blocksize = blocksize
+        self.block = ""
+        self.pos = 0
+        header = snoop_header.parse(self._read(16))
+        self.version = header.version
+        self.datalink = header.datalink
+
+    def _fill(self, size):
+        """make size bytes available at pos, if the stream has them"""
+        if len(self.block) - self.pos >= size:
+            return True
+        rest = self.block[self.pos:]
+        chunks = [rest]
+        have = len(rest)
+        while have < size:
+            chunk = self.stream.read(max(self.blocksize, size - have))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            have += len(chunk)
+        self.block = "".join(chunks)
+        self.pos = 0
+        return have >= size
+
+    def _read(self, size):
+        if not self._fill(size):
+            raise SnoopError("truncated capture")
+        data = self.block[self.pos:self.pos + size]
+        self.pos += size
+        return data
+
+    def __iter__(self):
+        unpack_from = _record_header.unpack_from
+        while self._fill(24):
+            orig, incl, reclen, drops, sec, usec = unpack_from(self.block,
+                self.pos)
+            if reclen < 24 + incl:
+                raise SnoopError("bad record length", reclen)
+            if not self._fill(24 + incl):
+                raise SnoopError("truncated record")
+            block = self.block
+            data = buffer(block, self.pos + 24, incl)
+            if self._fill(reclen):
+                self.pos += reclen
+            else:
+                # the padding of the last record is missing
+                self.pos = len(self.block)
+            yield SnoopRecord(orig, drops, sec, usec, data)
+        if self.pos < len(self.block):
+            raise SnoopError("truncated record")
+
+class SnoopWriter(object):
+    """
+    Writes a snoop capture to a stream, a record at a time.
+
+    Parameters:
+    * stream - the stream
+    * datalink - the datalink type of the capture (see datalink_type)
+
+    Example:
+    writer = SnoopWriter(open("capture.snoop", "wb"), "ETHERNET")
+    writer.write(data, time.time())
+    """
+    __slots__ = ["stream"]
+    def __init__(self, stream, datalink = "ETHERNET"):
+        self.stream = stream
+        stream.write(snoop_header.build(Container(version = 2,
+            datalink = datalink)))
+
+    def write(self, data, timestamp = None, original_length = None,
+              cumulative_drops = 0):
+        """
+        Write a record.
+
+        Parameters:
+        * data - the data of the packet
+        * timestamp - seconds since the epoch, as a number or a tuple of
+          (seconds, microseconds). default is now.
+        * original_length - the length of the packet on the wire. default
+          is the length of data.
+        * cumulative_drops - the number of packets dropped so far
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if isinstance(timestamp, tuple):
+            sec, usec = timestamp
+        else:
+            sec = int(timestamp // 1)
+            usec = int(round((timestamp - sec) * 1000000))
+            if usec >= 1000000:
+                sec += 1
+                usec -= 1000000
+        if original_length is None:
+            original_length = len(data)
+        padding = -len(data) % 4
+        self.stream.write(_record_header.pack(original_length, len(data),
+            24 + len(data) + padding, cumulative_drops, sec, usec))
+        self.stream.write(data)
+        self.stream.write("\x00" * padding)
@@ -0,0 +1,13 @@
+"""
+executable file formats (elf, pe, ...)
+"""
+from construct.lib.lazymodule import LazyModule
+
+
+LazyModule.install(__name__, {
+    "elf32"      : "elf32",
+    "pe32"       : "pe32",
+    "elf32_file" : ("elf32", "elf32_file"),
+    "ElfReader"  : ("elf32", "ElfReader"),
+    "pe32_file"  : ("pe32", "pe32_file"),
+})
@@ -5,9 +5,46 @@ Used on *nix systems as a replacement of the older a.out format
 Big-endian support kindly submitted by Craig McQueen (mcqueen-c#edsrd1!yzk!co!jp)
 """
 from construct import *
+import os
+import mmap
+import struct
 
 
-def elf32_body(ElfInt16, ElfInt32):
+def elf32_headers(ElfInt16, ElfInt32):
+    """the file header (after the identifier), the program header and the
+    section header, without the data they point to"""
+    elf32_header = Struct("header",
+        Enum(ElfInt16("type"),
+            NONE = 0,
+            RELOCATABLE = 1,
+            EXECUTABLE = 2,
+            SHARED = 3,
+            CORE = 4,
+        ),
+        Enum(ElfInt16("machine"),
+            NONE = 0,
+            M32 = 1,
+            SPARC = 2,
+            I386 = 3,
+            Motorolla68K = 4,
+            Motorolla88K = 5,
+            Intel860 = 7,
+            MIPS = 8,
+            _default_ = Pass
+        ),
+        ElfInt32("version"),
+        ElfInt32("entry"),
+        ElfInt32("ph_offset"),
+        ElfInt32("sh_offset"),
+        ElfInt32("flags"),
+        ElfInt16("header_size"),
+        ElfInt16("ph_entry_size"),
+        ElfInt16("ph_count"),
+        ElfInt16("sh_entry_size"),
+        ElfInt16("sh_count"),
+        ElfInt16("strtab_section_index"),
+    )
+
     elf32_program_header = Struct("program_header",
         Enum(ElfInt32("type"),
             NULL = 0,
@@ -27,12 +64,9 @@ def elf32_body(ElfInt16, ElfInt32):
         ElfInt32("flags"),
         ElfInt32("align"),
     )
-    
+
     elf32_section_header = Struct("section_header",
         ElfInt32("name_offset"),
-        Pointer(lambda ctx: ctx._.strtab_data_offset + ctx.name_offset,
-            CString("name")
-        ),
         Enum(ElfInt32("type"), 
             NULL = 0,
             PROGBITS = 1,
@@ -56,41 +90,26 @@ def elf32_body(ElfInt16, ElfInt32):
         ElfInt32("info"),
         ElfInt32("align"),
         ElfInt32("entry_size"),
+    )
+
+    return elf32_header, elf32_program_header, elf32_section_header
+
+def elf32_body(ElfInt16, ElfInt32):
+    elf32_header, elf32_program_header, elf32_section_header_fields = \
+        elf32_headers(ElfInt16, ElfInt32)
+
+    elf32_section_header = Struct("section_header",
+        Embedded(elf32_section_header_fields),
+        Pointer(lambda ctx: ctx._.strtab_data_offset + ctx.name_offset,
+            CString("name")
+        ),
         OnDemandPointer(lambda ctx: ctx.offset,
             HexDumpAdapter(Field("data", lambda ctx: ctx.size))
         ),
     )
     
     return Struct("body",
-        Enum(ElfInt16("type"),
-            NONE = 0,
-            RELOCATABLE = 1,
-            EXECUTABLE = 2,
-            SHARED = 3,
-            CORE = 4,
-        ),
-        Enum(ElfInt16("machine"),
-            NONE = 0,
-            M32 = 1,
-            SPARC = 2,
-            I386 = 3,
-            Motorolla68K = 4,
-            Motorolla88K = 5,
-            Intel860 = 7,
-            MIPS = 8,
-            _default_ = Pass
-        ),
-        ElfInt32("version"),
-        ElfInt32("entry"),
-        ElfInt32("ph_offset"),
-        ElfInt32("sh_offset"),
-        ElfInt32("flags"),
-        ElfInt16("header_size"),
-        ElfInt16("ph_entry_size"),
-        ElfInt16("ph_count"),
-        ElfInt16("sh_entry_size"),
-        ElfInt16("sh_count"),
-        ElfInt16("strtab_section_index"),
+        Embedded(elf32_header),
         
         # calculate the string table data offset (pointer arithmetics)
         # ugh... anyway, we need it in order to read the section names, later on
@@ -147,6 +166,182 @@ elf32_file = Struct("elf32_file",
 )
 
 
+#===============================================================================
+# reading
+#===============================================================================
+class ElfError(ConstructError):
+    __slots__ = []
+
+class LazyArray(object):
+    """
+    A sequence of fixed-size entries of a buffer, each parsed by a construct
+    when it is first accessed (and cached).
+
+    Parameters:
+    * subcon - the construct of an entry
+    * data - the buffer
+    * offset - the offset of the first entry
+    * count - the number of entries
+    * entry_size - the distance between entries
+    """
+    __slots__ = ["subcon", "data", "offset", "count", "entry_size", "cache"]
+    def __init__(self, subcon, data, offset, count, entry_size):
+        if offset + count * entry_size > len(data):
+            raise ElfError("table beyond the end of the file", offset)
+        self.subcon = subcon
+        self.data = data
+        self.offset = offset
+        self.count = count
+        self.entry_size = entry_size
+        self.cache = [None] * count
+    def __len__(self):
+        return self.count
+    def __getitem__(self, n):
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError(n)
+        obj = self.cache[n]
+        if obj is None:
+            start = self.offset + n * self.entry_size
+            obj = self.cache[n] = self.subcon.parse(
+                self.data[start:start + self.entry_size])
+        return obj
+    def __iter__(self):
+        for n in xrange(self.count):
+            yield self[n]
+
+# the headers of both byte orders
+elf32_headers_little_endian = elf32_headers(ULInt16, ULInt32)
+elf32_headers_big_endian = elf32_headers(UBInt16, UBInt32)
+
+class ElfReader(object):
+    """
+    A fast reader of 32 bit ELF files, for scanning many of them. The file
+    is mapped into memory; program and section headers are parsed when they
+    are first accessed, section names are looked up in a table built on the
+    first lookup, and section data are buffers into the mapping, so nothing
+    is copied. Use elf32_file to parse a file into containers instead.
+
+    Parameters:
+    * path - the path of the file
+
+    Attributes:
+    * header - the parsed file header
+    * program_headers - a LazyArray of the program headers
+    * sections - a LazyArray of the section headers
+
+    Example:
+    with ElfReader("libfoo.so") as elf:
+        text = elf.data(".text")
+        names = [sym[0] for sym in elf.symbols(".dynsym")]
+    """
+    def __init__(self, path):
+        self.path = path
+        f = open(path, "rb")
+        try:
+            if os.fstat(f.fileno()).st_size < 52:
+                raise ElfError("not an ELF file", path)
+            self.mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            f.close()
+        try:
+            self._read_header()
+        except:
+            self.mapped.close()
+            raise
+        self.names = None
+
+    def _read_header(self):
+        mapped = self.mapped
+        if mapped[:4] != "\x7fELF":
+            raise ElfError("bad magic", mapped[:4])
+        if mapped[4] != "\x01":
+            raise ElfError("not a 32 bit file")
+        if mapped[5] == "\x01":
+            self.byteorder = "<"
+            headers = elf32_headers_little_endian
+        elif mapped[5] == "\x02":
+            self.byteorder = ">"
+            headers = elf32_headers_big_endian
+        else:
+            raise ElfError("bad encoding", mapped[5])
+        header, program_header, section_header = headers
+        self.header = header.parse(mapped[16:52])
+        self.program_headers = LazyArray(program_header, mapped,
+            self.header.ph_offset, self.header.ph_count,
+            self.header.ph_entry_size)
+        self.sections = LazyArray(section_header, mapped,
+            self.header.sh_offset, self.header.sh_count,
+            self.header.sh_entry_size)
+
+    def close(self):
+        self.mapped.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, strtab, offset):
+        """the string at an offset into a string table section"""
+        start = strtab.offset + offset
+        end = self.mapped.find("\x00", start, strtab.offset + strtab.size)
+        if end < 0:
+            raise ElfError("unterminated string", offset)
+        return self.mapped[start:end]
+
+    def name(self, section):
+        """the name of a section header"""
+        strtab = self.sections[self.header.strtab_section_index]
+        return self.string(strtab, section.name_offset)
+
+    def section(self, name):
+        """the header of the section of a name; KeyError if there is none"""
+        if self.names is None:
+            # the first section of a name wins
+            names = {}
+            for n in reversed(xrange(len(self.sections))):
+                names[self.name(self.sections[n])] = n
+            self.names = names
+        return self.sections[self.names[name]]
+
+    def data(self, section):
+        """the data of a section (a header or a name), as a buffer"""
+        if isinstance(section, str):
+            section = self.section(section)
+        if section.type == "NOBITS":
+            return buffer("")
+        if section.offset + section.size > len(self.mapped):
+            raise ElfError("section beyond the end of the file",
+                section.offset)
+        return buffer(self.mapped, section.offset, section.size)
+
+    def symbols(self, section = ".symtab"):
+        """
+        The symbols of a symbol table section (a header or a name): a list
+        of tuples of (name, value, size, info, other, shndx). The table is
+        unpacked in a single call, rather than a symbol at a time.
+        """
+        if isinstance(section, str):
+            section = self.section(section)
+        if section.type not in ("SYMTAB", "DYNSYM"):
+            raise ElfError("not a symbol table", section.type)
+        if section.entry_size < 16:
+            raise ElfError("symbol entries too small", section.entry_size)
+        count = section.size // section.entry_size
+        packer = struct.Struct(self.byteorder +
+            ("IIIBBH%dx" % (section.entry_size - 16,)) * count)
+        if section.offset + packer.size > len(self.mapped):
+            raise ElfError("symbol table beyond the end of the file",
+                section.offset)
+        fields = packer.unpack_from(self.mapped, section.offset)
+        strtab = self.sections[section.link]
+        string = self.string
+        names = [string(strtab, offset) for offset in fields[0::6]]
+        return zip(names, fields[1::6], fields[2::6], fields[3::6],
+            fields[4::6], fields[5::6])
+
+
 if __name__ == "__main__":
     obj = elf32_file.parse_stream(open("../../tests/_ctypes_test.so", "rb"))
     #[s.data.value for s in obj.sections]
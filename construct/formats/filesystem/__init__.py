@@ -2,3 +2,11 @@
 file systems on-disk formats (ext2, fat32, ntfs, ...) 
 and related disk formats (mbr, ...)
 """
+from construct.lib.lazymodule import LazyModule
+
+
+LazyModule.install(__name__, {
+    "ext2"       : "ext2",
+    "mbr"        : "mbr",
+    "superblock" : ("ext2", "superblock"),
+})
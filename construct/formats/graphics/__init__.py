@@ -2,3 +2,19 @@
 graphic file formats, including imagery (bmp, jpg, gif, png, ...),
 models (3ds, ...), etc.
 """
+from construct.lib.lazymodule import LazyModule
+
+
+LazyModule.install(__name__, {
+    "bmp"         : "bmp",
+    "emf"         : "emf",
+    "png"         : "png",
+    "wmf"         : "wmf",
+    "bitmap_file" : ("bmp", "bitmap_file"),
+    "raw_bitmap_file" : ("bmp", "raw_bitmap_file"),
+    "BitmapImage" : ("bmp", "BitmapImage"),
+    "emf_file"    : ("emf", "emf_file"),
+    "png_file"    : ("png", "png_file"),
+    "PngReader"   : ("png", "PngReader"),
+    "wmf_file"    : ("wmf", "wmf_file"),
+})
@@ -4,6 +4,14 @@ this could have been a perfect show-case file format, but they had to make
 it ugly (all sorts of alignment or
 """
 from construct import *
+from construct.lib import ListContainer
+from string import maketrans
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 #===============================================================================
@@ -33,6 +41,147 @@ uncompressed_pixels = Switch("uncompressed", lambda ctx: ctx.bpp,
     }
 )
 
+#===============================================================================
+# pixels: uncompressed, in bulk
+#===============================================================================
+def row_size(width, bpp):
+    """the number of bytes of the pixels of a row, without padding"""
+    return (width * bpp + 7) // 8
+
+def row_stride(width, bpp):
+    """the number of bytes of a row, padded to 4 bytes"""
+    return (row_size(width, bpp) + 3) & ~3
+
+class PixelRows(Construct):
+    """
+    The rows of uncompressed pixels, read in a single read and parsed into
+    buffers of the packed pixels of every row (without their padding), in
+    the order of the file (bottom to top). Building writes the rows (any
+    strings or buffers) with their padding. See BitmapImage for decoding
+    the pixels.
+
+    Parameters:
+    * name - the name of the field
+    """
+    __slots__ = []
+    def __init__(self, name):
+        Construct.__init__(self, name)
+        self._set_flag(self.FLAG_DYNAMIC)
+    def _parse(self, stream, context):
+        size = row_size(context.width, context.bpp)
+        stride = row_stride(context.width, context.bpp)
+        length = stride * context.height
+        data = stream.read(length)
+        if len(data) != length:
+            raise FieldError("expected %d, found %d" % (length, len(data)))
+        return ListContainer(buffer(data, offset, size)
+            for offset in xrange(0, length, stride))
+    def _build(self, obj, stream, context):
+        size = row_size(context.width, context.bpp)
+        padding = "\x00" * (row_stride(context.width, context.bpp) - size)
+        if len(obj) != context.height:
+            raise FieldError("expected %d rows, found %d" % (context.height,
+                len(obj)))
+        for row in obj:
+            if len(row) != size:
+                raise FieldError("expected a row of %d bytes, found %d" %
+                    (size, len(row)))
+            stream.write(row)
+            stream.write(padding)
+    def _sizeof(self, context):
+        return row_stride(context.width, context.bpp) * context.height
+
+# the tables unpacking the pixels of a byte, for pixels of 1, 2 and 4 bits:
+# one table per pixel, each mapping bytes to the index of that pixel
+_unpack_tables = dict(
+    (bpp, [maketrans("".join(chr(i) for i in range(256)),
+        "".join(chr((i >> (8 - bpp * (k + 1))) & ((1 << bpp) - 1))
+            for i in range(256)))
+        for k in range(8 // bpp)])
+    for bpp in (1, 2, 4)
+)
+
+def unpack_indices(row, width, bpp):
+    """the palette indices of a row of 1, 2, 4 or 8 bits per pixel, one
+    byte per pixel"""
+    row = str(row)
+    if bpp == 8:
+        return row[:width]
+    tables = _unpack_tables[bpp]
+    per_byte = len(tables)
+    out = array("B", "\x00" * (len(row) * per_byte))
+    for k, table in enumerate(tables):
+        out[k::per_byte] = array("B", row.translate(table))
+    return out[:width].tostring()
+
+def palette_tables(palette):
+    """the tables mapping palette indices to red, green and blue, from the
+    raw palette (4 bytes per entry: blue, green, red, unused)"""
+    palette = str(palette)[:1024].ljust(1024, "\x00")
+    indices = "".join(chr(i) for i in range(256))
+    return tuple(maketrans(indices, palette[k::4]) for k in (2, 1, 0))
+
+
+class BitmapImage(object):
+    """
+    Bulk decoding of the uncompressed pixels of a bitmap parsed by
+    raw_bitmap_file: rows are decoded with str.translate and slicing,
+    rather than into an object per pixel.
+
+    Parameters:
+    * obj - the parsed bitmap
+
+    Example:
+    image = BitmapImage(raw_bitmap_file.parse_stream(open("a.bmp", "rb")))
+    data = image.rgb()
+    """
+    __slots__ = ["width", "height", "bpp", "rows", "tables"]
+    def __init__(self, obj):
+        if obj.compression != "Uncompressed":
+            raise ValueError("compressed bitmap", obj.compression)
+        self.width = obj.width
+        self.height = obj.height
+        self.bpp = obj.bpp
+        self.rows = obj.pixels
+        self.tables = palette_tables(obj.palette) if obj.bpp <= 8 else None
+
+    def row(self, y):
+        """the packed pixels of row y (from the top), as a buffer"""
+        return self.rows[self.height - 1 - y]
+
+    def indices(self, y):
+        """the palette indices of row y, one byte per pixel"""
+        if self.tables is None:
+            raise ValueError("bitmap has no palette", self.bpp)
+        return unpack_indices(self.row(y), self.width, self.bpp)
+
+    def rgb_row(self, y):
+        """row y as red, green and blue bytes"""
+        out = array("B", "\x00" * (self.width * 3))
+        if self.tables is not None:
+            indices = self.indices(y)
+            for k in range(3):
+                out[k::3] = array("B", indices.translate(self.tables[k]))
+        elif self.bpp in (24, 32):
+            row = str(self.row(y))
+            step = self.bpp // 8
+            for k in range(3):
+                out[k::3] = array("B", row[2 - k::step])
+        else:
+            raise ValueError("unsupported bits per pixel", self.bpp)
+        return out.tostring()
+
+    def rgb(self):
+        """the whole image as red, green and blue bytes, top to bottom"""
+        return "".join(self.rgb_row(y) for y in xrange(self.height))
+
+    def to_array(self):
+        """the image as a numpy array of shape (height, width, 3)"""
+        if numpy is None:
+            raise ImportError("numpy is not installed")
+        return numpy.frombuffer(self.rgb(), numpy.uint8).reshape(
+            self.height, self.width, 3)
+
 #===============================================================================
 # pixels: Run Length Encoding (RLE) 8 bit
 #===============================================================================
@@ -53,38 +202,53 @@ rle8pixel = RunLengthAdapter(
 #===============================================================================
 # file structure
 #===============================================================================
-bitmap_file = Struct("bitmap_file",
-    # header
-    Const(String("signature", 2), "BM"),
-    ULInt32("file_size"),
-    Padding(4),
-    ULInt32("data_offset"),
-    ULInt32("header_size"),
-    Enum(Alias("version", "header_size"),
-        v2 = 12,
-        v3 = 40,
-        v4 = 108,
-    ),
-    ULInt32("width"),
-    ULInt32("height"),
-    Value("number_of_pixels", lambda ctx: ctx.width * ctx.height),
-    ULInt16("planes"),
-    ULInt16("bpp"), # bits per pixel
-    Enum(ULInt32("compression"),
-        Uncompressed = 0,
-        RLE8 = 1,
-        RLE4 = 2,
-        Bitfields = 3,
-        JPEG = 4,
-        PNG = 5,
-    ),
-    ULInt32("image_data_size"), # in bytes
-    ULInt32("horizontal_dpi"),
-    ULInt32("vertical_dpi"),
-    ULInt32("colors_used"),
-    ULInt32("important_colors"),
+def BitmapFile(palette, pixels, pointer = OnDemandPointer):
+    return Struct("bitmap_file",
+        # header
+        Const(String("signature", 2), "BM"),
+        ULInt32("file_size"),
+        Padding(4),
+        ULInt32("data_offset"),
+        ULInt32("header_size"),
+        Enum(Alias("version", "header_size"),
+            v2 = 12,
+            v3 = 40,
+            v4 = 108,
+        ),
+        ULInt32("width"),
+        ULInt32("height"),
+        Value("number_of_pixels", lambda ctx: ctx.width * ctx.height),
+        ULInt16("planes"),
+        ULInt16("bpp"), # bits per pixel
+        Enum(ULInt32("compression"),
+            Uncompressed = 0,
+            RLE8 = 1,
+            RLE4 = 2,
+            Bitfields = 3,
+            JPEG = 4,
+            PNG = 5,
+        ),
+        ULInt32("image_data_size"), # in bytes
+        ULInt32("horizontal_dpi"),
+        ULInt32("vertical_dpi"),
+        ULInt32("colors_used"),
+        ULInt32("important_colors"),
 
-    # palette (24 bit has no palette)
+        # palette (24 bit has no palette)
+        palette,
+
+        # pixels
+        pointer(lambda ctx: ctx.data_offset,
+            Switch("pixels", lambda ctx: ctx.compression,
+                {
+                    "Uncompressed" : pixels,
+                }
+            ),
+        ),
+    )
+
+
+bitmap_file = BitmapFile(
     OnDemand(
         Array(lambda ctx: 2 ** ctx.bpp if ctx.bpp <= 8 else 0,
             Struct("palette",
@@ -95,15 +259,14 @@ bitmap_file = Struct("bitmap_file",
             )
         )
     ),
+    uncompressed_pixels,
+)
 
-    # pixels
-    OnDemandPointer(lambda ctx: ctx.data_offset,
-        Switch("pixels", lambda ctx: ctx.compression,
-            {
-                "Uncompressed" : uncompressed_pixels,
-            }
-        ),
-    ),
+# the palette and pixels of bitmaps as raw data, for BitmapImage
+raw_bitmap_file = BitmapFile(
+    Field("palette", lambda ctx: 4 * 2 ** ctx.bpp if ctx.bpp <= 8 else 0),
+    PixelRows("uncompressed"),
+    pointer = Pointer,
 )
 
 
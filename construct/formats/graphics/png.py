@@ -7,6 +7,10 @@ Original code contributed by Robin Munn (rmunn at pobox dot com)
 coding conventions)
 """
 from construct import *
+from construct.lib.compression import DecompressingReader
+import zlib
+import struct
+from array import array
 
 
 #===============================================================================
@@ -312,7 +316,9 @@ chunk = Struct("chunk",
         },
         default = default_chunk_info,
     ),
-    UBInt32("crc"),
+    # over the type and the data
+    Checksum(UBInt32("crc"), "crc32", lambda ctx: (-4 - ctx.length, 0),
+        verify = False),
 )
 
 image_header_chunk = Struct("image_header",
@@ -340,7 +346,7 @@ image_header_chunk = Struct("image_header",
         adam7 = 1,
         _default_ = Pass,
     ),
-    UBInt32("crc"),
+    Checksum(UBInt32("crc"), "crc32", lambda ctx: (-17, 0), verify = False),
 )
 
 
@@ -352,3 +358,226 @@ png_file = Struct("png",
     image_header_chunk,
     Rename("chunks", GreedyRange(chunk)),
 )
+
+
+#===============================================================================
+# reading
+#===============================================================================
+class PngError(ConstructError):
+    __slots__ = []
+
+# the number of samples of a pixel of every color type
+channels = {
+    "greyscale" : 1,
+    "truecolor" : 3,
+    "indexed" : 1,
+    "greywithalpha" : 2,
+    "truewithalpha" : 4,
+}
+
+class PngChunk(object):
+    """
+    An entry of the chunk index of a PNG file.
+
+    * type - the type of the chunk
+    * offset - the offset of the data of the chunk in the file
+    * length - the length of the data
+    * crc - the CRC of the chunk, as stored
+    """
+    __slots__ = ["type", "offset", "length", "crc"]
+    def __init__(self, type, offset, length, crc):
+        self.type = type
+        self.offset = offset
+        self.length = length
+        self.crc = crc
+    def __repr__(self):
+        return "%s(%r, %d, %d)" % (self.__class__.__name__, self.type,
+            self.offset, self.length)
+
+class _ChunkStream(object):
+    """a read stream of the data of a sequence of chunks, one after the
+    other. it seeks before every read, so the file can be read elsewhere
+    in between."""
+    __slots__ = ["stream", "chunks", "index", "pos", "left"]
+    def __init__(self, stream, chunks):
+        self.stream = stream
+        self.chunks = chunks
+        self.index = 0
+        self.pos = 0
+        self.left = 0
+    def read(self, count):
+        while self.left == 0:
+            if self.index >= len(self.chunks):
+                return ""
+            chunk = self.chunks[self.index]
+            self.index += 1
+            self.pos = chunk.offset
+            self.left = chunk.length
+        self.stream.seek(self.pos)
+        data = self.stream.read(min(count, self.left))
+        if not data:
+            raise PngError("truncated chunk")
+        self.pos += len(data)
+        self.left -= len(data)
+        return data
+
+def _unfilter(filter_type, line, prev, bpp):
+    """reverses the filter of a scanline (an array of bytes), in place"""
+    if filter_type == 0:
+        return
+    n = len(line)
+    if filter_type == 1:
+        for i in xrange(bpp, n):
+            line[i] = (line[i] + line[i - bpp]) & 0xff
+    elif filter_type == 2:
+        for i in xrange(n):
+            line[i] = (line[i] + prev[i]) & 0xff
+    elif filter_type == 3:
+        for i in xrange(bpp):
+            line[i] = (line[i] + (prev[i] >> 1)) & 0xff
+        for i in xrange(bpp, n):
+            line[i] = (line[i] + ((line[i - bpp] + prev[i]) >> 1)) & 0xff
+    elif filter_type == 4:
+        for i in xrange(bpp):
+            line[i] = (line[i] + prev[i]) & 0xff
+        for i in xrange(bpp, n):
+            a = line[i - bpp]
+            b = prev[i]
+            c = prev[i - bpp]
+            p = a + b - c
+            pa = abs(p - a)
+            pb = abs(p - b)
+            pc = abs(p - c)
+            if pa <= pb and pa <= pc:
+                line[i] = (line[i] + a) & 0xff
+            elif pb <= pc:
+                line[i] = (line[i] + b) & 0xff
+            else:
+                line[i] = (line[i] + c) & 0xff
+    else:
+        raise PngError("bad filter type", filter_type)
+
+class PngReader(object):
+    """
+    Reads PNG files without loading them into memory (see png_file for
+    parsing them into containers). The chunks are indexed in a single pass
+    that skips over their data, and the image data is decompressed as it
+    is read, a scanline at a time.
+
+    Parameters:
+    * stream - a seekable stream, positioned at the start of the file
+    * verify_crc - whether to check the CRCs of the chunks while indexing
+      them (which reads their data). a PngError is raised on a mismatch.
+
+    Attributes:
+    * header - the parsed image header
+    * chunks - the chunk index, a list of PngChunk (IHDR included)
+
+    Example:
+    reader = PngReader(open("image.png", "rb"))
+    for row in reader.scanlines():
+        ...
+    """
+    __slots__ = ["stream", "start", "header", "chunks"]
+    signature = "\x89PNG\r\n\x1a\n"
+    chunk_header = struct.Struct(">I4s")
+    blocksize = 1 << 16
+
+    def __init__(self, stream, verify_crc = False):
+        self.stream = stream
+        self.start = stream.tell()
+        if stream.read(8) != self.signature:
+            raise PngError("not a PNG file")
+        self.chunks = []
+        self._index(verify_crc)
+        if not self.chunks or self.chunks[0].type != "IHDR":
+            raise PngError("no image header")
+        stream.seek(self.start + self.chunks[0].offset - 8)
+        try:
+            self.header = image_header_chunk.parse(stream.read(25))
+        except ConstructError, ex:
+            raise PngError("bad image header: %s" % (ex,))
+
+    def _index(self, verify_crc):
+        stream = self.stream
+        unpack = self.chunk_header.unpack
+        while True:
+            head = stream.read(8)
+            if not head:
+                raise PngError("no IEND chunk")
+            if len(head) < 8:
+                raise PngError("truncated chunk header")
+            length, type = unpack(head)
+            offset = stream.tell()
+            if verify_crc:
+                crc = zlib.crc32(type)
+                left = length
+                while left:
+                    data = stream.read(min(left, self.blocksize))
+                    if not data:
+                        raise PngError("truncated chunk", type)
+                    crc = zlib.crc32(data, crc)
+                    left -= len(data)
+            else:
+                stream.seek(length, 1)
+            tail = stream.read(4)
+            if len(tail) < 4:
+                raise PngError("truncated chunk", type)
+            stored = struct.unpack(">I", tail)[0]
+            if verify_crc and stored != crc & 0xffffffff:
+                raise PngError("CRC mismatch in chunk at %d" % (offset - 8,),
+                    type)
+            self.chunks.append(PngChunk(type, offset - self.start, length,
+                stored))
+            if type == "IEND":
+                break
+
+    def find(self, type):
+        """the index entries of the chunks of a type"""
+        return [chunk for chunk in self.chunks if chunk.type == type]
+
+    def read_chunk(self, chunk):
+        """the data of a chunk (an entry of the index)"""
+        self.stream.seek(self.start + chunk.offset)
+        data = self.stream.read(chunk.length)
+        if len(data) < chunk.length:
+            raise PngError("truncated chunk", chunk.type)
+        return data
+
+    def image_data(self):
+        """
+        A read stream of the decompressed image data: the data of all the
+        IDAT chunks, one after the other, decompressed as it is read.
+        """
+        chunks = [PngChunk(chunk.type, self.start + chunk.offset,
+            chunk.length, chunk.crc) for chunk in self.find("IDAT")]
+        return DecompressingReader(_ChunkStream(self.stream, chunks))
+
+    def scanlines(self):
+        """
+        Iterate over the rows of the image, top to bottom, with their
+        filters reversed: strings of the samples of the row, packed as in
+        the file (bit depths below 8 are several pixels to a byte, 16 bits
+        are big endian). Interlaced images are not supported.
+        """
+        header = self.header
+        if header.interlace_method != "none":
+            raise PngError("interlaced images are not supported")
+        if header.color_type not in channels:
+            raise PngError("bad color type", header.color_type)
+        bits = channels[header.color_type] * header.bit_depth
+        bpp = max(1, bits // 8)
+        size = (header.width * bits + 7) // 8
+        data = self.image_data()
+        prev = array("B", "\x00" * size)
+        try:
+            for y in xrange(header.height):
+                raw = data.read(size + 1)
+                if len(raw) < size + 1:
+                    raise PngError("image data ends at row %d" % (y,))
+                line = array("B", raw[1:])
+                _unfilter(ord(raw[0]), line, prev, bpp)
+                yield line.tostring()
+                prev = line
+        except zlib.error, ex:
+            raise PngError("bad image data: %s" % (ex,))
@@ -0,0 +1,312 @@
+"""
+Generation of random, valid objects from a construct.
+
+The generator walks a construct tree and makes up a value for every field,
+in the order the fields are built, keeping a context just like building
+does, so that lengths, counts and switch keys computed from earlier fields
+see the values that were made up for them. Enums, validators and constants
+are drawn from their domains; other adapters are fed random raw data, which
+is then decoded. Integers read by the functions of the construct (lengths,
+counts) are kept small, so generated records stay a reasonable size.
+
+Random values do not always satisfy every constraint of a schema (a length
+that must exceed another, a switch with no default), so every generated
+record is built through the normal build path, and records that fail are
+thrown away and generated again.
+"""
+from random import Random
+
+from core import ConstructError, Switch, Value, LazyBound
+from lib import Container, ListContainer, Context
+from schema import context_reads
+
+
+class GenerationError(ConstructError):
+    __slots__ = []
+
+_printable = "".join(chr(i) for i in range(0x20, 0x7f))
+# maps arbitrary bytes to printable characters, for strings with an encoding
+_to_printable = "".join(_printable[i % len(_printable)] for i in range(256))
+
+class Generator(object):
+    """
+    Makes up random objects for constructs. Generation of a construct is
+    dispatched to the ``_gen_<ClassName>`` method of the nearest class in the
+    construct's MRO, so subclasses can add support for their own constructs.
+
+    :param ``Construct`` con: the construct to generate objects for
+    :param seed: the seed of the random number generator
+    :param int max_length: the largest value given to integers that are read
+                           by the construct's functions, and the most extra
+                           elements given to ranges
+    :param int max_depth: the deepest recursion through ``LazyBound``
+    :param int attempts: how many times to try generating a valid record
+    :param bool verify: whether to check that built records parse back; when
+                        fields are placed by offsets (``Pointer``), random
+                        offsets can make fields overwrite each other
+    """
+    def __init__(self, con, seed = None, max_length = 16, max_depth = 8,
+                 attempts = 100, verify = True):
+        self.con = con
+        self.verify = verify
+        self.random = Random(seed)
+        self.max_length = max_length
+        self.max_depth = max_depth
+        self.attempts = attempts
+        self.reads = context_reads(con)
+        self.depth = 0
+
+    def record(self):
+        """
+        Generate a valid object and build it. Objects the construct fails
+        to build (or parse back) are generated again; any other error, of
+        the generator or of the construct's functions, is raised.
+
+        :returns: a tuple of (object, built data)
+        """
+        for i in xrange(self.attempts):
+            self.depth = 0
+            try:
+                obj = self.generate(self.con, Context())
+            except ConstructError:
+                continue
+            try:
+                data = self.con.build(obj)
+                if self.verify:
+                    self.con.parse(data)
+            except (ConstructError, ValueError):
+                # ValueError is what the streams raise for the negative
+                # lengths that random values can compute
+                continue
+            return obj, data
+        raise GenerationError("no valid object after %d attempts" %
+            (self.attempts,))
+
+    def generate(self, con, context):
+        """
+        Make up an object for a construct, in the given context.
+        """
+        for cls in type(con).__mro__:
+            method = getattr(self, "_gen_" + cls.__name__, None)
+            if method is not None:
+                return method(con, context)
+        raise GenerationError("don't know how to generate %r" % (con,))
+
+    def integer(self, name, bits, signed):
+        if name in self.reads:
+            return self.random.randint(0, min(self.max_length,
+                2 ** (bits - signed) - 1))
+        if signed:
+            return self.random.randint(-2 ** (bits - 1), 2 ** (bits - 1) - 1)
+        return self.random.randint(0, 2 ** bits - 1)
+
+    def bytes(self, length):
+        return "".join(chr(self.random.randint(0, 255))
+            for i in xrange(length))
+
+    def string(self, exclude = ""):
+        chars = _printable.translate(None, exclude)
+        return "".join(self.random.choice(chars)
+            for i in xrange(self.random.randint(0, self.max_length)))
+
+    # fields
+    def _gen_StaticField(self, con, context):
+        return self.bytes(con.length)
+    def _gen_MetaField(self, con, context):
+        return self.bytes(con.lengthfunc(context))
+    def _gen_CharRun(self, con, context):
+        return "".join(self.random.choice(con.charset) for i in
+            xrange(self.random.randint(con.mincount, con.mincount +
+            self.max_length)))
+    def _gen_TerminatedField(self, con, context):
+        obj = self.string(con.terminators)
+        if con.include_terminator:
+            obj += con.terminators[0]
+        return obj
+    def _gen_FormatField(self, con, context):
+        code = con.packer.format[-1]
+        if code in "fd":
+            value = self.random.uniform(-2.0 ** 16, 2.0 ** 16)
+            # round to what the field can hold
+            return con.packer.unpack(con.packer.pack(value))[0]
+        if code == "c":
+            return chr(self.random.randint(0, 255))
+        return self.integer(con.name, con.packer.size * 8, code.islower())
+
+    # adapters
+    def _gen_Subconstruct(self, con, context):
+        return self.generate(con.subcon, context)
+    def _gen_Adapter(self, con, context):
+        return con._decode(self.generate(con.subcon, context), context)
+    def _gen_BitIntegerAdapter(self, con, context):
+        return self.integer(con.name, con.width, con.signed)
+    def _gen_MappingAdapter(self, con, context):
+        if isinstance(con.subcon, Value):
+            # computed, so the mapped value is not ours to choose
+            return self._gen_Adapter(con, context)
+        return self.random.choice(sorted(con.decoding.values()))
+    def _gen_StringAdapter(self, con, context):
+        obj = self.generate(con.subcon, context)
+        if con.encoding:
+            obj = "".join(obj).translate(_to_printable)
+        return con._decode(obj, context)
+    def _gen_CStringAdapter(self, con, context):
+        obj = self.string(con.terminators)
+        if con.encoding:
+            obj = obj.decode(con.encoding)
+        return obj
+    def _gen_TunnelAdapter(self, con, context):
+        return self.generate(con.inner_subcon, context)
+    def _gen_ConstAdapter(self, con, context):
+        return con.value
+    def _gen_PaddingAdapter(self, con, context):
+        return None
+    def _gen_OneOf(self, con, context):
+        return self.random.choice(sorted(con.valids))
+    def _gen_NoneOf(self, con, context):
+        for i in xrange(self.attempts):
+            obj = self._gen_Adapter(con.subcon, context)
+            if obj not in con.invalids:
+                return obj
+        raise GenerationError("no valid value", con)
+
+    # arrays
+    def _gen_MetaArray(self, con, context):
+        return ListContainer(self.generate(con.subcon, context)
+            for i in xrange(con.countfunc(context)))
+    def _gen_Range(self, con, context):
+        count = self.random.randint(con.mincount,
+            min(con.maxcout, con.mincount + self.max_length))
+        return ListContainer(self.generate(con.subcon, context)
+            for i in xrange(count))
+    def _gen_RepeatUntil(self, con, context):
+        obj = []
+        for i in xrange(self.max_length):
+            subobj = self.generate(con.subcon, context)
+            obj.append(subobj)
+            if con.predicate(subobj, context):
+                return obj
+        raise GenerationError("no terminator", con)
+
+    # structures
+    def _gen_Struct(self, con, context):
+        if "<obj>" in context:
+            obj = context["<obj>"]
+            del context["<obj>"]
+        else:
+            obj = Container()
+            if con.nested:
+                context = Context(_ = context)
+        for sc in con.subcons:
+            if sc.conflags & con.FLAG_EMBED:
+                context["<obj>"] = obj
+                self.generate(sc, context)
+            elif sc.name is not None:
+                subobj = self.generate(sc, context)
+                obj[sc.name] = subobj
+                context[sc.name] = subobj
+        return obj
+    def _gen_Sequence(self, con, context):
+        if "<obj>" in context:
+            obj = context["<obj>"]
+            del context["<obj>"]
+        else:
+            obj = ListContainer()
+            if con.nested:
+                context = Context(_ = context)
+        for sc in con.subcons:
+            if sc.conflags & con.FLAG_EMBED:
+                context["<obj>"] = obj
+                self.generate(sc, context)
+            elif sc.name is not None:
+                subobj = self.generate(sc, context)
+                obj.append(subobj)
+                context[sc.name] = subobj
+        return obj
+    def _gen_Union(self, con, context):
+        return self.generate(con.builder, context)
+
+    # conditionals
+    def _gen_Switch(self, con, context):
+        if con.include_key:
+            key = self.random.choice(sorted(con.cases))
+            return key, self.generate(con.cases[key], context)
+        case = con.cases.get(con.keyfunc(context), con.default)
+        if case is Switch.NoDefault:
+            raise GenerationError("no case for key", con)
+        return self.generate(case, context)
+    def _gen_Select(self, con, context):
+        subcons = con.subcons
+        if self.depth >= self.max_depth:
+            # prefer alternatives that do not recurse
+            subcons = [sc for sc in subcons
+                if not isinstance(sc, LazyBound)] or subcons
+        sc = self.random.choice(subcons)
+        obj = self.generate(sc, context)
+        if con.include_name:
+            return sc.name, obj
+        return obj
+
+    # miscellaneous
+    def _gen_LazyBound(self, con, context):
+        if con.bound is None:
+            con.bound = con.bindfunc()
+        if self.depth >= self.max_depth:
+            raise GenerationError("too deep", con)
+        self.depth += 1
+        try:
+            return self.generate(con.bound, context)
+        finally:
+            self.depth -= 1
+    def _gen_Value(self, con, context):
+        return con.func(context)
+    def _gen_Anchor(self, con, context):
+        return None
+    def _gen_Pass(self, con, context):
+        return None
+    def _gen_Terminator(self, con, context):
+        return None
+
+
+def generate(con, seed = None, count = 1, **kw):
+    """
+    Generate random, valid objects for a construct. Every object is known to
+    build.
+
+    :param ``Construct`` con: the construct
+    :param seed: the seed of the random number generator; the same seed
+                 generates the same objects
+    :param int count: the number of objects
+    :param kw: further options of ``Generator``
+
+    :returns: an iterator of objects
+
+    >>> list(generate(Struct("foo", UBInt8("a"), Flag("b")), seed = 1, count = 2))
+    [Container({'a': 34, 'b': True}), Container({'a': 195, 'b': False})]
+    """
+
+    gen = Generator(con, seed, **kw)
+    for i in xrange(count):
+        yield gen.record()[0]
+
+def generate_stream(con, stream, seed = None, count = 1, **kw):
+    """
+    Generate random, valid records for a construct and write them one after
+    the other to a stream, without holding more than one in memory.
+
+    :param ``Construct`` con: the construct
+    :param stream: a writable file-like object
+    :param seed: the seed of the random number generator
+    :param int count: the number of records
+    :param kw: further options of ``Generator``
+
+    :returns: the number of bytes written
+    """
+
+    gen = Generator(con, seed, **kw)
+    size = 0
+    for i in xrange(count):
+        data = gen.record()[1]
+        stream.write(data)
+        size += len(data)
+    return size
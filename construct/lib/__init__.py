@@ -1,7 +1,7 @@
 from binary import int_to_bin, bin_to_int, swap_bytes, encode_bin, decode_bin
 from bitstream import BitStreamReader, BitStreamWriter
 from container import (Container, FlagsContainer, ListContainer,
-                       LazyContainer)
+                       LazyContainer, Context)
 from hex import HexString, hexdump
 
 try:
@@ -0,0 +1,211 @@
+"""
+streams that decompress or compress incrementally, so that compressed data
+of any size can be parsed or built in constant memory
+"""
+
+
+def _zlib_codec(wbits):
+    import zlib
+    wbits = wbits(zlib.MAX_WBITS)
+    return (
+        lambda: zlib.decompressobj(wbits),
+        lambda level: zlib.compressobj(-1 if level is None else level,
+            zlib.DEFLATED, wbits),
+        zlib.error,
+    )
+
+def _bz2_codec():
+    import bz2
+    return (
+        lambda: bz2.BZ2Decompressor(),
+        lambda level: bz2.BZ2Compressor(9 if level is None else level),
+        IOError,
+    )
+
+# the codecs, by name: functions that import the module of the codec and
+# return a function making a decompressor, one making a compressor (taking
+# the compression level, or None for the default of the codec), and the
+# exception raised for bad data
+codecs = {
+    "zlib" : lambda: _zlib_codec(lambda wbits: wbits),
+    "gzip" : lambda: _zlib_codec(lambda wbits: 16 + wbits),
+    "deflate" : lambda: _zlib_codec(lambda wbits: -wbits),
+    "bz2" : _bz2_codec,
+}
+_resolved = {}
+
+def resolve_codec(name):
+    """
+    The decompressor maker, compressor maker and error of a codec (see
+    codecs); its module is imported the first time.
+    """
+    try:
+        return _resolved[name]
+    except KeyError:
+        codec = _resolved[name] = codecs[name]()
+        return codec
+
+class DecompressingReader(object):
+    """
+    A read stream of the decompressed data of a compressed stream. The
+    compressed data is read a block at a time, and decompressed as it is
+    read from; the last window bytes read are kept, so the stream can be
+    seeked back within them (as repeaters and terminated fields do).
+
+    The compressed data ends where its codec says it does, or after length
+    bytes. When the stream is closed, the underlying stream is left at the
+    end of the compressed data: the rest of it is read, and what was read
+    beyond it is seeked back over.
+
+    Parameters:
+    * stream - the underlying stream
+    * codec - the name of the codec (see codecs)
+    * length - the number of bytes of compressed data, or None for the
+      end marked by the codec
+    * blocksize - the number of bytes read from the underlying stream, and
+      the most decompressed at once
+    * window - the number of bytes kept for seeking back
+    """
+    __slots__ = ["stream", "decompressor", "remaining", "blocksize",
+        "window", "buffer", "base", "pos", "eof", "unused"]
+    def __init__(self, stream, codec = "zlib", length = None,
+                 blocksize = 1 << 16, window = 1 << 16):
+        self.stream = stream
+        self.decompressor = resolve_codec(codec)[0]()
+        self.remaining = length
+        self.blocksize = blocksize
+        self.window = window
+        # the decompressed data from position base on
+        self.buffer = ""
+        self.base = 0
+        self.pos = 0
+        self.eof = False
+        # compressed data read past the end
+        self.unused = ""
+
+    def _decompress(self):
+        """the next piece of decompressed data, or "" at the end"""
+        decompressor = self.decompressor
+        while not self.eof:
+            data = getattr(decompressor, "unconsumed_tail", "")
+            if not data:
+                size = self.blocksize
+                if self.remaining is not None:
+                    size = min(size, self.remaining)
+                data = self.stream.read(size) if size > 0 else ""
+                if self.remaining is not None:
+                    self.remaining -= len(data)
+                if not data:
+                    self.eof = True
+                    if hasattr(decompressor, "flush"):
+                        return decompressor.flush()
+                    return ""
+            try:
+                if hasattr(decompressor, "unconsumed_tail"):
+                    out = decompressor.decompress(data, self.blocksize)
+                else:
+                    out = decompressor.decompress(data)
+            except EOFError:
+                # bz2, past its end
+                out = ""
+                self.unused = data
+                self.eof = True
+            else:
+                if decompressor.unused_data:
+                    self.unused = decompressor.unused_data
+                    self.eof = True
+            if out:
+                return out
+        return ""
+
+    def read(self, count = -1):
+        chunks = []
+        while count != 0:
+            offset = self.pos - self.base
+            if offset < len(self.buffer):
+                if count < 0:
+                    data = self.buffer[offset:]
+                else:
+                    data = self.buffer[offset:offset + count]
+                    count -= len(data)
+                chunks.append(data)
+                self.pos += len(data)
+                continue
+            out = self._decompress()
+            if not out:
+                break
+            keep = self.buffer[max(0, len(self.buffer) - self.window):]
+            self.base += len(self.buffer) - len(keep)
+            self.buffer = keep + out
+        return "".join(chunks)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence = 0):
+        if whence == 1:
+            pos += self.pos
+        elif whence != 0:
+            raise IOError("can't seek from the end of a decompressed stream")
+        if pos < self.base:
+            raise IOError("can't seek back beyond the window", pos)
+        if pos <= self.base + len(self.buffer):
+            self.pos = pos
+            return
+        self.pos = self.base + len(self.buffer)
+        while self.pos < pos:
+            if not self.read(min(pos - self.pos, self.blocksize)):
+                break
+
+    def close(self):
+        """leave the underlying stream at the end of the compressed data"""
+        while self._decompress():
+            pass
+        self.buffer = ""
+        if self.remaining is not None:
+            # the compressed data is length bytes, whatever the codec says
+            if self.remaining > 0:
+                self.stream.read(self.remaining)
+                self.remaining = 0
+        elif self.unused:
+            self.stream.seek(-len(self.unused), 1)
+        self.unused = ""
+
+class CompressingWriter(object):
+    """
+    A write stream that compresses what is written to it into the
+    underlying stream, a piece at a time. Closing it writes the rest of the
+    compressed data (but does not close the underlying stream).
+
+    Parameters:
+    * stream - the underlying stream
+    * codec - the name of the codec (see codecs)
+    * level - the compression level, or None for the default of the codec
+
+    Attributes:
+    * size - the number of bytes of compressed data written so far
+    """
+    __slots__ = ["stream", "compressor", "pos", "size"]
+    def __init__(self, stream, codec = "zlib", level = None):
+        self.stream = stream
+        self.compressor = resolve_codec(codec)[1](level)
+        self.pos = 0
+        self.size = 0
+
+    def write(self, data):
+        self.pos += len(data)
+        out = self.compressor.compress(data)
+        if out:
+            self.stream.write(out)
+            self.size += len(out)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence = 0):
+        raise IOError("can't seek in a compressing stream")
+
+    def close(self):
+        out = self.compressor.flush()
+        self.stream.write(out)
+        self.size += len(out)
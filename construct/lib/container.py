@@ -85,6 +85,71 @@ class Container(object, DictMixin):
     def __str__(self):
         return "%s(%s)" % (self.__class__.__name__, str(self.__dict__))
 
+class Context(Container):
+    """
+    A container for parsing and building contexts.
+
+    Copies of a context share their contents with the original until either
+    of them is modified, so copying is cheap no matter how large the context
+    is; only the first modification after a copy duplicates the contents.
+    While the contents are shared, both contexts are of the private class
+    _SharedContext, which does the duplication; a context that is not shared
+    costs no more than a Container.
+    """
+
+    __slots__ = []
+
+    def copy(self):
+        other = object.__new__(_SharedContext)
+        object.__setattr__(other, "__dict__", self.__dict__)
+        object.__setattr__(self, "__class__", _SharedContext)
+        return other
+
+    __copy__ = copy
+
+    def __repr__(self):
+        return "Context(%s)" % (repr(self.__dict__),)
+
+    def __str__(self):
+        return "Context(%s)" % (str(self.__dict__),)
+
+class _SharedContext(Context):
+    """
+    A context whose contents are shared with copies of it. Modifications
+    duplicate the contents first, and turn it back into a plain Context.
+    """
+
+    __slots__ = []
+
+    def _unshare(self):
+        object.__setattr__(self, "__dict__", dict(self.__dict__))
+        object.__setattr__(self, "__class__", Context)
+
+    def __setitem__(self, name, value):
+        self._unshare()
+        self.__dict__[name] = value
+
+    def __delitem__(self, name):
+        self._unshare()
+        del self.__dict__[name]
+
+    def __setattr__(self, name, value):
+        self._unshare()
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        self._unshare()
+        object.__delattr__(self, name)
+
+    def update(self, other):
+        if getattr(other, "__dict__", None) is self.__dict__:
+            # a copy that was never modified
+            return
+        self._unshare()
+        self.__dict__.update(other)
+
+    __update__ = update
+
 class FlagsContainer(Container):
     """
     A container providing pretty-printing for flags.
@@ -0,0 +1,60 @@
+"""
+Modules whose attributes are imported on first access.
+"""
+import sys
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    A module whose attributes are imported from other modules the first
+    time they are accessed, so that importing a package does not import
+    (and build the constructs of) all of its modules.
+
+    Use ``install()`` at the end of a package's ``__init__``.
+
+    :param ``ModuleType`` module: the module being replaced
+    :param dict attrs: maps attribute names to the module they are imported
+                       from, relative to the package, or to a (module,
+                       attribute) pair
+    """
+
+    def __init__(self, module, attrs):
+        ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # the replaced module must be kept alive, or Python 2 would clear
+        # the globals of the functions defined in it
+        self.__module = module
+        self.__attrs = attrs
+
+    def __getattr__(self, name):
+        try:
+            target = self.__attrs[name]
+        except KeyError:
+            raise AttributeError("module %r has no attribute %r" %
+                (self.__name__, name))
+        if isinstance(target, tuple):
+            modname, attr = target
+        else:
+            modname, attr = target, None
+        modname = "%s.%s" % (self.__name__, modname)
+        __import__(modname)
+        value = sys.modules[modname]
+        if attr is not None:
+            value = getattr(value, attr)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self.__attrs))
+
+    @classmethod
+    def install(cls, name, attrs):
+        """
+        Replace the module of the given name with a lazy module.
+
+        :param str name: name of the module, usually ``__name__``
+        :param dict attrs: see ``LazyModule``
+        """
+
+        sys.modules[name] = cls(sys.modules[name], attrs)
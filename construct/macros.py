@@ -1,7 +1,7 @@
 from construct.lib import BitStreamReader, BitStreamWriter, encode_bin, decode_bin
 from construct.core import (Struct, MetaField, StaticField, FormatField,
     OnDemand, Pointer, Switch, Value, RepeatUntil, MetaArray, Sequence, Range,
-    Select, Pass, SizeofError, Buffered, Restream, Reconfig)
+    Select, Pass, SizeofError, Buffered, Restream, Reconfig, TerminatedField)
 from construct.adapters import (BitIntegerAdapter, PaddingAdapter,
     ConstAdapter, CStringAdapter, LengthValueAdapter, IndexingAdapter,
     PaddedStringAdapter, FlagsAdapter, StringAdapter, MappingAdapter)
@@ -568,11 +568,13 @@ def CString(name, terminators="\x00", encoding=None,
     'helloX'
     """
 
+    if type(char_field) is StaticField and char_field.length == 1:
+        # plain bytes can be scanned for the terminator in bulk
+        chars = TerminatedField(None, terminators, include_terminator=True)
+    else:
+        chars = RepeatUntil(lambda obj, ctx: obj in terminators, char_field)
     return Rename(name,
-        CStringAdapter(
-            RepeatUntil(lambda obj, ctx: obj in terminators,
-                char_field,
-            ),
+        CStringAdapter(chars,
             terminators=terminators,
             encoding=encoding,
         )
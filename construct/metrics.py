@@ -0,0 +1,295 @@
+"""
+Metrics for monitoring constructs in production: calls, bytes, errors by
+class and latency histograms, dumpable as a dict or in the Prometheus text
+exposition format.
+"""
+import os
+from time import time
+from threading import Lock
+from tempfile import mkstemp
+
+from core import Subconstruct
+
+
+# the number of bits of each hex digit
+_digit_bits = dict(zip("0123456789abcdef",
+    (0, 1, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 4, 4, 4, 4)))
+
+def _bit_length(value):
+    """the bit length of an int (int.bit_length needs Python 2.7)"""
+    digits = "%x" % abs(value)
+    return (len(digits) - 1) * 4 + _digit_bits[digits[0]]
+
+class Histogram(object):
+    """
+    A latency histogram with buckets of bounded relative width, in the
+    manner of HDR histograms: values are recorded in microseconds, and
+    every value above ``2 ** precision`` falls in a bucket whose width is at
+    most ``2 ** (1 - precision)`` of its lower bound.
+
+    :param int precision: number of significant bits kept per value
+    """
+    __slots__ = ["precision", "counts", "count", "sum", "min", "max"]
+    def __init__(self, precision = 5):
+        self.precision = precision
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+    def __repr__(self):
+        return "%s(count = %d)" % (self.__class__.__name__, self.count)
+
+    def record(self, seconds):
+        """
+        Record a duration, in seconds.
+        """
+        value = int(seconds * 1e6)
+        shift = _bit_length(value) - self.precision
+        if shift > 0:
+            value = value >> shift << shift
+        self.counts[value] = self.counts.get(value, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """
+        The duration (in seconds) below which the given fraction of the
+        recorded durations lie. This is the upper bound of the bucket the
+        percentile falls in, so it errs on the high side.
+
+        :param float q: the fraction, between 0 and 1
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen >= rank:
+                width = 1 << max(_bit_length(value) - self.precision, 0)
+                return min((value + width) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count" : self.count,
+            "sum" : self.sum,
+            "min" : self.min,
+            "max" : self.max,
+            "buckets" : dict((value / 1e6, count)
+                for value, count in self.counts.iteritems()),
+        }
+
+class MetricsCollector(object):
+    """
+    The metrics of a construct: counts of parse and build calls, bytes
+    consumed and produced, exceptions by class, and latency histograms.
+    Collectors are thread-safe.
+
+    :param str name: the name the metrics are labeled with
+    :param int precision: the precision of the latency histograms
+    """
+    quantiles = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, name, precision = 5):
+        self.name = name
+        self.precision = precision
+        self.lock = Lock()
+        self.reset()
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.name)
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.calls = {"parse" : 0, "build" : 0}
+            self.bytes = {"parse" : 0, "build" : 0}
+            self.errors = {}
+            self.latency = {"parse" : Histogram(self.precision),
+                "build" : Histogram(self.precision)}
+        finally:
+            self.lock.release()
+
+    def record(self, operation, seconds, size, error = None):
+        """
+        Record a call.
+
+        :param str operation: "parse" or "build"
+        :param float seconds: the duration of the call
+        :param int size: the number of bytes consumed or produced, or None
+        :param error: the exception the call raised, if any
+        """
+        self.lock.acquire()
+        try:
+            self.calls[operation] += 1
+            if size is not None:
+                self.bytes[operation] += size
+            if error is not None:
+                key = (operation, error.__class__.__name__)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            self.latency[operation].record(seconds)
+        finally:
+            self.lock.release()
+
+    def to_dict(self):
+        self.lock.acquire()
+        try:
+            return {
+                "name" : self.name,
+                "calls" : dict(self.calls),
+                "bytes" : dict(self.bytes),
+                "errors" : dict(("%s:%s" % key, count)
+                    for key, count in self.errors.iteritems()),
+                "latency" : dict((op, h.to_dict())
+                    for op, h in self.latency.iteritems()),
+            }
+        finally:
+            self.lock.release()
+
+    def samples(self):
+        """
+        The metrics as Prometheus samples: a list of tuples of (family,
+        type, help, suffix, labels, value).
+        """
+        name = self.name
+        samples = []
+        self.lock.acquire()
+        try:
+            for op in ("parse", "build"):
+                samples.append(("construct_%s_total" % op, "counter",
+                    "Number of %s calls." % op, "", {"construct" : name},
+                    self.calls[op]))
+                samples.append(("construct_%s_bytes_total" % op, "counter",
+                    "Number of bytes %s." % ("consumed by parsing"
+                    if op == "parse" else "produced by building"),
+                    "", {"construct" : name}, self.bytes[op]))
+            for (op, error), count in sorted(self.errors.iteritems()):
+                samples.append(("construct_errors_total", "counter",
+                    "Number of exceptions raised, by class.", "",
+                    {"construct" : name, "operation" : op, "error" : error},
+                    count))
+            for op in ("parse", "build"):
+                family = "construct_%s_seconds" % op
+                help = "Latency of %s calls." % op
+                h = self.latency[op]
+                for q in self.quantiles:
+                    samples.append((family, "summary", help, "",
+                        {"construct" : name, "quantile" : str(q)},
+                        h.percentile(q)))
+                samples.append((family, "summary", help, "_sum",
+                    {"construct" : name}, h.sum))
+                samples.append((family, "summary", help, "_count",
+                    {"construct" : name}, h.count))
+        finally:
+            self.lock.release()
+        return samples
+
+def _escape(value):
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+        .replace('"', '\\"'))
+
+def _format(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def prometheus_text(*collectors):
+    """
+    The metrics of the given collectors, in the Prometheus text exposition
+    format.
+    """
+    families = []
+    samples = {}
+    for collector in collectors:
+        for family, type, help, suffix, labels, value in collector.samples():
+            if family not in samples:
+                families.append((family, type, help))
+                samples[family] = []
+            samples[family].append((suffix, labels, value))
+    lines = []
+    for family, type, help in families:
+        lines.append("# HELP %s %s" % (family, help))
+        lines.append("# TYPE %s %s" % (family, type))
+        for suffix, labels, value in samples[family]:
+            labels = ",".join('%s="%s"' % (k, _escape(v))
+                for k, v in sorted(labels.iteritems()))
+            lines.append("%s%s{%s} %s" % (family, suffix, labels,
+                _format(value)))
+    return "".join(line + "\n" for line in lines)
+
+def write_prometheus(path, *collectors):
+    """
+    Write the metrics of the given collectors to a file, in the Prometheus
+    text exposition format (e.g. for the textfile collector of the node
+    exporter). The file is replaced atomically.
+    """
+    fd, tmppath = mkstemp(dir = os.path.dirname(os.path.abspath(path)),
+        suffix = ".tmp")
+    try:
+        f = os.fdopen(fd, "w")
+        try:
+            f.write(prometheus_text(*collectors))
+        finally:
+            f.close()
+        os.rename(tmppath, path)
+    except:
+        os.unlink(tmppath)
+        raise
+
+class Metrics(Subconstruct):
+    """
+    Collects metrics of the parsing and building of a subcon. See
+    MetricsCollector.
+
+    Parameters:
+    * subcon - the subcon to monitor
+    * collector - the MetricsCollector to record to. default is a new one,
+      named after the subcon.
+
+    Example:
+    packet = Metrics(ip_stack)
+    packet.parse(data)
+    write_prometheus("/var/lib/node_exporter/construct.prom",
+        packet.collector)
+    """
+    __slots__ = ["collector"]
+    def __init__(self, subcon, collector = None):
+        Subconstruct.__init__(self, subcon)
+        if collector is None:
+            collector = MetricsCollector(subcon.name or
+                subcon.__class__.__name__)
+        self.collector = collector
+    def _parse(self, stream, context):
+        start = time()
+        try:
+            pos = stream.tell()
+        except Exception:
+            pos = None
+        try:
+            obj = self.subcon._parse(stream, context)
+        except Exception, ex:
+            self.collector.record("parse", time() - start, None, ex)
+            raise
+        size = None if pos is None else stream.tell() - pos
+        self.collector.record("parse", time() - start, size)
+        return obj
+    def _build(self, obj, stream, context):
+        start = time()
+        try:
+            pos = stream.tell()
+        except Exception:
+            pos = None
+        try:
+            self.subcon._build(obj, stream, context)
+        except Exception, ex:
+            self.collector.record("build", time() - start, None, ex)
+            raise
+        size = None if pos is None else stream.tell() - pos
+        self.collector.record("build", time() - start, size)
@@ -0,0 +1,158 @@
+"""
+Parallel parsing of independent records.
+
+Many formats are a header followed by a long run of self-contained records
+(packets in a capture file, records in a metafile). Once the offsets of the
+records are known, each record can be parsed on its own, so the work can be
+spread across a pool of processes. Every worker maps the source file once and
+parses its share of records straight out of the mapping.
+
+The construct and the callbacks are handed to the workers as the arguments of
+their initializer, which are inherited by forking, so they may freely contain
+lambdas; the parsed objects are sent back to the parent
+and must be picklable (``LazyContainer`` objects are not).
+"""
+import mmap
+from multiprocessing import Pool, cpu_count
+
+from lib import Context
+
+
+# in a worker process: the record construct and the mapping of the source
+# file
+_worker = None
+
+def _open_source(source):
+    if not isinstance(source, basestring):
+        source = source.name
+    f = open(source, "rb")
+    try:
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+def _init_worker(subcon, source):
+    global _worker
+    _worker = (subcon, _open_source(source))
+
+def _parse_chunk(offsets):
+    subcon, stream = _worker
+    results = []
+    for offset in offsets:
+        stream.seek(offset)
+        results.append(subcon._parse(stream, Context()))
+    return results
+
+def _chunks(offsets, chunksize):
+    chunk = []
+    for offset in offsets:
+        chunk.append(offset)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iparse_parallel(subcon, source, offsets, workers = None, chunksize = 256,
+                    ordered = True):
+    """
+    Parse records at the given offsets of a file using a process pool,
+    yielding the parsed objects as they become available.
+
+    :param ``Construct`` subcon: the record construct
+    :param source: a file name, or a file object with a ``name``
+    :param iterable offsets: absolute offsets of the records in the file
+    :param int workers: number of worker processes; defaults to the number
+                        of CPUs
+    :param int chunksize: number of records handed to a worker at a time
+    :param bool ordered: whether to yield records in the order of
+                         ``offsets``; unordered results arrive sooner
+    """
+
+    if workers is None:
+        workers = cpu_count()
+    if not isinstance(source, basestring):
+        source = source.name
+    pool = Pool(workers, _init_worker, (subcon, source))
+    try:
+        if ordered:
+            results = pool.imap(_parse_chunk, _chunks(offsets, chunksize))
+        else:
+            results = pool.imap_unordered(_parse_chunk,
+                _chunks(offsets, chunksize))
+        for chunk in results:
+            for obj in chunk:
+                yield obj
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+def parse_parallel(subcon, source, offsets, workers = None, chunksize = 256,
+                   reducer = None, initial = None):
+    """
+    Parse records at the given offsets of a file using a process pool.
+
+    Without a reducer, the parsed records are returned as a list, in the
+    order of ``offsets``. With a reducer, the records are folded into an
+    accumulator as they arrive, so they never need to be held in memory all
+    at once.
+
+    :param ``Construct`` subcon: the record construct
+    :param source: a file name, or a file object with a ``name``
+    :param iterable offsets: absolute offsets of the records in the file
+    :param int workers: number of worker processes; defaults to the number
+                        of CPUs
+    :param int chunksize: number of records handed to a worker at a time
+    :param callable reducer: a function taking (accumulator, record) and
+                             returning the new accumulator
+    :param initial: the initial accumulator for ``reducer``
+
+    >>> offsets = record_offsets("capture.cap", 24, packet_size) # doctest: +SKIP
+    >>> parse_parallel(packet, "capture.cap", offsets) # doctest: +SKIP
+    """
+
+    records = iparse_parallel(subcon, source, offsets, workers = workers,
+        chunksize = chunksize)
+    if reducer is None:
+        return list(records)
+    acc = initial
+    for obj in records:
+        acc = reducer(acc, obj)
+    return acc
+
+def record_offsets(source, start, sizefunc, end = None):
+    """
+    Find the offsets of consecutive records in a file, without parsing
+    them. This is the cheap sequential pass that precedes the parallel one.
+
+    :param source: a file name, or a file object with a ``name``
+    :param int start: offset of the first record
+    :param callable sizefunc: a function taking the mapped file and the
+                              offset of a record, and returning the size of
+                              that record (usually by reading a length field)
+    :param int end: offset where the records end; defaults to end of file
+
+    >>> def packet_size(data, offset):
+    ...     return 16 + ULInt32(None).parse(data[offset + 8:offset + 12])
+    >>> record_offsets("capture.cap", 24, packet_size) # doctest: +SKIP
+    """
+
+    mapped = _open_source(source)
+    try:
+        if end is None:
+            end = len(mapped)
+        offsets = []
+        offset = start
+        while offset < end:
+            offsets.append(offset)
+            size = sizefunc(mapped, offset)
+            if size <= 0:
+                raise ValueError("record size must be positive", size)
+            offset += size
+        return offsets
+    finally:
+        mapped.close()
@@ -2,3 +2,16 @@
 protocols - a collection of network protocols
 unlike the formats package, protocols convey information between two sides
 """
+from construct.lib.lazymodule import LazyModule
+
+
+LazyModule.install(__name__, {
+    "application"    : "application",
+    "layer2"         : "layer2",
+    "layer3"         : "layer3",
+    "layer4"         : "layer4",
+    "ipstack"        : "ipstack",
+    "tcpip"          : "tcpip",
+    "ip_stack"       : ("ipstack", "ip_stack"),
+    "TcpReassembler" : ("tcpip", "TcpReassembler"),
+})
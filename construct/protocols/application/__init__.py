@@ -1,4 +1,14 @@
 """
 application layer (various) protocols
 """
+from construct.lib.lazymodule import LazyModule
 
+
+LazyModule.install(__name__, {
+    "dns"            : "dns",
+    "http"           : "http",
+    "telnet"         : "telnet",
+    "http_session"   : ("http", "http_session"),
+    "HttpParser"     : ("http", "HttpParser"),
+    "telnet_session" : ("telnet", "telnet_session"),
+})
@@ -114,6 +114,12 @@ dns = Struct("dns",
     ),
 )
 
+# over TCP, every message is prefixed by its length
+dns_tcp = Struct("dns_tcp",
+    UBInt16("length"),
+    TunnelAdapter(Field("dns", lambda ctx: ctx.length), dns),
+)
+
 
 if __name__ == "__main__":
     cap1 = (
@@ -46,8 +46,8 @@ http_request = Struct("request",
     lineterm,
 )
 
-# reply: header (answer and params) and data
-http_reply = Struct("reply",
+# reply header: answer and params
+http_reply_header = Struct("reply",
     Literal("HTTP/"),
     StringUpto("version", " "),
     space,
@@ -57,6 +57,11 @@ http_reply = Struct("reply",
     lineterm,
     http_params,
     lineterm,
+)
+
+# reply: header and data
+http_reply = Struct("reply",
+    Embedded(http_reply_header),
     HexDumpAdapter(
         Field("data", lambda ctx: int(ctx["params"]["Content-length"]))
     ),
@@ -69,6 +74,300 @@ http_session = Struct("session",
 )
 
 
+
+#===============================================================================
+# streaming
+#===============================================================================
+class HttpError(ConstructError):
+    __slots__ = []
+
+# chunked transfer coding: 'size[;extensions]\r\n'
+http_chunk_header = Struct("chunk",
+    HexNumber("size"),
+    StringUpto("extensions", "\r"),
+    lineterm,
+)
+
+def _body_length(header, replies):
+    """the length of the body of a message: None if it is chunked, or -1 if
+    it extends to the end of the stream"""
+    encoding = _header(header["params"], "Transfer-Encoding")
+    if encoding is not None and encoding.strip().lower() != "identity":
+        return None
+    length = _header(header["params"], "Content-Length")
+    if length is not None:
+        try:
+            return int(length)
+        except ValueError:
+            raise HttpError("bad Content-Length", length)
+    if not replies or header["code"] // 100 == 1 or \
+            header["code"] in (204, 304):
+        return 0
+    # delimited by the closing of the connection
+    return -1
+
+class HttpChunkedAdapter(Adapter):
+    """joins the chunks of a chunked body; builds it as a single chunk"""
+    def _encode(self, obj, context):
+        chunks = []
+        if obj:
+            chunks.append(Container(size = len(obj), extensions = "",
+                data = obj))
+        chunks.append(Container(size = 0, extensions = "", data = ""))
+        return Container(chunks = chunks, trailers = {})
+    def _decode(self, obj, context):
+        return "".join(chunk.data for chunk in obj.chunks)
+
+class HttpRemainder(Construct):
+    """the rest of the stream"""
+    def _parse(self, stream, context):
+        return stream.read()
+    def _build(self, obj, stream, context):
+        stream.write(obj)
+
+http_chunk = Struct("chunks",
+    Embedded(http_chunk_header),
+    Field("data", lambda ctx: ctx.size),
+    If(lambda ctx: ctx.size, lineterm),
+)
+
+http_chunked_data = HttpChunkedAdapter(
+    Struct("data",
+        RepeatUntil(lambda obj, ctx: obj.size == 0, http_chunk),
+        Rename("trailers", http_params),
+        lineterm,
+    )
+)
+
+def HttpData(replies):
+    """the body of a message, as given by its params"""
+    return Switch("data", lambda ctx: _body_length(ctx, replies),
+        {
+            None : http_chunked_data,
+            -1 : HttpRemainder("data"),
+        },
+        default = Field("data", lambda ctx: _body_length(ctx, replies)),
+    )
+
+# whole messages: headers and bodies
+http_request_message = Struct("request",
+    Embedded(http_request),
+    HttpData(False),
+)
+
+http_reply_message = Struct("reply",
+    Embedded(http_reply_header),
+    HttpData(True),
+)
+
+_compiled_request = compile_regular(http_request)
+_compiled_reply_header = compile_regular(http_reply_header)
+
+class HttpStream(object):
+    """
+    A buffered reader over a stream of HTTP messages (a socket file, or a
+    reassembled TCP stream). Only the underlying stream's read() is used,
+    and no more than a block is buffered beyond what is being parsed.
+
+    Parameters:
+    * stream - the underlying stream
+    * blocksize - the size of the reads from the underlying stream
+    """
+    __slots__ = ["stream", "blocksize", "buffer", "pos"]
+    def __init__(self, stream, blocksize = 65536):
+        self.stream = stream
+        self.blocksize = blocksize
+        self.buffer = ""
+        self.pos = 0
+    def _fill(self):
+        data = self.stream.read(self.blocksize)
+        if not data:
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+    def read_until(self, delimiter, limit):
+        """
+        Read up to and including the delimiter. Raises HttpError if the
+        delimiter is not found within limit bytes, and returns what is left
+        of the stream if it ends first.
+        """
+        start = self.pos
+        while True:
+            index = self.buffer.find(delimiter, start)
+            if index >= 0:
+                end = index + len(delimiter)
+                break
+            if len(self.buffer) - self.pos > limit:
+                raise HttpError("no %r within %d bytes" % (delimiter, limit))
+            # the delimiter may straddle the end of the buffer; filling
+            # moves what is left of it to the start
+            offset = max(len(self.buffer) - len(delimiter) + 1, self.pos)
+            offset -= self.pos
+            if not self._fill():
+                end = len(self.buffer)
+                break
+            start = offset
+        if end - self.pos > limit:
+            raise HttpError("no %r within %d bytes" % (delimiter, limit))
+        data = self.buffer[self.pos:end]
+        self.pos = end
+        return data
+    def read(self, count = -1):
+        """
+        Read up to count bytes (all of the rest if count is negative). Like
+        the read of a socket, this may return fewer bytes than asked for,
+        and returns an empty string only at the end of the stream.
+        """
+        if count < 0:
+            data = [self.buffer[self.pos:]]
+            self.buffer = ""
+            self.pos = 0
+            while True:
+                block = self.stream.read(self.blocksize)
+                if not block:
+                    return "".join(data)
+                data.append(block)
+        if self.pos == len(self.buffer) and not self._fill():
+            return ""
+        data = self.buffer[self.pos:self.pos + count]
+        self.pos += len(data)
+        return data
+    def at_eof(self):
+        return self.pos == len(self.buffer) and not self._fill()
+
+def _header(params, name):
+    name = name.lower()
+    for key, value in params.iteritems():
+        if key.lower() == name:
+            return value
+    return None
+
+class HttpBody(object):
+    """
+    The body of an HTTP message, as a file-like object that reads it from
+    the HttpStream as it is consumed. Chunked bodies are decoded.
+
+    Parameters:
+    * stream - the HttpStream, positioned at the start of the body
+    * length - the length of the body, None if it is chunked, or -1 if it
+      extends to the end of the stream
+    * max_line - the longest chunk header allowed
+    """
+    __slots__ = ["stream", "remaining", "chunked", "max_line", "done"]
+    def __init__(self, stream, length, max_line = 4096):
+        self.stream = stream
+        self.chunked = length is None
+        self.remaining = 0 if self.chunked else length
+        self.max_line = max_line
+        self.done = length == 0
+    def _next_chunk(self):
+        if self.chunked and self.remaining == 0 and not self.done:
+            line = self.stream.read_until("\r\n", self.max_line)
+            try:
+                self.remaining = http_chunk_header.parse(line).size
+            except ConstructError, ex:
+                raise HttpError("bad chunk header", line, ex)
+            if self.remaining == 0:
+                # trailers, up to an empty line
+                while self.stream.read_until("\r\n",
+                        self.max_line) not in ("\r\n", ""):
+                    pass
+                self.done = True
+    def read(self, count = -1):
+        """
+        Read up to count bytes of the body (all of the rest if count is
+        negative); fewer only at its end.
+        """
+        data = []
+        while not self.done and count != 0:
+            self._next_chunk()
+            if self.done:
+                break
+            if self.remaining < 0:
+                size = count
+            elif count < 0:
+                size = self.remaining
+            else:
+                size = min(count, self.remaining)
+            block = self.stream.read(size)
+            if not block:
+                if self.remaining > 0:
+                    raise HttpError("truncated body")
+                self.done = True
+                break
+            data.append(block)
+            if count > 0:
+                count -= len(block)
+            if self.remaining > 0:
+                self.remaining -= len(block)
+                if self.remaining == 0:
+                    if self.chunked:
+                        if self.stream.read_until("\r\n", 2) != "\r\n":
+                            raise HttpError("missing chunk terminator")
+                    else:
+                        self.done = True
+        return "".join(data)
+    def drain(self):
+        """
+        Skip the rest of the body.
+        """
+        while self.read(self.stream.blocksize):
+            pass
+
+class HttpParser(object):
+    """
+    An incremental parser of the HTTP messages of a stream: requests (as
+    sent by a client) or replies (as sent by a server). Headers are parsed
+    with the constructs of this module, up to max_header bytes of them, and
+    bodies are returned as HttpBody objects, which honor Content-Length and
+    chunked transfer coding. A body must be read (or not) before the next
+    message is parsed; whatever is left of it is skipped.
+
+    Parameters:
+    * stream - the stream to parse (only its read() is used)
+    * replies - whether the stream carries replies rather than requests
+    * max_header - the largest header allowed
+    * blocksize - the size of the reads from the stream
+
+    Example:
+    for request, body in HttpParser(sock.makefile("rb")):
+        print request.command, request.url, len(body.read())
+    """
+    def __init__(self, stream, replies = False, max_header = 65536,
+                 blocksize = 65536):
+        self.stream = HttpStream(stream, blocksize)
+        self.replies = replies
+        self.max_header = max_header
+        self.body = None
+    def __iter__(self):
+        while True:
+            message = self.next()
+            if message is None:
+                return
+            yield message
+    def next(self):
+        """
+        Parse the next message. Returns a tuple of (header, body), or None
+        at the end of the stream.
+        """
+        if self.body is not None:
+            self.body.drain()
+            self.body = None
+        if self.stream.at_eof():
+            return None
+        data = self.stream.read_until("\r\n\r\n", self.max_header)
+        try:
+            if self.replies:
+                header = _compiled_reply_header.parse(data)
+            else:
+                header = _compiled_request.parse(data)
+        except ConstructError, ex:
+            raise HttpError("bad header", ex)
+        self.body = HttpBody(self.stream, _body_length(header, self.replies))
+        return header, self.body
+
+
 if __name__ == "__main__":
     cap1 = (
     "474554202f636e6e2f2e656c656d656e742f696d672f312e352f6365696c696e672f6e"
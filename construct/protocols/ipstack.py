@@ -1,8 +1,8 @@
 """
 TCP/IP Protocol Stack
 Note: before parsing the application layer over a TCP stream, you must
-first combine all the TCP frames into a stream. See utils.tcpip for
-some solutions
+first combine all the TCP frames into a stream. See protocols.tcpip for
+a reassembler
 """
 from construct import Struct, Rename, HexDumpAdapter, Field, Switch, Pass
 from construct.protocols.layer2.ethernet import ethernet_header
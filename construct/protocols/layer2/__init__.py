@@ -1,4 +1,14 @@
 """
 layer 2 (data link) protocols
 """
+from construct.lib.lazymodule import LazyModule
 
+
+LazyModule.install(__name__, {
+    "arp"             : "arp",
+    "ethernet"        : "ethernet",
+    "mtp2"            : "mtp2",
+    "arp_header"      : ("arp", "arp_header"),
+    "ethernet_header" : ("ethernet", "ethernet_header"),
+    "mtp2_header"     : ("mtp2", "mtp2_header"),
+})
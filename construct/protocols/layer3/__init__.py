@@ -1,4 +1,22 @@
 """
 layer 3 (network) protocols
 """
+from construct.lib.lazymodule import LazyModule
 
+
+LazyModule.install(__name__, {
+    "dhcpv4"        : "dhcpv4",
+    "dhcpv6"        : "dhcpv6",
+    "icmpv4"        : "icmpv4",
+    "igmpv2"        : "igmpv2",
+    "ipv4"          : "ipv4",
+    "ipv6"          : "ipv6",
+    "mtp3"          : "mtp3",
+    "dhcp_header"   : ("dhcpv4", "dhcp_header"),
+    "dhcp_message"  : ("dhcpv6", "dhcp_message"),
+    "icmp_header"   : ("icmpv4", "icmp_header"),
+    "igmpv2_header" : ("igmpv2", "igmpv2_header"),
+    "ipv4_header"   : ("ipv4", "ipv4_header"),
+    "ipv6_header"   : ("ipv6", "ipv6_header"),
+    "mtp3_header"   : ("mtp3", "mtp3_header"),
+})
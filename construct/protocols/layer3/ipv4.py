@@ -49,7 +49,10 @@ ipv4_header = Struct("ip_header",
     ),
     UBInt8("ttl"),
     ProtocolEnum(UBInt8("protocol")),
-    UBInt16("checksum"),
+    # over the header; built, but not verified, as captures often hold
+    # packets whose checksums are left to the network card
+    Checksum(UBInt16("checksum"), "internet",
+        lambda ctx: (-10, ctx.header_length - 10), verify = False),
     IpAddress("source"),
     IpAddress("destination"),
     Field("options", lambda ctx: ctx.header_length - 20),
@@ -1,4 +1,14 @@
 """
 layer 4 (transporation) protocols
 """
+from construct.lib.lazymodule import LazyModule
 
+
+LazyModule.install(__name__, {
+    "isup"        : "isup",
+    "tcp"         : "tcp",
+    "udp"         : "udp",
+    "isup_header" : ("isup", "isup_header"),
+    "tcp_header"  : ("tcp", "tcp_header"),
+    "udp_header"  : ("udp", "udp_header"),
+})
@@ -0,0 +1,441 @@
+"""
+TCP stream reassembly
+
+The application layer of TCP is a stream of bytes, which the segments of a
+capture carry in pieces: out of order, retransmitted, overlapping. The
+reassembler takes parsed segments (see ipstack), keeps a table of flows
+keyed by their addresses and ports, puts the segments of each direction
+back in order and hands the contiguous bytes to a consumer, usually a
+StreamParser of an application layer construct.
+
+Memory is bounded, so captures of any number of flows can be processed:
+the table holds at most max_flows flows (the least recently active are
+evicted first), idle flows are evicted, and every direction buffers at most
+max_pending bytes of segments that arrived ahead of a gap (beyond that, the
+gap is taken as lost and the direction is abandoned).
+"""
+import heapq
+from time import time
+from collections import deque
+
+from construct import ConstructError
+from construct.protocols.application.http import (http_request_message,
+    http_reply_message)
+from construct.protocols.application.dns import dns_tcp
+from construct.protocols.application.telnet import telnet_unit
+
+
+#===============================================================================
+# application layer parsing
+#===============================================================================
+class _BufferStream(object):
+    """
+    A stream over the bytes received so far. Reads past the end return what
+    there is, as at the end of a stream, and record how far the last of
+    them wanted to go: a parse that failed after it may succeed with more
+    data.
+    Reads of the rest of the stream are recorded too (as greedy): their
+    result is complete only once the stream is.
+    """
+    __slots__ = ["data", "pos", "wanted", "greedy"]
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.wanted = 0
+        self.greedy = False
+    def read(self, count = -1):
+        if count < 0:
+            self.greedy = True
+            end = len(self.data) + 1
+        else:
+            end = self.pos + count
+        if end > len(self.data):
+            # the last read past the end is the one a failure comes from
+            self.wanted = end
+        data = self.data[self.pos:end]
+        self.pos += len(data)
+        return data
+    def tell(self):
+        return self.pos
+    def seek(self, pos, whence = 0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += len(self.data)
+        self.pos = pos
+
+class StreamParser(object):
+    """
+    Parses the objects of a construct out of a stream of bytes that arrives
+    in pieces, calling back with every object as soon as it is complete.
+    The received bytes are parsed from the start of the current object; a
+    parse that failed after looking past the end of them is retried once
+    enough bytes have arrived for it to look as far as it wanted, or when
+    the stream is closed. A parse that succeeded is delivered at once,
+    unless it read the rest of the stream (which only the close ends).
+
+    Parameters:
+    * subcon - the construct of the objects
+    * callback - a function taking every parsed object
+    * max_buffer - the most bytes buffered for a single object. a
+      ConstructError is raised beyond it.
+
+    Example:
+    parser = StreamParser(telnet_unit, units.append)
+    parser.write(data)
+    parser.close()
+    """
+    __slots__ = ["subcon", "callback", "max_buffer", "buffer", "wanted",
+        "closed"]
+    def __init__(self, subcon, callback, max_buffer = 1 << 20):
+        self.subcon = subcon
+        self.callback = callback
+        self.max_buffer = max_buffer
+        self.buffer = ""
+        self.wanted = 0
+        self.closed = False
+    def write(self, data):
+        """
+        Append bytes to the stream, and parse the objects they complete.
+        """
+        self.buffer += data
+        if len(self.buffer) >= self.wanted:
+            self._parse(False)
+        if len(self.buffer) > self.max_buffer:
+            raise ConstructError("no object within %d bytes" %
+                (self.max_buffer,))
+    def close(self):
+        """
+        End the stream, and parse the objects left in it. Raises a
+        ConstructError if it ends within an object.
+        """
+        if not self.closed:
+            self.closed = True
+            self._parse(True)
+    def _parse(self, final):
+        while self.buffer:
+            stream = _BufferStream(self.buffer)
+            try:
+                obj = self.subcon.parse_stream(stream)
+            except ConstructError:
+                if final or not stream.wanted:
+                    # no more data will change that
+                    raise
+                self.wanted = stream.wanted
+                return
+            if stream.greedy and not final:
+                self.wanted = len(self.buffer) + 1
+                return
+            if stream.pos == 0:
+                raise ConstructError("object of no bytes", self.subcon)
+            self.buffer = self.buffer[stream.pos:]
+            self.wanted = 0
+            self.callback(obj)
+
+# the constructs of the messages of well-known ports: (client, server)
+application_constructs = {
+    23 : (telnet_unit, telnet_unit),
+    53 : (dns_tcp, dns_tcp),
+    80 : (http_request_message, http_reply_message),
+}
+
+class ApplicationParser(object):
+    """
+    A consumer factory for TcpReassembler that parses the application layer
+    of flows by port, calling back with (source, destination, object) for
+    every message, where source and destination are (address, port) tuples.
+    Flows of other ports are ignored.
+
+    Parameters:
+    * callback - the function called for every message
+    * constructs - a dict mapping server ports to tuples of the constructs
+      sent by the client and by the server. default is
+      application_constructs.
+    * max_buffer - see StreamParser
+    """
+    __slots__ = ["callback", "constructs", "max_buffer"]
+    def __init__(self, callback, constructs = None, max_buffer = 1 << 20):
+        self.callback = callback
+        if constructs is None:
+            constructs = application_constructs
+        self.constructs = constructs
+        self.max_buffer = max_buffer
+    def __call__(self, source, destination):
+        if destination[1] in self.constructs:
+            subcon = self.constructs[destination[1]][0]
+        elif source[1] in self.constructs:
+            subcon = self.constructs[source[1]][1]
+        else:
+            return None
+        callback = self.callback
+        return StreamParser(subcon,
+            lambda obj: callback(source, destination, obj), self.max_buffer)
+
+
+#===============================================================================
+# reassembly
+#===============================================================================
+def _seqdiff(a, b):
+    """a - b, in sequence number arithmetic"""
+    diff = (a - b) & 0xffffffff
+    if diff >= 0x80000000:
+        diff -= 0x100000000
+    return diff
+
+class TcpHalf(object):
+    """
+    One direction of a flow. Positions are offsets into the stream (which,
+    unlike sequence numbers, do not wrap around).
+
+    * consumer - the consumer of the stream, or None once abandoned
+    * seq - the sequence number of the next byte of the stream
+    * pos - the position of the next byte of the stream
+    * pending - a heap of (position, data) of segments ahead of a gap
+    * pending_size - the number of bytes in pending
+    * fin - the position of the end of the stream, once known
+    """
+    __slots__ = ["consumer", "seq", "pos", "pending", "pending_size", "fin"]
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.seq = None
+        self.pos = 0
+        self.pending = []
+        self.pending_size = 0
+        self.fin = None
+
+class TcpFlow(object):
+    """
+    A TCP connection: the halves sent by the client (the side that sent the
+    first segment seen) and by the server.
+    """
+    __slots__ = ["client", "server", "halves", "last_seen", "tick"]
+    def __init__(self, client, server, halves, last_seen):
+        self.client = client
+        self.server = server
+        self.halves = halves
+        self.last_seen = last_seen
+        # when the flow was last active, in segments fed to the reassembler
+        self.tick = None
+    def __repr__(self):
+        return "%s(%s:%d -> %s:%d)" % ((self.__class__.__name__,) +
+            self.client + self.server)
+
+class TcpReassembler(object):
+    """
+    Reassembles the TCP streams of a capture. For every direction of every
+    flow, the consumer factory is called with the (address, port) tuples of
+    its source and destination, and returns an object with write(data) and
+    close() methods (such as a StreamParser), or None to ignore the
+    direction; the contiguous bytes of the direction are written to it, and
+    it is closed when the direction ends (by FIN or RST) or is evicted.
+
+    Retransmitted bytes are dropped, and where segments overlap, the bytes
+    that arrived first are kept. A ConstructError raised by a consumer
+    abandons its direction, as does a gap that is not filled within
+    max_pending bytes.
+
+    Parameters:
+    * factory - the consumer factory (see ApplicationParser)
+    * max_flows - the most flows held at once
+    * idle_timeout - the seconds after which an inactive flow is evicted
+    * max_pending - the most bytes of out-of-order segments held for a
+      direction
+
+    Counters (attributes): segments, retransmits, gaps, errors, evicted.
+
+    Example:
+    reassembler = TcpReassembler(ApplicationParser(handle))
+    for timestamp, packet in capture:
+        reassembler.feed(ip_stack.parse(packet), timestamp)
+    reassembler.close()
+    """
+    def __init__(self, factory, max_flows = 65536, idle_timeout = 300,
+                 max_pending = 1 << 16):
+        self.factory = factory
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self.flows = {}
+        # (tick, key) of the flows, least recently active first; a key is
+        # appended whenever its flow is active, so the earlier entries of
+        # the key are stale
+        self.order = deque()
+        self.tick = 0
+        self.segments = 0
+        self.retransmits = 0
+        self.gaps = 0
+        self.errors = 0
+        self.evicted = 0
+
+    def feed(self, packet, timestamp = None):
+        """
+        Feed a parsed packet: an ip_stack object, or a layer3_ipv4 or
+        layer3_ipv6 one. Packets other than TCP are ignored. Returns
+        whether the packet was a TCP segment.
+
+        Parameters:
+        * packet - the parsed packet
+        * timestamp - the time of the packet, in seconds. default is now.
+        """
+        if "type" in packet.header:
+            # layer 2
+            packet = packet.next
+            if packet is None:
+                return False
+        if packet.header.protocol != "TCP":
+            return False
+        segment = packet.next
+        self.feed_segment(packet.header.source, packet.header.destination,
+            segment.header, segment.next, timestamp)
+        return True
+
+    def feed_segment(self, source, destination, header, data, timestamp =
+                     None):
+        """
+        Feed a TCP segment.
+
+        Parameters:
+        * source - the source address
+        * destination - the destination address
+        * header - the parsed tcp_header of the segment
+        * data - the payload of the segment
+        * timestamp - the time of the segment, in seconds. default is now.
+        """
+        if timestamp is None:
+            timestamp = time()
+        self.segments += 1
+        self.expire(timestamp)
+        src = (source, header.source)
+        dst = (destination, header.destination)
+        key = (src, dst) if src <= dst else (dst, src)
+        flow = self.flows.get(key)
+        flags = header.flags
+        if flow is None:
+            if flags.rst or not (data or flags.syn):
+                # nothing to reassemble (yet)
+                return
+            flow = TcpFlow(src, dst, (TcpHalf(self.factory(src, dst)),
+                TcpHalf(self.factory(dst, src))), timestamp)
+            self.flows[key] = flow
+        self._touch(key, flow)
+        flow.last_seen = timestamp
+        half = flow.halves[src != flow.client]
+        if flags.rst:
+            del self.flows[key]
+            self._close(flow)
+            return
+        if half.consumer is not None:
+            self._segment(half, header.seq, flags, data)
+        if all(h.consumer is None for h in flow.halves):
+            del self.flows[key]
+        while len(self.flows) > self.max_flows:
+            key, flow = self._oldest()
+            del self.flows[key]
+            self.evicted += 1
+            self._close(flow)
+
+    def expire(self, timestamp):
+        """
+        Evict the flows inactive since before timestamp - idle_timeout.
+        """
+        limit = timestamp - self.idle_timeout
+        while self.flows:
+            key, flow = self._oldest()
+            if flow.last_seen >= limit:
+                break
+            del self.flows[key]
+            self.evicted += 1
+            self._close(flow)
+
+    def close(self):
+        """
+        End all flows, closing their consumers.
+        """
+        while self.flows:
+            key, flow = self._oldest()
+            del self.flows[key]
+            self._close(flow)
+        self.order.clear()
+
+    def _touch(self, key, flow):
+        """make the flow the most recently active"""
+        self.tick += 1
+        flow.tick = self.tick
+        self.order.append((self.tick, key))
+        if len(self.order) > 2 * len(self.flows) + 64:
+            # drop the stale entries
+            flows = self.flows
+            self.order = deque([(tick, key) for tick, key in self.order
+                if key in flows and flows[key].tick == tick])
+
+    def _oldest(self):
+        """the key and flow of the least recently active flow"""
+        order = self.order
+        flows = self.flows
+        while True:
+            tick, key = order[0]
+            flow = flows.get(key)
+            if flow is not None and flow.tick == tick:
+                return key, flow
+            order.popleft()
+
+    def _segment(self, half, seq, flags, data):
+        if flags.syn:
+            # the SYN takes up a sequence number of its own
+            seq = (seq + 1) & 0xffffffff
+        if half.seq is None:
+            # without a SYN, the flow was picked up in its middle
+            half.seq = seq
+        pos = half.pos + _seqdiff(seq, half.seq)
+        if flags.fin:
+            half.fin = pos + len(data)
+        if pos + len(data) <= half.pos:
+            if data:
+                self.retransmits += 1
+        elif pos <= half.pos:
+            self._deliver(half, data[half.pos - pos:])
+        else:
+            heapq.heappush(half.pending, (pos, data))
+            half.pending_size += len(data)
+            if half.pending_size > self.max_pending:
+                self.gaps += 1
+                self._abandon(half)
+                return
+        while half.pending and half.consumer is not None:
+            pos, data = half.pending[0]
+            if pos > half.pos:
+                break
+            heapq.heappop(half.pending)
+            half.pending_size -= len(data)
+            if pos + len(data) > half.pos:
+                self._deliver(half, data[half.pos - pos:])
+            else:
+                self.retransmits += 1
+        if half.fin is not None and half.pos >= half.fin:
+            self._abandon(half, True)
+
+    def _deliver(self, half, data):
+        half.pos += len(data)
+        half.seq = (half.seq + len(data)) & 0xffffffff
+        try:
+            half.consumer.write(data)
+        except ConstructError:
+            self.errors += 1
+            self._abandon(half)
+
+    def _abandon(self, half, close = False):
+        consumer = half.consumer
+        if consumer is None:
+            return
+        half.consumer = None
+        half.pending = []
+        half.pending_size = 0
+        if close:
+            try:
+                consumer.close()
+            except ConstructError:
+                self.errors += 1
+
+    def _close(self, flow):
+        for half in flow.halves:
+            self._abandon(half, True)
@@ -0,0 +1,447 @@
+"""
+Introspection and transformation of construct trees.
+"""
+from copy import copy
+from hashlib import sha1
+from struct import Struct as Packer
+from types import FunctionType, MethodType, CodeType, BuiltinFunctionType
+
+from core import (Construct, ConstructError, Subconstruct, Struct, Sequence,
+    Switch, Reconfig, Pointer, Peek, OnDemand, Buffered, MetaArray, Range,
+    LazyBound, FieldError, SizeofError)
+from lib import Container, Context
+
+
+#===============================================================================
+# walking
+#===============================================================================
+def subconstructs(con):
+    """
+    Get the constructs directly nested within a construct, whatever the
+    attribute holding them (``subcon``, ``subcons``, ``cases``...).
+
+    :param ``Construct`` con: the construct to inspect
+
+    :returns: list of ``Construct``
+    """
+
+    if isinstance(con, LazyBound):
+        if con.bound is None:
+            con.bound = con.bindfunc()
+        return [con.bound]
+    found = []
+    for value in con.__getstate__().itervalues():
+        if isinstance(value, Construct):
+            found.append(value)
+        elif isinstance(value, (tuple, list)):
+            found.extend(v for v in value if isinstance(v, Construct))
+        elif isinstance(value, dict):
+            found.extend(v for v in value.itervalues()
+                if isinstance(v, Construct))
+    return found
+
+def walk(con):
+    """
+    Iterate over a construct and all the constructs nested within it, each
+    one once, parents before children. Cyclic trees (see ``LazyBound``) are
+    handled.
+
+    :param ``Construct`` con: the root construct
+    """
+
+    seen = set()
+    pending = [con]
+    while pending:
+        con = pending.pop()
+        if id(con) in seen:
+            continue
+        seen.add(id(con))
+        yield con
+        pending.extend(reversed(subconstructs(con)))
+
+
+#===============================================================================
+# fingerprints
+#===============================================================================
+def _fingerprint_value(value, parts, refs):
+    if isinstance(value, Construct):
+        if id(value) in refs:
+            parts.append("ref %d" % (refs[id(value)],))
+            return
+        refs[id(value)] = len(refs)
+        cls = value.__class__
+        parts.append("construct %s.%s" % (cls.__module__, cls.__name__))
+        state = value.__getstate__()
+        if isinstance(value, LazyBound):
+            # whether it has been bound yet is not part of the structure
+            state["bound"] = subconstructs(value)[0]
+        for key in sorted(state):
+            parts.append("attr %s" % (key,))
+            _fingerprint_value(state[key], parts, refs)
+        parts.append("end")
+    elif isinstance(value, (tuple, list)):
+        parts.append("%s %d" % (type(value).__name__, len(value)))
+        for v in value:
+            _fingerprint_value(v, parts, refs)
+    elif isinstance(value, (set, frozenset)):
+        # in a fixed order, as that of iteration depends on hashing
+        parts.append("%s %d" % (type(value).__name__, len(value)))
+        for v in sorted(value, key = repr):
+            _fingerprint_value(v, parts, refs)
+    elif isinstance(value, dict):
+        parts.append("dict %d" % (len(value),))
+        for key in sorted(value, key = repr):
+            parts.append("key %r" % (key,))
+            _fingerprint_value(value[key], parts, refs)
+    elif isinstance(value, MethodType):
+        parts.append("method")
+        _fingerprint_value(value.im_self, parts, refs)
+        _fingerprint_value(value.im_func, parts, refs)
+    elif isinstance(value, FunctionType):
+        parts.append("function")
+        _fingerprint_value(value.func_code, parts, refs)
+        _fingerprint_value(value.func_defaults, parts, refs)
+        _fingerprint_value([c.cell_contents for c in value.func_closure or ()],
+            parts, refs)
+    elif isinstance(value, CodeType):
+        parts.append("code %r %r" % (value.co_code, value.co_names))
+        _fingerprint_value(value.co_consts, parts, refs)
+    elif isinstance(value, (BuiltinFunctionType, type)):
+        parts.append("global %s.%s" % (value.__module__, value.__name__))
+    elif isinstance(value, Packer):
+        parts.append("packer %r" % (value.format,))
+    elif value is None or isinstance(value,
+            (bool, int, long, float, basestring)):
+        parts.append("value %r" % (value,))
+    else:
+        # reprs of arbitrary objects are not stable across processes
+        cls = value.__class__
+        parts.append("object %s.%s" % (cls.__module__, cls.__name__))
+
+def fingerprint(con):
+    """
+    Compute a structural fingerprint of a construct tree: the classes,
+    names, flags and parameters of all the constructs in it, and the code
+    of their functions. The fingerprint is stable across processes, so it
+    can key caches of anything derived from a schema.
+
+    :param ``Construct`` con: the root construct
+
+    :returns: str of hex digits
+    """
+
+    parts = []
+    _fingerprint_value(con, parts, {})
+    return sha1("\n".join(parts)).hexdigest()
+
+
+#===============================================================================
+# context dependencies
+#===============================================================================
+def reads(*names):
+    """
+    Declare the context fields read by a function, such as the length
+    function of a ``MetaField``. Without a declaration, the fields are
+    inferred from the function's code, which may overestimate them.
+
+    >>> Field("data", reads("length")(lambda ctx: ctx.length))
+    MetaField('data')
+    """
+
+    def decorator(func):
+        func.context_reads = frozenset(names)
+        return func
+    return decorator
+
+def _code_names(code, names):
+    names.update(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, str):
+            names.add(const)
+        elif isinstance(const, CodeType):
+            _code_names(const, names)
+
+def _callable_names(func, names, seen):
+    if id(func) in seen:
+        return
+    seen.add(id(func))
+    if isinstance(func, MethodType):
+        if isinstance(func.im_self, Construct):
+            _construct_names(func.im_self, names, seen)
+        func = func.im_func
+    if not isinstance(func, FunctionType):
+        return
+    if hasattr(func, "context_reads"):
+        names.update(func.context_reads)
+        return
+    _code_names(func.func_code, names)
+    values = list(func.func_defaults or ())
+    values.extend(cell.cell_contents for cell in func.func_closure or ())
+    for value in values:
+        if isinstance(value, str):
+            names.add(value)
+        elif isinstance(value, Construct):
+            if value.name is not None:
+                names.add(value.name)
+            _construct_names(value, names, seen)
+        elif callable(value):
+            _callable_names(value, names, seen)
+
+def _construct_names(con, names, seen):
+    for sc in walk(con):
+        if id(sc) in seen:
+            continue
+        seen.add(id(sc))
+        for value in sc.__getstate__().itervalues():
+            if callable(value) and not isinstance(value, Construct):
+                _callable_names(value, names, seen)
+
+def context_reads(con):
+    """
+    Get the names of the context fields that the functions within a
+    construct (lengths, counts, keys, offsets...) may read.
+
+    :param ``Construct`` con: the construct to inspect
+
+    :returns: set of names
+    """
+
+    names = set()
+    _construct_names(con, names, set())
+    return names
+
+
+#===============================================================================
+# projection
+#===============================================================================
+class _Skip(Construct):
+    """
+    Stands in for a construct that is not needed by a projection: the stream
+    is advanced by the construct's size, and nothing is returned. When the
+    size cannot be calculated, the construct is parsed and discarded.
+    """
+    __slots__ = ["subcon"]
+    def __init__(self, subcon):
+        Construct.__init__(self, None)
+        self.subcon = subcon
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.subcon)
+    def _parse(self, stream, context):
+        try:
+            size = self.subcon._sizeof(context)
+        except SizeofError:
+            self.subcon._parse(stream, context)
+        else:
+            stream.seek(size, 1)
+    def _build(self, obj, stream, context):
+        raise FieldError("projected constructs can only parse")
+    def _sizeof(self, context):
+        return self.subcon._sizeof(context)
+
+# wrappers that pass their subcon's object through unchanged (or as a list
+# of them), and so can be projected into
+_transparent = (Reconfig, Pointer, Peek, OnDemand, Buffered, MetaArray, Range)
+
+def _plan(con, tails, names):
+    if () in tails:
+        return con
+    if isinstance(con, Struct) and not isinstance(con, Sequence):
+        subcons = []
+        kept = False
+        for sc in con.subcons:
+            if sc.conflags & con.FLAG_EMBED:
+                sub = _plan(sc, tails, names)
+            elif sc.name is None:
+                sub = None
+            elif sc.name in names:
+                sub = sc
+            else:
+                sub = _plan(sc, [t[1:] for t in tails if t[0] == sc.name],
+                    names)
+            if sub is None:
+                subcons.append(_Skip(sc))
+            else:
+                subcons.append(sub)
+                kept = True
+        if not kept:
+            return None
+        con = copy(con)
+        con.subcons = tuple(subcons)
+        return con
+    if not tails:
+        return None
+    if isinstance(con, Switch):
+        cases = {}
+        kept = False
+        for key, case in con.cases.iteritems():
+            sub = _plan(case, tails, names)
+            if sub is None:
+                cases[key] = _Skip(case)
+            else:
+                cases[key] = sub
+                kept = True
+        if con.default is not con.NoDefault:
+            default = _plan(con.default, tails, names)
+            if default is None:
+                default = _Skip(con.default)
+            else:
+                kept = True
+        else:
+            default = con.default
+        if not kept:
+            return None
+        con = copy(con)
+        con.cases = cases
+        con.default = default
+        return con
+    if type(con) in _transparent or type(con) is Subconstruct:
+        sub = _plan(con.subcon, tails, names)
+        if sub is None:
+            return None
+        con = copy(con)
+        con.subcon = sub
+        return con
+    # the rest (adapters in particular) need their whole object
+    return con
+
+def project(con, fields):
+    """
+    Create a reduced construct that only parses the given fields, along with
+    whatever fields their lengths, counts, switch keys and such depend on.
+    All other fields are skipped over by their size, without being decoded.
+
+    Fields are given as dotted paths from the root construct. Switches are
+    transparent, so a path continues into each of the switch's cases, and
+    arrays are transparent, so a path continues into every element.
+
+    The dependencies of functions are taken from their ``reads``
+    declaration, or inferred from their code; in doubt, every field of a
+    given name is kept. The reduced construct can only parse.
+
+    :param ``Construct`` con: the construct to project
+    :param iterable fields: dotted paths of the wanted fields
+
+    >>> from construct.protocols.ipstack import ip_stack
+    >>> addresses = project(ip_stack, ["next.header.source",
+    ...     "next.header.destination", "next.next.header.source",
+    ...     "next.next.header.destination"])
+    >>> obj = addresses.parse(frame) # doctest: +SKIP
+    """
+
+    tails = [tuple(f.split(".")) for f in fields]
+    names = set()
+    while True:
+        plan = _plan(con, tails, names)
+        if plan is None:
+            raise ValueError("no such fields", fields)
+        needed = context_reads(plan)
+        if needed <= names:
+            return plan
+        names |= needed
+
+
+#===============================================================================
+# filtered iteration
+#===============================================================================
+def _defined_names(con):
+    if con.conflags & con.FLAG_EMBED:
+        return set(sc.name for sc in walk(con) if sc.name is not None)
+    return set([con.name])
+
+def _split_record(subcon, names):
+    """
+    Split a record struct into the head that defines the given names and
+    the tail that follows, as a pair of embeddable structs, or return None
+    if it cannot be split.
+    """
+
+    if not isinstance(subcon, Struct) or isinstance(subcon, Sequence):
+        return None
+    last = None
+    for i, sc in enumerate(subcon.subcons):
+        if _defined_names(sc) & names:
+            last = i
+    if last is None:
+        return None
+    head = subcon.subcons[:last + 1]
+    tail = subcon.subcons[last + 1:]
+    # fields that the sizes of skipped fields depend on are still parsed
+    needed = context_reads(Struct(None, *tail))
+    skip = [sc if _defined_names(sc) & needed else _Skip(sc) for sc in tail]
+    return Struct(None, *head), Struct(None, *tail), Struct(None, *skip)
+
+class _MissingField(AttributeError, KeyError):
+    __slots__ = []
+
+class _PartialRecord(Container):
+    """a record of which only some fields are parsed yet"""
+    def __getattr__(self, name):
+        raise _MissingField(name)
+    def __getitem__(self, name):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise _MissingField(name)
+
+def iterparse(subcon, stream, where = None):
+    """
+    Iterate over consecutive records in a stream, until its end. Parsing
+    stops quietly at a truncated trailing record, as with
+    ``OptionalGreedyRange``.
+
+    If a predicate is given, only the records it accepts are yielded. The
+    predicate is called as soon as the fields it reads (see ``reads``) have
+    been parsed, with the partially parsed record; the rest of a rejected
+    record is skipped by its size, without being decoded. If the predicate
+    turns out to need other fields, it is called again on the whole record.
+
+    :param ``Construct`` subcon: the record construct
+    :param stream: a seekable stream, positioned at the first record
+    :param callable where: a predicate taking a record and returning True to
+                           accept it
+
+    >>> from construct.formats.data.cap import packet
+    >>> stream.seek(24) # doctest: +SKIP
+    >>> big = iterparse(packet, stream, where = lambda p: p.length > 1000)
+    """
+
+    split = None
+    if where is not None:
+        names = set()
+        _callable_names(where, names, set())
+        split = _split_record(subcon, names)
+    while True:
+        pos = stream.tell()
+        if not stream.read(1):
+            return
+        stream.seek(pos)
+        try:
+            if split is None:
+                obj = subcon._parse(stream, Context())
+                if where is None or where(obj):
+                    yield obj
+                continue
+            head, tail, skip = split
+            obj = _PartialRecord()
+            context = Context(_ = Context())
+            context["<obj>"] = obj
+            head._parse(stream, context)
+            try:
+                accepted = where(obj)
+            except _MissingField:
+                # the predicate reads a field that is not parsed yet
+                accepted = None
+            obj.__class__ = Container
+            if accepted is not None and not accepted:
+                context["<obj>"] = obj
+                skip._parse(stream, context)
+                continue
+            context["<obj>"] = obj
+            tail._parse(stream, context)
+            if accepted is None:
+                accepted = where(obj)
+            if accepted:
+                yield obj
+        except ConstructError:
+            stream.seek(pos)
+            return
@@ -0,0 +1,110 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from construct.formats.data.cap import (cap_file, CapReader, CapWriter,
+    CapError)
+
+capfile = os.path.join(os.path.dirname(__file__), "..", "..", "cap2.cap")
+
+class TestCap(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "test.cap")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, count, start = 0, **kw):
+        with CapWriter(self.path, **kw) as cap:
+            for i in range(start, start + count):
+                cap.write("packet %d" % (i,), 1000 + i * 0.5)
+
+    def test_reader(self):
+        with open(capfile, "rb") as f:
+            obj = cap_file.parse_stream(f)
+        with CapReader(capfile) as cap:
+            packets = [(timestamp, str(data)) for timestamp, data in cap]
+            self.assertEqual(len(cap), len(obj.packets))
+        self.assertEqual([data for timestamp, data in packets],
+            [p.data for p in obj.packets])
+
+    def test_byte_orders(self):
+        for byteorder in "<>":
+            for resolution in (1e-6, 1e-9):
+                self.write(3, byteorder = byteorder, resolution = resolution)
+                with CapReader(self.path) as cap:
+                    self.assertEqual(cap.byteorder, byteorder)
+                    self.assertEqual([(t, str(d)) for t, d in cap],
+                        [(1000.0, "packet 0"), (1000.5, "packet 1"),
+                        (1001.0, "packet 2")])
+                with open(self.path, "rb") as f:
+                    obj = cap_file.parse_stream(f)
+                self.assertEqual([p.data for p in obj.packets],
+                    ["packet 0", "packet 1", "packet 2"])
+                self.assertEqual([p.original_length for p in obj.packets],
+                    [8, 8, 8])
+
+    def test_index(self):
+        self.write(100)
+        with CapReader(self.path, index = True) as cap:
+            self.assertEqual(len(cap), 100)
+            self.assertEqual(str(cap[42][1]), "packet 42")
+            self.assertEqual(cap[-1][0], 1049.5)
+            n = cap.seek_time(1010.2)
+            self.assertEqual(n, 21)
+            self.assertEqual([str(d) for t, d in cap.iter_from(98)],
+                ["packet 98", "packet 99"])
+        self.assertTrue(os.path.exists(self.path + ".idx"))
+
+    def test_append(self):
+        self.write(10, byteorder = ">")
+        CapReader(self.path, index = True).close()
+        # the byte order of the file is kept
+        self.write(5, 10, append = True)
+        with CapReader(self.path, index = True) as cap:
+            self.assertEqual(len(cap), 15)
+            self.assertEqual(str(cap[12][1]), "packet 12")
+        # a new file replaces the index
+        self.write(3)
+        with CapReader(self.path, index = True) as cap:
+            self.assertEqual(len(cap), 3)
+
+    def test_replaced_by_larger(self):
+        self.write(5)
+        CapReader(self.path, index = True).close()
+        self.write(7, 100)
+        with CapReader(self.path, index = True) as cap:
+            self.assertEqual(len(cap), 7)
+            self.assertEqual(str(cap[4][1]), "packet 104")
+            self.assertEqual(len(list(cap.iter_from(1))), 6)
+
+    def test_replaced_with_same_first_packet(self):
+        self.write(5)
+        CapReader(self.path, index = True).close()
+        with CapWriter(self.path) as cap:
+            cap.write("packet 0", 1000)
+            for i in range(6):
+                cap.write("other packet %d" % (i,), 2000 + i)
+        with CapReader(self.path, index = True) as cap:
+            self.assertEqual(len(cap), 7)
+            self.assertEqual(cap[4], (2003.0, cap[4][1]))
+            self.assertEqual(str(cap[4][1]), "other packet 3")
+
+    def test_truncated(self):
+        self.write(3)
+        with open(self.path, "ab") as f:
+            # a packet of 100 bytes, cut short
+            f.write("\x00" * 8 + "\x64\x00\x00\x00" * 2 + "\x00" * 10)
+        with CapReader(self.path, index = True) as cap:
+            self.assertEqual(len(cap), 3)
+            self.assertRaises(CapError, list, cap.iter_from(0))
+
+    def test_bad_magic(self):
+        with open(self.path, "wb") as f:
+            f.write("\x00" * 24)
+        self.assertRaises(CapError, CapReader, self.path)
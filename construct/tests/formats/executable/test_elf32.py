@@ -0,0 +1,65 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from construct.formats.executable.elf32 import elf32_file, ElfReader, ElfError
+
+sofile = os.path.join(os.path.dirname(__file__), "..", "..",
+    "_ctypes_test.so")
+
+class TestElfReader(unittest.TestCase):
+
+    def setUp(self):
+        with open(sofile, "rb") as f:
+            self.obj = elf32_file.parse(f.read())
+
+    def test_header(self):
+        with ElfReader(sofile) as elf:
+            self.assertEqual(elf.header.machine, self.obj.machine)
+            self.assertEqual(elf.header.sh_count, len(self.obj.sections))
+
+    def test_headers(self):
+        with ElfReader(sofile) as elf:
+            self.assertEqual(list(elf.program_headers),
+                list(self.obj.program_table))
+            self.assertEqual(elf.sections[-1].offset,
+                self.obj.sections[-1].offset)
+            self.assertRaises(IndexError, elf.sections.__getitem__,
+                len(self.obj.sections))
+
+    def test_section_data(self):
+        with ElfReader(sofile) as elf:
+            for section in self.obj.sections:
+                if section.type != "NOBITS":
+                    self.assertEqual(str(elf.data(section.name)),
+                        section.data.value)
+            self.assertEqual(len(elf.data(".bss")), 0)
+            self.assertRaises(KeyError, elf.section, ".nonexistent")
+
+    def test_symbols(self):
+        with ElfReader(sofile) as elf:
+            dynsym = elf.section(".dynsym")
+            symbols = elf.symbols(dynsym)
+            self.assertEqual(len(symbols), dynsym.size // 16)
+            names = set(symbol[0] for symbol in symbols)
+            self.assertTrue("_testfunc_i_bhilfd" in names)
+
+    def test_symbols_not_symbol_table(self):
+        with ElfReader(sofile) as elf:
+            self.assertRaises(ElfError, elf.symbols, ".dynstr")
+            dynsym = elf.section(".dynsym").copy()
+            dynsym.entry_size = 8
+            self.assertRaises(ElfError, elf.symbols, dynsym)
+
+    def test_not_elf(self):
+        dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir, "foo")
+            with open(path, "wb") as f:
+                f.write("MZ" + "\x00" * 100)
+            self.assertRaises(ElfError, ElfReader, path)
+        finally:
+            shutil.rmtree(dir)
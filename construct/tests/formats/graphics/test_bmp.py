@@ -0,0 +1,66 @@
+from __future__ import with_statement
+
+import os
+import unittest
+
+from construct.formats.graphics.bmp import (bitmap_file, raw_bitmap_file,
+    BitmapImage, unpack_indices, numpy)
+
+tests = os.path.join(os.path.dirname(__file__), "..", "..")
+
+def read(bpp):
+    with open(os.path.join(tests, "bitmap%d.bmp" % (bpp,)), "rb") as f:
+        return f.read()
+
+class TestBitmapImage(unittest.TestCase):
+
+    def test_rgb_matches_bitmap_file(self):
+        for bpp in (1, 4, 8, 24):
+            data = read(bpp)
+            obj = bitmap_file.parse(data)
+            image = BitmapImage(raw_bitmap_file.parse(data))
+            rows = obj.pixels.value
+            for y in (0, obj.height // 2, obj.height - 1):
+                row = rows[obj.height - 1 - y]
+                if bpp <= 8:
+                    palette = obj.palette.value
+                    expected = "".join(chr(palette[i].red) +
+                        chr(palette[i].green) + chr(palette[i].blue)
+                        for i in row)
+                else:
+                    # stored blue, green, red
+                    expected = "".join(chr(p[2]) + chr(p[1]) + chr(p[0])
+                        for p in row)
+                self.assertEqual(image.rgb_row(y), expected)
+            self.assertEqual(len(image.rgb()), obj.width * obj.height * 3)
+
+    def test_indices(self):
+        data = read(4)
+        obj = bitmap_file.parse(data)
+        image = BitmapImage(raw_bitmap_file.parse(data))
+        self.assertEqual(image.indices(0),
+            "".join(map(chr, obj.pixels.value[-1])))
+
+    def test_unpack_indices(self):
+        self.assertEqual(unpack_indices("\xa5\x80", 9, 1),
+            "\x01\x00\x01\x00\x00\x01\x00\x01\x01")
+        self.assertEqual(unpack_indices("\x12\x30", 3, 4), "\x01\x02\x03")
+
+    def test_rows_are_unpadded(self):
+        obj = raw_bitmap_file.parse(read(24))
+        self.assertEqual(len(obj.pixels), obj.height)
+        self.assertEqual(set(len(row) for row in obj.pixels),
+            set([obj.width * 3]))
+
+    def test_build(self):
+        for bpp in (1, 4, 8, 24):
+            data = read(bpp)
+            self.assertEqual(raw_bitmap_file.build(raw_bitmap_file.parse(data)),
+                data)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_to_array(self):
+        image = BitmapImage(raw_bitmap_file.parse(read(8)))
+        array = image.to_array()
+        self.assertEqual(array.shape, (image.height, image.width, 3))
+        self.assertEqual(array[0].tostring(), image.rgb_row(0))
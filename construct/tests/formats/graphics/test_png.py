@@ -0,0 +1,113 @@
+import unittest
+import zlib
+import struct
+
+from StringIO import StringIO
+
+from construct.formats.graphics.png import png_file, PngReader, PngError
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+def filter_row(filter_type, row, prev, bpp):
+    """the forward filter of a row, as an encoder applies it"""
+    out = []
+    for i, x in enumerate(row):
+        a = row[i - bpp] if i >= bpp else 0
+        b = prev[i]
+        c = prev[i - bpp] if i >= bpp else 0
+        predictor = [0, a, b, (a + b) // 2, paeth(a, b, c)][filter_type]
+        out.append((x - predictor) & 0xff)
+    return chr(filter_type) + "".join(map(chr, out))
+
+def make_chunk(type, data):
+    return (struct.pack(">I", len(data)) + type + data +
+        struct.pack(">I", zlib.crc32(type + data) & 0xffffffff))
+
+def make_png(width, height, rows, idat_size = 7):
+    """a truecolor PNG of the given rows, filtered with every filter in
+    turn, with its data split into small IDAT chunks"""
+    filtered = []
+    prev = [0] * (width * 3)
+    for y, row in enumerate(rows):
+        filtered.append(filter_row(y % 5, row, prev, 3))
+        prev = row
+    data = zlib.compress("".join(filtered))
+    chunks = [make_chunk("IHDR", struct.pack(">IIBBBBB", width, height, 8, 2,
+        0, 0, 0)), make_chunk("tEXt", "Comment\x00hello")]
+    for i in range(0, len(data), idat_size):
+        chunks.append(make_chunk("IDAT", data[i:i + idat_size]))
+    chunks.append(make_chunk("IEND", ""))
+    return "\x89PNG\r\n\x1a\n" + "".join(chunks)
+
+class TestPngReader(unittest.TestCase):
+
+    def setUp(self):
+        self.width = 9
+        self.height = 12
+        self.rows = [[(x * 37 + y * 11 + (x * y) % 7) & 0xff
+            for x in range(self.width * 3)] for y in range(self.height)]
+        self.data = make_png(self.width, self.height, self.rows)
+
+    def test_index(self):
+        reader = PngReader(StringIO(self.data))
+        types = [chunk.type for chunk in reader.chunks]
+        self.assertEqual(types[:2], ["IHDR", "tEXt"])
+        self.assertEqual(types[-1], "IEND")
+        self.assertEqual(reader.header.width, self.width)
+        self.assertEqual(reader.header.color_type, "truecolor")
+        text = reader.find("tEXt")[0]
+        self.assertEqual(reader.read_chunk(text), "Comment\x00hello")
+
+    def test_index_matches_png_file(self):
+        obj = png_file.parse(self.data)
+        reader = PngReader(StringIO(self.data))
+        self.assertEqual([chunk.crc for chunk in reader.chunks[1:]],
+            [chunk.crc for chunk in obj.chunks])
+
+    def test_verify_crc(self):
+        PngReader(StringIO(self.data), verify_crc = True)
+        pos = self.data.index("hello")
+        bad = self.data[:pos] + "j" + self.data[pos + 1:]
+        PngReader(StringIO(bad))
+        self.assertRaises(PngError, PngReader, StringIO(bad),
+            verify_crc = True)
+
+    def test_scanlines(self):
+        reader = PngReader(StringIO(self.data))
+        rows = list(reader.scanlines())
+        self.assertEqual(rows, ["".join(map(chr, row)) for row in self.rows])
+
+    def test_not_at_start_of_stream(self):
+        stream = StringIO("junk" * 2 + self.data)
+        stream.seek(8)
+        reader = PngReader(stream)
+        self.assertEqual(reader.header.width, self.width)
+        self.assertEqual(reader.read_chunk(reader.find("tEXt")[0]),
+            "Comment\x00hello")
+        self.assertEqual(len(list(reader.scanlines())), self.height)
+
+    def test_truncated(self):
+        self.assertRaises(PngError, PngReader,
+            StringIO(self.data[:len(self.data) // 2]))
+
+    def test_not_png(self):
+        self.assertRaises(PngError, PngReader, StringIO("GIF89a" + "\x00" * 20))
+
+class TestPngFile(unittest.TestCase):
+
+    def test_build_computes_crc(self):
+        data = make_png(1, 1, [[1, 2, 3]])
+        obj = png_file.parse(data)
+        obj.image_header.crc = 0
+        for chunk in obj.chunks:
+            chunk.crc = 0
+            if chunk.type == "IDAT":
+                chunk.data = chunk.data.value
+        self.assertEqual(png_file.build(obj), data)
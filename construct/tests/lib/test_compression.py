@@ -0,0 +1,70 @@
+import unittest
+import zlib
+import bz2
+
+from StringIO import StringIO
+
+from construct.lib.compression import DecompressingReader, CompressingWriter
+
+class TestDecompressingReader(unittest.TestCase):
+
+    def setUp(self):
+        self.data = "".join("%08d" % i for i in range(20000))
+
+    def test_read(self):
+        stream = StringIO(zlib.compress(self.data))
+        reader = DecompressingReader(stream, blocksize = 1000)
+        self.assertEqual(reader.read(10), self.data[:10])
+        self.assertEqual(reader.read(5000), self.data[10:5010])
+        self.assertEqual(reader.read(), self.data[5010:])
+        self.assertEqual(reader.read(1), "")
+
+    def test_seek(self):
+        stream = StringIO(zlib.compress(self.data))
+        reader = DecompressingReader(stream, blocksize = 1000,
+            window = 2000)
+        reader.seek(50000)
+        self.assertEqual(reader.tell(), 50000)
+        reader.seek(-1500, 1)
+        self.assertEqual(reader.read(8), self.data[48500:48508])
+        self.assertRaises(IOError, reader.seek, 0)
+
+    def test_close_leaves_stream_after_data(self):
+        for codec, compressed in [("zlib", zlib.compress(self.data)),
+                ("bz2", bz2.compress(self.data))]:
+            stream = StringIO(compressed + "trailer")
+            reader = DecompressingReader(stream, codec)
+            self.assertEqual(reader.read(8), self.data[:8])
+            reader.close()
+            self.assertEqual(stream.read(), "trailer")
+
+    def test_close_with_length(self):
+        compressed = zlib.compress(self.data)
+        stream = StringIO(compressed + "trailer")
+        reader = DecompressingReader(stream, length = len(compressed))
+        reader.close()
+        self.assertEqual(stream.read(), "trailer")
+
+    def test_close_with_length_and_padding(self):
+        compressed = zlib.compress("abc")
+        # the codec ends within the last block, before the length
+        stream = StringIO(compressed + "pad!" + "trailer")
+        reader = DecompressingReader(stream, length = len(compressed) + 4)
+        self.assertEqual(reader.read(), "abc")
+        reader.close()
+        self.assertEqual(stream.read(), "trailer")
+
+class TestCompressingWriter(unittest.TestCase):
+
+    def test_roundtrip(self):
+        data = "".join("%08d" % i for i in range(20000))
+        for codec in ["zlib", "gzip", "deflate", "bz2"]:
+            stream = StringIO()
+            writer = CompressingWriter(stream, codec)
+            for i in range(0, len(data), 3000):
+                writer.write(data[i:i + 3000])
+            self.assertEqual(writer.tell(), len(data))
+            writer.close()
+            self.assertEqual(writer.size, len(stream.getvalue()))
+            stream.seek(0)
+            self.assertEqual(DecompressingReader(stream, codec).read(), data)
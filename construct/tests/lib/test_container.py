@@ -1,6 +1,6 @@
 import unittest
 
-from construct.lib.container import Container, ListContainer
+from construct.lib.container import Container, ListContainer, Context
 
 class TestContainer(unittest.TestCase):
 
@@ -92,6 +92,56 @@ class TestContainer(unittest.TestCase):
         c.c = c
         str(c)
 
+class TestContext(unittest.TestCase):
+
+    def test_copy_shares(self):
+        c = Context(a=1)
+        d = c.copy()
+        self.assertTrue(d.__dict__ is c.__dict__)
+        self.assertEqual(c, d)
+
+    def test_setitem_unshares(self):
+        c = Context(a=1)
+        d = c.copy()
+        d["b"] = 2
+        self.assertEqual(c, Context(a=1))
+        self.assertEqual(d, Context(a=1, b=2))
+
+    def test_setattr_unshares_original(self):
+        c = Context(a=1)
+        d = c.copy()
+        c.a = 2
+        self.assertEqual(c.a, 2)
+        self.assertEqual(d.a, 1)
+
+    def test_delitem_unshares(self):
+        c = Context(a=1, b=2)
+        d = c.copy()
+        del d["a"]
+        self.assertEqual(c, Context(a=1, b=2))
+        self.assertEqual(d, Context(b=2))
+
+    def test_update_with_copy(self):
+        c = Context(a=1)
+        d = c.copy()
+        c.update(d)
+        self.assertTrue(d.__dict__ is c.__dict__)
+        d.b = 2
+        c.update(d)
+        self.assertEqual(c, Context(a=1, b=2))
+
+    def test_update_unshares(self):
+        c = Context(a=1)
+        d = c.copy()
+        d.update(dict(b=2))
+        self.assertEqual(c, Context(a=1))
+        self.assertEqual(d, Context(a=1, b=2))
+
+    def test_repr(self):
+        c = Context(a=1)
+        c.copy()
+        self.assertEqual(repr(c), "Context({'a': 1})")
+
 class TestListContainer(unittest.TestCase):
 
     def test_str(self):
@@ -0,0 +1,59 @@
+import unittest
+
+try:
+    from benchmarks.harness import Case, measure_case, compare
+    from benchmarks.cases import mbr_sectors
+except ImportError:
+    # the benchmarks are not installed, only run from a checkout
+    compare = None
+
+
+class TestHarness(unittest.TestCase):
+
+    def test_measure_case(self):
+        from construct.formats.filesystem.mbr import mbr
+        case = Case("mbr", mbr, lambda: mbr_sectors(4))
+        result = measure_case(case, min_time = 0, repeat = 1)
+        self.assertEqual(result["records"], 4)
+        self.assertEqual(result["bytes"], 4 * 512)
+        self.assertTrue(result["parse"]["records_per_sec"] > 0)
+        self.assertTrue(result["build"]["mb_per_sec"] > 0)
+
+    def test_lazy_values_are_read(self):
+        from construct import Struct, OnDemand, ExprAdapter, UBInt8
+        reads = []
+        def decoder(obj, ctx):
+            reads.append(obj)
+            return obj
+        con = Struct("foo", OnDemand(ExprAdapter(UBInt8("a"),
+            encoder = lambda obj, ctx: obj, decoder = decoder)))
+        case = Case("lazy", con, lambda: ["\x01"], build = False)
+        result = measure_case(case, min_time = 0, repeat = 1)
+        self.assertTrue(reads)
+        self.assertTrue("retained_objects_per_record" in result["parse"])
+
+    def test_build_error(self):
+        from construct import ExprAdapter, UBInt8
+        unbuildable = ExprAdapter(UBInt8("a"),
+            encoder = lambda obj, ctx: obj // 0,
+            decoder = lambda obj, ctx: obj)
+        case = Case("unbuildable", unbuildable, lambda: ["\x01"])
+        result = measure_case(case, min_time = 0, repeat = 1)
+        self.assertTrue("error" in result["build"])
+
+    def test_compare(self):
+        old = {"cases" : {"a" : {"parse" : {"records_per_sec" : 10.0}}},
+            "imports" : {"m" : {"seconds" : 2.0}}}
+        new = {"cases" : {"a" : {"parse" : {"records_per_sec" : 20.0}}},
+            "imports" : {"m" : {"seconds" : 1.0}}}
+        self.assertEqual(list(compare(old, new)), [
+            ("a", "parse", 10.0, 20.0, 2.0),
+            ("m", "import", 2.0, 1.0, 2.0),
+        ])
+
+if compare is None:
+    # nothing to test without the benchmarks package
+    del TestHarness
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from construct import Struct, UBInt8, UBInt16
+from construct.cache import SchemaCache
+
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def factory(self, con):
+        self.calls.append(con)
+        return [c.name for c in con.subcons]
+
+    def test_get(self):
+        cache = SchemaCache(self.directory, "1.0")
+        s = Struct("foo", UBInt8("a"), UBInt8("b"))
+        self.assertEqual(cache.get(s, "names", self.factory), ["a", "b"])
+        self.assertEqual(cache.get(s, "names", self.factory), ["a", "b"])
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(os.path.isfile(cache.path(s, "names")))
+
+    def test_survives_new_instances(self):
+        cache = SchemaCache(self.directory, "1.0")
+        cache.get(Struct("foo", UBInt8("a")), "names", self.factory)
+        cache = SchemaCache(self.directory, "1.0")
+        cache.get(Struct("foo", UBInt8("a")), "names", self.factory)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_invalidation(self):
+        cache = SchemaCache(self.directory, "1.0")
+        cache.get(Struct("foo", UBInt8("a")), "names", self.factory)
+        cache.get(Struct("foo", UBInt16("a")), "names", self.factory)
+        SchemaCache(self.directory, "1.1").get(Struct("foo", UBInt8("a")),
+            "names", self.factory)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_corrupt_entry(self):
+        cache = SchemaCache(self.directory, "1.0")
+        s = Struct("foo", UBInt8("a"))
+        cache.store(s, "names", ["x"])
+        with open(cache.path(s, "names"), "wb") as f:
+            f.write("garbage")
+        self.assertRaises(KeyError, cache.load, s, "names")
+        self.assertEqual(cache.get(s, "names", self.factory), ["a"])
+
+    def test_clear(self):
+        cache = SchemaCache(self.directory, "1.0")
+        s = Struct("foo", UBInt8("a"))
+        cache.store(s, "names", ["a"])
+        cache.clear()
+        self.assertRaises(KeyError, cache.load, s, "names")
+
+if __name__ == "__main__":
+    unittest.main()
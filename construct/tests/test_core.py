@@ -1,8 +1,27 @@
 import unittest
+import zlib
+import bz2
+
+from StringIO import StringIO
 
 from construct import Struct, MetaField, StaticField, FormatField
-from construct import Container, Byte
-from construct import FieldError, SizeofError
+from construct import TerminatedField, Container, Byte
+from construct import FieldError, SizeofError, ArrayError
+from construct import Checksum, ChecksumError, UBInt16, UBInt32, Bytes
+from construct import Field, String, GreedyRange
+from construct import Decompressed, UBInt8, CString, Terminator
+from construct import Buffered, Restream, BitStreamReader, BitStreamWriter
+from construct import RepeatUntil, Select, Const
+from construct import Bitwise, EmbeddedBitStruct, Bit, Nibble
+
+class Unseekable(object):
+    """a stream that can only be read"""
+
+    def __init__(self, data):
+        self.stream = StringIO(data)
+
+    def read(self, count):
+        return self.stream.read(count)
 
 class TestStaticField(unittest.TestCase):
 
@@ -27,6 +46,97 @@ class TestStaticField(unittest.TestCase):
     def test_sizeof(self):
         self.assertEqual(self.sf.sizeof(), 2)
 
+class TestTerminatedField(unittest.TestCase):
+
+    def test_parse(self):
+        tf = TerminatedField("foo", "XY")
+        stream = StringIO("helloYworld")
+        self.assertEqual(tf.parse_stream(stream), "hello")
+        self.assertEqual(stream.tell(), 5)
+
+    def test_parse_earliest_terminator(self):
+        tf = TerminatedField("foo", "XY", consume_terminator=True)
+        stream = StringIO("helloYworldX")
+        self.assertEqual(tf.parse_stream(stream), "hello")
+        self.assertEqual(stream.tell(), 6)
+
+    def test_parse_include_terminator(self):
+        tf = TerminatedField("foo", "XY", include_terminator=True)
+        self.assertEqual(tf.parse("helloX"), "helloX")
+
+    def test_parse_long(self):
+        tf = TerminatedField("foo", "\x00", consume_terminator=True)
+        stream = StringIO("a" * 10000 + "\x00b")
+        self.assertEqual(tf.parse_stream(stream), "a" * 10000)
+        self.assertEqual(stream.read(), "b")
+
+    def test_parse_eof(self):
+        self.assertRaises(ArrayError, TerminatedField("foo", "X").parse,
+            "hello")
+        tf = TerminatedField("foo", "X", allow_eof=True)
+        self.assertEqual(tf.parse("hello"), "hello")
+
+    def test_parse_unseekable(self):
+        tf = TerminatedField("foo", "XY", include_terminator=True)
+        stream = Unseekable("helloYworld")
+        self.assertEqual(tf.parse_stream(stream), "helloY")
+        self.assertEqual(stream.read(5), "world")
+
+    def test_build(self):
+        tf = TerminatedField("foo", "XY", include_terminator=True)
+        self.assertEqual(tf.build("helloYworld"), "helloY")
+        self.assertRaises(ArrayError, tf.build, "hello")
+
+    def test_build_consume_terminator(self):
+        tf = TerminatedField("foo", "XY", consume_terminator=True)
+        self.assertEqual(tf.build("hello"), "helloX")
+
+    def test_sizeof(self):
+        self.assertRaises(SizeofError, TerminatedField("foo", "X").sizeof)
+
+    def test_parse_bits(self):
+        s = Bitwise(Struct("s", CString("c"), Field("rest", 3)))
+        self.assertEqual(s.parse("\xf0"),
+            Container(c = "\x01" * 4, rest = "\x00" * 3))
+
+class TestRepeatUntil(unittest.TestCase):
+
+    def predicate(self, obj, ctx):
+        if obj == "?":
+            raise FieldError("bad element")
+        return obj == "\x00"
+
+    def test_parse_bytes(self):
+        ru = RepeatUntil(self.predicate, Field("chars", 1))
+        stream = StringIO("ab\x00c")
+        self.assertEqual(ru.parse_stream(stream), ["a", "b", "\x00"])
+        self.assertEqual(stream.read(), "c")
+
+    def test_parse_bits(self):
+        # a bit stream tells its position in bytes, so it is not scanned
+        ru = Bitwise(Struct("s",
+            RepeatUntil(lambda obj, ctx: obj == "\x01", Field("b", 1)),
+            Field("rest", 4),
+        ))
+        self.assertEqual(ru.parse("\x10"), Container(
+            b = ["\x00", "\x00", "\x00", "\x01"], rest = "\x00" * 4))
+        s = Struct("s",
+            EmbeddedBitStruct(
+                RepeatUntil(lambda obj, ctx: obj == 1, Bit("b")),
+                Nibble("rest"),
+            ),
+            UBInt8("x"),
+        )
+        self.assertEqual(s.parse("\x10\x05"),
+            Container(b = [0, 0, 0, 1], rest = 0, x = 5))
+
+    def test_predicate_error(self):
+        ru = RepeatUntil(self.predicate, Field("chars", 1))
+        self.assertRaises(ArrayError, ru.parse, "ab?\x00")
+        ru = RepeatUntil(lambda obj, ctx: self.predicate(chr(obj), ctx),
+            UBInt8("numbers"))
+        self.assertRaises(ArrayError, ru.parse, "ab?\x00")
+
 class TestFormatField(unittest.TestCase):
 
     def setUp(self):
@@ -97,3 +207,173 @@ class TestMetaFieldStruct(unittest.TestCase):
     def test_sizeof(self):
         context = Container(length=4)
         self.assertEqual(self.mf.sizeof(context), 4)
+
+ipv4 = "4500003ca0e3000080116185c0a80205d474a126".decode("hex")
+
+class TestChecksum(unittest.TestCase):
+
+    def setUp(self):
+        # the checksum lies within its span, as in IPv4
+        self.header = Struct("header",
+            Bytes("start", 10),
+            Checksum(UBInt16("checksum"), "internet",
+                lambda ctx: (-10, 10)),
+            Bytes("end", 8),
+        )
+        self.chunk = Struct("chunk",
+            UBInt32("length"),
+            String("type", 4),
+            Field("data", lambda ctx: ctx.length),
+            Checksum(UBInt32("crc"), "crc32",
+                lambda ctx: (-4 - ctx.length, 0)),
+        )
+
+    def test_parse(self):
+        self.assertEqual(self.header.parse(ipv4).checksum, 0x6185)
+
+    def test_parse_mismatch(self):
+        self.assertRaises(ChecksumError, self.header.parse,
+            ipv4[:12] + "\x00" + ipv4[13:])
+
+    def test_no_verify(self):
+        header = Struct("header",
+            Bytes("start", 10),
+            Checksum(UBInt16("checksum"), "internet",
+                lambda ctx: (-10, 10), verify = False),
+            Bytes("end", 8),
+        )
+        data = ipv4[:12] + "\x00" + ipv4[13:]
+        self.assertEqual(header.parse(data).checksum, 0x6185)
+
+    def test_build_within_buffered(self):
+        c = Struct("foo",
+            UBInt8("a"),
+            UBInt8("b"),
+            Checksum(UBInt16("checksum"), "internet", lambda ctx: (-2, 0)),
+        )
+        obj = Container(a = 1, b = 2, checksum = 0)
+        buffered = Buffered(c, encoder = lambda data: data,
+            decoder = lambda data: data, resizer = lambda size: size)
+        self.assertEqual(c.build(obj), "\x01\x02\xfe\xfd")
+        self.assertEqual(buffered.build(obj), "\x01\x02\xfe\xfd")
+
+    def test_build_within_select(self):
+        a = Struct("a",
+            UBInt8("x"),
+            Checksum(UBInt8("c"), lambda data: sum(map(ord, data)) & 0xff,
+                lambda ctx: (-1, 0)),
+            Const(UBInt8("k"), 1),
+        )
+        b = Struct("b", UBInt8("x"), UBInt8("c"), UBInt8("k"))
+        top = Struct("top", Select("s", a, b))
+        # the first alternative matches
+        self.assertEqual(top.build(Container(s = Container(x = 5, c = 0,
+            k = 1))), "\x05\x05\x01")
+        # the first alternative fails after its checksum is built
+        self.assertEqual(top.build(Container(s = Container(x = 5, c = 7,
+            k = 2))), "\x05\x07\x02")
+
+    def test_build_within_restream(self):
+        c = Restream(
+            Checksum(UBInt16("checksum"), "internet", lambda ctx: (-2, 0)),
+            BitStreamReader, BitStreamWriter, lambda size: size // 8)
+        self.assertRaises(ChecksumError, c.build, 0)
+
+    def test_build_patches_later_span(self):
+        obj = Container(start = ipv4[:10], checksum = 0, end = ipv4[12:])
+        self.assertEqual(self.header.build(obj), ipv4)
+
+    def test_build_crc(self):
+        chunks = GreedyRange(self.chunk)
+        data = chunks.build([
+            Container(length = 0, type = "IEND", data = "", crc = 0),
+            Container(length = 3, type = "tEXt", data = "abc", crc = 0),
+        ])
+        self.assertEqual(data[:12], "\x00\x00\x00\x00IEND\xaeB`\x82")
+        self.assertEqual(chunks.parse(data)[1].data, "abc")
+
+    def test_nested(self):
+        # the crc covers the internet checksum, which is patched first
+        packet = Struct("packet",
+            Bytes("start", 10),
+            Checksum(UBInt16("checksum"), "internet",
+                lambda ctx: (-10, 10)),
+            Bytes("end", 8),
+            Checksum(UBInt32("crc"), "crc32", lambda ctx: (-20, 0)),
+        )
+        data = packet.build(Container(start = ipv4[:10], checksum = 0,
+            end = ipv4[12:], crc = 0))
+        self.assertEqual(data[:20], ipv4)
+        packet.parse(data)
+
+    def test_digest(self):
+        digested = Struct("digested",
+            Checksum(Bytes("md5", 16), "md5", lambda ctx: (16, 21)),
+            Bytes("payload", 5),
+        )
+        data = digested.build(Container(md5 = None, payload = "hello"))
+        self.assertEqual(data[:16].encode("hex"),
+            "5d41402abc4b2a76b9719d911017c592")
+        self.assertEqual(digested.parse(data).payload, "hello")
+
+
+class TestDecompressed(unittest.TestCase):
+
+    def setUp(self):
+        self.elements = range(0, 50000, 7)
+        self.data = "".join("\x00\x00" + chr(i >> 8) + chr(i & 0xff)
+            for i in self.elements)
+        self.compressed = zlib.compress(self.data)
+
+    def test_parse(self):
+        c = Struct("foo",
+            Decompressed(GreedyRange(UBInt32("elements"))),
+            UBInt8("after"),
+            Terminator,
+        )
+        obj = c.parse(self.compressed + "\x2a")
+        self.assertEqual(obj.elements, self.elements)
+        self.assertEqual(obj.after, 0x2a)
+
+    def test_parse_length(self):
+        c = Struct("foo",
+            UBInt16("length"),
+            Decompressed(UBInt32("first"), "zlib", lambda ctx: ctx.length),
+            CString("after"),
+        )
+        length = len(self.compressed)
+        obj = c.parse(chr(length >> 8) + chr(length & 0xff) +
+            self.compressed + "abc\x00")
+        self.assertEqual(obj.first, 0)
+        self.assertEqual(obj.after, "abc")
+
+    def test_parse_length_with_padding(self):
+        c = Struct("foo",
+            UBInt8("length"),
+            Decompressed(CString("text"), "zlib", lambda ctx: ctx.length),
+            UBInt8("tail"),
+        )
+        compressed = zlib.compress("abc\x00")
+        obj = c.parse(chr(len(compressed) + 4) + compressed + "PPPP\x07")
+        self.assertEqual(obj.text, "abc")
+        self.assertEqual(obj.tail, 7)
+
+    def test_parse_bad_data(self):
+        c = Decompressed(UBInt32("foo"))
+        self.assertRaises(FieldError, c.parse, "not zlib data")
+
+    def test_build(self):
+        c = Struct("foo",
+            Decompressed(GreedyRange(UBInt32("elements")), "bz2"),
+            UBInt8("after"),
+        )
+        data = c.build(Container(elements = self.elements, after = 1))
+        self.assertEqual(bz2.decompress(data[:-1]), self.data)
+        self.assertEqual(c.parse(data).elements, self.elements)
+
+    def test_build_length_mismatch(self):
+        c = Decompressed(UBInt32("foo"), "zlib", 3)
+        self.assertRaises(FieldError, c.build, 5)
+
+    def test_sizeof(self):
+        self.assertRaises(SizeofError, Decompressed(UBInt32("foo")).sizeof)
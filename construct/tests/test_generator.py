@@ -0,0 +1,69 @@
+import unittest
+
+from construct import (Struct, Switch, Enum, OneOf, Magic, Const,
+    PascalString, PrefixedArray, Array, CString, Padding, BitStruct,
+    Nibble, Flag, UBInt8, UBInt16, Field, Container)
+from construct.lib import StringIO
+from construct.generator import (Generator, GenerationError, generate,
+    generate_stream)
+
+
+record = Struct("record",
+    Magic("RC"),
+    Enum(UBInt8("type"), INT = 1, TEXT = 2, BLOB = 3),
+    OneOf(UBInt8("version"), [3, 5]),
+    Const(UBInt8("reserved"), 0),
+    BitStruct("flags", Flag("urgent"), Padding(3), Nibble("priority")),
+    Switch("value", lambda ctx: ctx.type, {
+        "INT" : UBInt16("number"),
+        "TEXT" : PascalString("text"),
+        "BLOB" : PrefixedArray(UBInt8("bytes")),
+    }),
+    UBInt8("count"),
+    Array(lambda ctx: ctx.count, CString("names")),
+    Field("trailer", lambda ctx: ctx.count),
+)
+
+class TestGenerate(unittest.TestCase):
+
+    def test_valid(self):
+        for obj in generate(record, seed = 0, count = 50):
+            self.assertTrue(obj.type in ("INT", "TEXT", "BLOB"))
+            self.assertTrue(obj.version in (3, 5))
+            self.assertEqual(obj.reserved, 0)
+            self.assertEqual(len(obj.names), obj.count)
+            self.assertEqual(len(obj.trailer), obj.count)
+            self.assertEqual(record.parse(record.build(obj)), obj)
+
+    def test_switch_cases(self):
+        types = set(obj.type for obj in generate(record, seed = 0,
+            count = 50))
+        self.assertEqual(types, set(["INT", "TEXT", "BLOB"]))
+
+    def test_deterministic(self):
+        self.assertEqual(list(generate(record, seed = 7, count = 5)),
+            list(generate(record, seed = 7, count = 5)))
+        self.assertNotEqual(list(generate(record, seed = 7, count = 5)),
+            list(generate(record, seed = 8, count = 5)))
+
+    def test_max_length(self):
+        for obj in generate(record, seed = 0, count = 20, max_length = 3):
+            self.assertTrue(obj.count <= 3)
+
+    def test_impossible(self):
+        con = Struct("foo", UBInt8("a"),
+            Switch("b", lambda ctx: ctx.a + 1000, {}))
+        gen = Generator(con, seed = 0, attempts = 5)
+        self.assertRaises(GenerationError, gen.record)
+
+    def test_generate_stream(self):
+        stream = StringIO()
+        size = generate_stream(record, stream, seed = 0, count = 30)
+        self.assertEqual(size, len(stream.getvalue()))
+        stream.seek(0)
+        for i in range(30):
+            record.parse_stream(stream)
+        self.assertEqual(stream.read(), "")
+
+if __name__ == "__main__":
+    unittest.main()
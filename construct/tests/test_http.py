@@ -0,0 +1,123 @@
+import unittest
+from StringIO import StringIO
+
+from construct.protocols.application.http import (HttpParser, HttpError,
+    http_reply, http_request_message, http_reply_message)
+
+class Trickle(object):
+    """a stream that returns a few bytes per read, like a socket"""
+
+    def __init__(self, data, size=3):
+        self.stream = StringIO(data)
+        self.size = size
+
+    def read(self, count):
+        return self.stream.read(min(count, self.size))
+
+requests = (
+    "POST /submit HTTP/1.1\r\n"
+    "Host: example.com\r\n"
+    "Content-Length: 11\r\n"
+    "\r\n"
+    "hello world"
+    "GET /index.html HTTP/1.1\r\n"
+    "Host: example.com\r\n"
+    "\r\n"
+    "PUT /upload HTTP/1.1\r\n"
+    "Transfer-Encoding: chunked\r\n"
+    "\r\n"
+    "5\r\nhello\r\n"
+    "6;name=value\r\n world\r\n"
+    "0\r\n"
+    "Trailer: yes\r\n"
+    "\r\n"
+)
+
+class TestHttpParser(unittest.TestCase):
+
+    def test_requests(self):
+        messages = [(header.command, header.url, body.read())
+            for header, body in HttpParser(StringIO(requests))]
+        self.assertEqual(messages, [
+            ("POST", "/submit", "hello world"),
+            ("GET", "/index.html", ""),
+            ("PUT", "/upload", "hello world"),
+        ])
+
+    def test_trickle(self):
+        parser = HttpParser(Trickle(requests), blocksize=5)
+        messages = [(header.command, body.read(4) + body.read())
+            for header, body in parser]
+        self.assertEqual(messages, [
+            ("POST", "hello world"),
+            ("GET", ""),
+            ("PUT", "hello world"),
+        ])
+
+    def test_skip_bodies(self):
+        commands = [header.command
+            for header, body in HttpParser(Trickle(requests, 7))]
+        self.assertEqual(commands, ["POST", "GET", "PUT"])
+
+    def test_params(self):
+        header, body = HttpParser(StringIO(requests)).next()
+        self.assertEqual(header.params["Host"], "example.com")
+        self.assertEqual(header.version, "1.1")
+
+    def test_reply(self):
+        data = ("HTTP/1.0 200 OK\r\n"
+            "Content-Type: text/plain\r\n"
+            "\r\n"
+            "until the connection closes")
+        parser = HttpParser(Trickle(data), replies=True)
+        header, body = parser.next()
+        self.assertEqual((header.code, header.text), (200, "OK"))
+        self.assertEqual(body.read(), "until the connection closes")
+        self.assertEqual(parser.next(), None)
+
+    def test_reply_matches_http_reply(self):
+        data = ("HTTP/1.1 404 Not Found\r\n"
+            "Content-length: 4\r\n"
+            "\r\n"
+            "gone")
+        header, body = HttpParser(StringIO(data), replies=True).next()
+        obj = http_reply.parse(data)
+        self.assertEqual(body.read(), obj.data)
+        del obj["data"]
+        self.assertEqual(header, obj)
+
+    def test_header_too_large(self):
+        data = "GET / HTTP/1.1\r\nCookie: %s\r\n\r\n" % ("x" * 1000,)
+        parser = HttpParser(StringIO(data), max_header=100)
+        self.assertRaises(HttpError, parser.next)
+
+    def test_bad_header(self):
+        parser = HttpParser(StringIO("GARBAGE\r\n\r\n"))
+        self.assertRaises(HttpError, parser.next)
+
+    def test_truncated_body(self):
+        data = "POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\nshort"
+        header, body = HttpParser(StringIO(data)).next()
+        self.assertRaises(HttpError, body.read)
+
+class TestHttpMessages(unittest.TestCase):
+
+    def test_chunked(self):
+        data = ("PUT /upload HTTP/1.1\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "\r\n"
+            "5\r\nhello\r\n"
+            "0\r\n"
+            "\r\n")
+        obj = http_request_message.parse(data)
+        self.assertEqual(obj.data, "hello")
+        self.assertEqual(http_request_message.build(obj), data)
+
+    def test_lengths(self):
+        obj = http_reply_message.parse("HTTP/1.1 200 OK\r\n"
+            "content-length: 3\r\n\r\nabcdef")
+        self.assertEqual(obj.data, "abc")
+        obj = http_reply_message.parse("HTTP/1.0 200 OK\r\n\r\nabcdef")
+        self.assertEqual(obj.data, "abcdef")
+        obj = http_reply_message.parse("HTTP/1.1 304 Not Modified\r\n\r\n")
+        self.assertEqual(obj.data, "")
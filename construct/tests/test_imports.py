@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+from subprocess import Popen, PIPE
+
+import construct
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(construct.__file__)))
+
+def imported_after(statement, prefixes):
+    """
+    Run a statement in a fresh interpreter and return the names of the
+    modules, starting with any of the given prefixes, that it imported.
+    """
+    code = ("import sys\n"
+        "before = set(sys.modules)\n"
+        "%s\n"
+        "print ' '.join(sorted(m for m in set(sys.modules) - before\n"
+        "    if sys.modules[m] is not None and m.startswith(%r)))\n"
+        % (statement, tuple(prefixes)))
+    p = Popen([sys.executable, "-c", code], stdout=PIPE, cwd=root)
+    out = p.communicate()[0]
+    assert p.returncode == 0, out
+    return set(out.split())
+
+class TestImportCost(unittest.TestCase):
+
+    def test_construct_avoids_debugging_modules(self):
+        self.assertEqual(imported_after("import construct",
+            ["pdb", "inspect", "bdb", "dis", "tokenize"]), set())
+
+    def test_construct_avoids_schema(self):
+        self.assertEqual(imported_after("import construct",
+            ["construct.schema", "copy", "weakref"]), set())
+
+    def test_construct_avoids_threading(self):
+        self.assertEqual(imported_after("import construct",
+            ["threading", "collections", "heapq"]), set())
+
+    def test_construct_avoids_checksum_modules(self):
+        self.assertEqual(imported_after("import construct",
+            ["hashlib", "_hashlib", "_md5", "_sha", "zlib"]), set())
+        self.assertEqual(imported_after("from construct import Checksum, "
+            "UBInt32\nChecksum(UBInt32('crc'), 'crc32', None)",
+            ["zlib"]), set(["zlib"]))
+
+    def test_construct_avoids_compression_modules(self):
+        self.assertEqual(imported_after("import construct",
+            ["zlib", "bz2"]), set())
+        self.assertEqual(imported_after("from construct.lib.compression "
+            "import DecompressingReader\nDecompressingReader(None, 'bz2')",
+            ["zlib", "bz2"]), set(["bz2"]))
+
+    def test_package_imports_no_modules(self):
+        self.assertEqual(imported_after("import construct.protocols.layer3",
+            ["construct.protocols.layer3."]), set())
+        self.assertEqual(imported_after("import construct.formats.graphics",
+            ["construct.formats.graphics."]), set())
+
+    def test_attribute_imports_its_module(self):
+        self.assertEqual(imported_after(
+            "from construct.protocols.layer3 import ipv4_header",
+            ["construct.protocols.layer3."]),
+            set(["construct.protocols.layer3.ipv4"]))
+
+    def test_submodule_attribute(self):
+        from construct.protocols import layer4
+        self.assertEqual(layer4.udp.udp_header.name, "udp_header")
+        self.assertTrue(layer4.udp_header is layer4.udp.udp_header)
+        self.assertRaises(AttributeError, getattr, layer4, "nope")
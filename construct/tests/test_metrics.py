@@ -0,0 +1,90 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from construct import Struct, UBInt8, Field, Const, ConstError, FieldError
+from construct.metrics import (Histogram, MetricsCollector, Metrics,
+    prometheus_text, write_prometheus, _bit_length)
+
+
+foo = Struct("foo",
+    UBInt8("length"),
+    Field("data", lambda ctx: ctx.length),
+    Const(UBInt8("end"), 0),
+)
+
+class TestHistogram(unittest.TestCase):
+
+    def test_precision(self):
+        h = Histogram(precision = 4)
+        for us in range(1, 1001):
+            h.record(us / 1e6)
+        self.assertEqual(h.count, 1000)
+        self.assertTrue(len(h.counts) < 100)
+        for q in (0.5, 0.9, 0.99):
+            value = h.percentile(q) * 1e6
+            self.assertTrue(abs(value - q * 1000) <= q * 1000 / 8.0 + 1,
+                (q, value))
+        self.assertEqual(h.percentile(1.0), h.max)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(0.5), None)
+
+    def test_bit_length(self):
+        for value, bits in [(0, 0), (1, 1), (7, 3), (8, 4), (255, 8),
+                (256, 9), (2 ** 40, 41), (-5, 3)]:
+            self.assertEqual(_bit_length(value), bits)
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counts(self):
+        m = Metrics(foo)
+        m.parse("\x02ab\x00")
+        m.parse("\x01a\x00")
+        self.assertRaises(ConstError, m.parse, "\x01a\x01")
+        self.assertRaises(FieldError, m.parse, "\x05a")
+        m.build(m.parse("\x00\x00"))
+        d = m.collector.to_dict()
+        self.assertEqual(d["name"], "foo")
+        self.assertEqual(d["calls"], {"parse" : 5, "build" : 1})
+        self.assertEqual(d["bytes"], {"parse" : 9, "build" : 2})
+        self.assertEqual(d["errors"], {"parse:ConstError" : 1,
+            "parse:FieldError" : 1})
+        self.assertEqual(d["latency"]["parse"]["count"], 5)
+
+    def test_prometheus(self):
+        a = Metrics(foo, MetricsCollector("a"))
+        b = Metrics(foo, MetricsCollector('b"'))
+        a.parse("\x00\x00")
+        self.assertRaises(ConstError, b.parse, "\x00\x01")
+        text = prometheus_text(a.collector, b.collector)
+        lines = text.splitlines()
+        self.assertEqual(lines.count("# TYPE construct_parse_total counter"),
+            1)
+        self.assertTrue('construct_parse_total{construct="a"} 1' in lines)
+        self.assertTrue('construct_parse_bytes_total{construct="a"} 2'
+            in lines)
+        self.assertTrue('construct_errors_total{construct="b\\"",'
+            'error="ConstError",operation="parse"} 1' in lines)
+        self.assertTrue('construct_build_seconds{construct="a",'
+            'quantile="0.5"} NaN' in lines)
+        self.assertTrue('construct_parse_seconds_count{construct="a"} 1'
+            in lines)
+
+    def test_write_prometheus(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "construct.prom")
+            collector = MetricsCollector("foo")
+            write_prometheus(path, collector)
+            with open(path) as f:
+                self.assertEqual(f.read(), prometheus_text(collector))
+            self.assertEqual(os.listdir(directory), ["construct.prom"])
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import threading
+
+from construct import Construct, Packrat, Memoize, Select, Sequence
+from construct import LazyBound, FieldError
+from construct.text import Literal
+
+class Counted(Construct):
+    """a one-byte digit, counting how many times it was parsed"""
+
+    def __init__(self, name):
+        Construct.__init__(self, name)
+        self.count = 0
+
+    def _parse(self, stream, context):
+        self.count += 1
+        ch = stream.read(1)
+        if not ch.isdigit():
+            raise FieldError("not a digit", ch)
+        return int(ch)
+
+def grammar(memoize):
+    wrap = Memoize if memoize else (lambda subcon: subcon)
+    digit = Counted("digit")
+    # sum := atom "+" sum | atom "-" sum | atom
+    # atom := "(" sum ")" | digit
+    # is exponential in the nesting depth without memoization
+    atom = wrap(Select("atom",
+        Sequence("parens", Literal("("), LazyBound("sum", lambda: sum_),
+            Literal(")")),
+        digit,
+    ))
+    sum_ = wrap(Select("sum",
+        Sequence("add", atom, Literal("+"), LazyBound("sum", lambda: sum_)),
+        Sequence("sub", atom, Literal("-"), LazyBound("sum", lambda: sum_)),
+        atom,
+    ))
+    return digit, sum_
+
+class TestPackrat(unittest.TestCase):
+
+    data = "(" * 8 + "1" + ")" * 8
+
+    def test_parse(self):
+        digit, sum_ = grammar(True)
+        self.assertEqual(Packrat(sum_).parse("1+(2-3)"),
+            [1, [[2, 3]]])
+
+    def test_linear(self):
+        digit, sum_ = grammar(True)
+        Packrat(sum_).parse(self.data)
+        self.assertEqual(digit.count, 1)
+
+    def test_exponential_without_memoize(self):
+        digit, sum_ = grammar(False)
+        Packrat(sum_).parse(self.data)
+        self.assertEqual(digit.count, 3 ** 9)
+
+    def test_memoize_outside_packrat(self):
+        digit, sum_ = grammar(True)
+        sum_.parse(self.data)
+        self.assertEqual(digit.count, 3 ** 9)
+
+    def test_failure_remembered(self):
+        digit = Counted("digit")
+        rule = Memoize(digit)
+        con = Packrat(Select("foo",
+            Sequence("a", rule, Literal("a")),
+            Sequence("b", rule, Literal("b")),
+            Sequence("c", Literal("x"), Literal("c")),
+        ))
+        self.assertEqual(con.parse("xc"), [])
+        self.assertEqual(digit.count, 1)
+
+    def test_table_per_parse(self):
+        digit = Counted("digit")
+        con = Packrat(Memoize(digit))
+        self.assertEqual(con.parse("1"), 1)
+        self.assertEqual(con.parse("2"), 2)
+        self.assertEqual(digit.count, 2)
+
+    def test_threads(self):
+        results = []
+        def parse():
+            digit, sum_ = grammar(True)
+            Packrat(sum_).parse(self.data)
+            results.append(digit.count)
+        threads = [threading.Thread(target=parse) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [1] * 4)
@@ -0,0 +1,56 @@
+from __future__ import with_statement
+
+import os
+import unittest
+
+from construct import ULInt32, Struct, Field
+from construct.formats.data.cap import cap_file, packet
+from construct import parallel
+from construct.parallel import parse_parallel, iparse_parallel, record_offsets
+
+capfile = os.path.join(os.path.dirname(__file__), "cap2.cap")
+
+def packet_size(data, offset):
+    return 16 + ULInt32(None).parse(data[offset + 8:offset + 12])
+
+class TestParseParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.offsets = record_offsets(capfile, 24, packet_size)
+        with open(capfile, "rb") as f:
+            self.packets = cap_file.parse_stream(f).packets
+
+    def test_record_offsets(self):
+        self.assertEqual(len(self.offsets), len(self.packets))
+        self.assertEqual(self.offsets[:2], [24, 24 + 16 + 74])
+
+    def test_parse(self):
+        self.assertEqual(parse_parallel(packet, capfile, self.offsets,
+            workers=2, chunksize=50), self.packets)
+
+    def test_parse_reducer(self):
+        total = parse_parallel(packet, capfile, self.offsets, workers=2,
+            reducer=lambda acc, obj: acc + obj.length, initial=0)
+        self.assertEqual(total, sum(p.length for p in self.packets))
+
+    def test_interleaved(self):
+        heads = Struct("head", Field("data", 4))
+        first = iparse_parallel(packet, capfile, self.offsets, workers=1,
+            chunksize=1)
+        second = iparse_parallel(heads, capfile, self.offsets, workers=1,
+            chunksize=1)
+        self.assertEqual(first.next(), self.packets[0])
+        self.assertEqual(len(second.next().data), 4)
+        # the jobs are held by their workers only
+        self.assertEqual(parallel._worker, None)
+        self.assertFalse(hasattr(parallel, "_job"))
+        self.assertEqual(first.next(), self.packets[1])
+        first.close()
+        self.assertEqual(len(second.next().data), 4)
+        second.close()
+
+    def test_iparse_unordered(self):
+        lengths = [p.length for p in iparse_parallel(packet, capfile,
+            self.offsets, workers=2, chunksize=10, ordered=False)]
+        self.assertEqual(sorted(lengths),
+            sorted(p.length for p in self.packets))
@@ -0,0 +1,124 @@
+from __future__ import with_statement
+
+import unittest
+
+from construct import (Struct, Embedded, Padding, Array, Rename, BitStruct,
+    Nibble, UBInt8, UBInt16, Field, Switch, HexDumpAdapter, OnDemand,
+    Profile, Profiler)
+from construct.core import FormatField
+from construct import debug
+from construct.debug import AllocationProfiler
+
+
+foo = Struct("foo",
+    UBInt8("length"),
+    Rename("data", Field("bytes", lambda ctx: ctx.length)),
+    Padding(1),
+    Embedded(Struct(None, UBInt16("embedded"))),
+    Array(3, UBInt8("items")),
+    BitStruct("bits", Nibble("high"), Nibble("low")),
+)
+data = "\x02ab\x00\x00\x01\x01\x02\x03\xff"
+
+class TestProfiler(unittest.TestCase):
+
+    def test_paths(self):
+        profiler = Profiler()
+        with profiler:
+            foo.parse(data)
+            foo.parse(data)
+        self.assertEqual(sorted(profiler.stats), ["foo", "foo.bits",
+            "foo.bits.high", "foo.bits.low", "foo.data", "foo.embedded",
+            "foo.items", "foo.length"])
+        stats = profiler.stats
+        self.assertEqual(stats["foo"].calls, 2)
+        self.assertEqual(stats["foo.items"].calls, 2)
+        self.assertEqual(stats["foo"].bytes, 2 * len(data))
+        self.assertEqual(stats["foo.data"].bytes, 4)
+        self.assertEqual(stats["foo.items"].bytes, 6)
+        self.assertTrue(stats["foo"].inclusive >= stats["foo"].exclusive)
+        self.assertTrue(stats["foo"].inclusive >= stats["foo.items"].inclusive)
+
+    def test_uninstrumented(self):
+        with Profiler():
+            self.assertTrue(hasattr(FormatField._parse.im_func, "original"))
+        self.assertFalse(hasattr(FormatField._parse.im_func, "original"))
+
+    def test_tree_only(self):
+        from construct.core import Pointer
+        with Profiler(foo):
+            self.assertTrue(hasattr(FormatField._parse.im_func, "original"))
+            self.assertFalse(hasattr(Pointer._parse.im_func, "original"))
+        self.assertFalse(hasattr(FormatField._parse.im_func, "original"))
+        Profile(foo).parse(data)
+        self.assertFalse(hasattr(FormatField._parse.im_func, "original"))
+
+    def test_one_active(self):
+        with Profiler():
+            self.assertRaises(ValueError, Profiler().__enter__)
+
+    def test_reports(self):
+        profiler = Profiler()
+        with profiler:
+            foo.parse(data)
+        lines = profiler.report(sort = "path").splitlines()
+        self.assertEqual(len(lines), 9)
+        self.assertTrue(lines[1].endswith("  foo"))
+        self.assertEqual(len(profiler.report(limit = 2).splitlines()), 3)
+        folded = dict(line.rsplit(" ", 1)
+            for line in profiler.folded().splitlines())
+        self.assertTrue("foo;bits;high" in folded)
+
+    def test_profile(self):
+        p = Profile(foo)
+        self.assertEqual(p.parse(data).items, [1, 2, 3])
+        p.parse(data)
+        self.assertEqual(p.profiler.stats["foo"].calls, 2)
+
+class TestAllocationProfiler(unittest.TestCase):
+
+    def test_counts(self):
+        bar = Struct("bar",
+            UBInt8("count"),
+            Array(lambda ctx: ctx.count, Struct("items",
+                UBInt8("length"),
+                HexDumpAdapter(Field("data", lambda ctx: ctx.length)),
+            )),
+            Switch("tail", lambda ctx: ctx.count, {
+                2 : Struct("two", UBInt8("x")),
+            }),
+            OnDemand(Field("lazy", 4)),
+        )
+        profiler = AllocationProfiler()
+        with profiler:
+            obj = bar.parse("\x02\x01a\x02bc\x07abcd")
+        stats = profiler.stats
+        self.assertEqual(stats["bar"].objects, {"Container" : 1})
+        self.assertEqual(stats["bar.items"].calls, 1)
+        self.assertEqual(stats["bar.items"].objects, {"Container" : 2,
+            "ListContainer" : 1})
+        self.assertEqual(stats["bar.items.data"].objects, {"HexString" : 2})
+        # returned by the case, not counted again by the switch
+        self.assertEqual(stats["bar.tail"].objects, {})
+        self.assertEqual(stats["bar.tail.two"].objects, {"Container" : 1})
+        self.assertEqual(stats["bar.lazy"].objects, {"LazyContainer" : 1})
+        self.assertTrue(stats["bar.items.data"].bytes > 0)
+        self.assertEqual(len(profiler._seen), 0)
+        lines = profiler.report(sort = "Container").splitlines()
+        self.assertTrue(lines[1].endswith("  bar.items"))
+
+    def test_without_getsizeof(self):
+        # as on Python 2.5
+        original = debug._getsizeof
+        debug._getsizeof = lambda obj: 0
+        try:
+            profiler = AllocationProfiler()
+            with profiler:
+                Struct("foo", UBInt8("a")).parse("\x01")
+        finally:
+            debug._getsizeof = original
+        self.assertEqual(profiler.stats["foo"].objects, {"Container" : 1})
+        self.assertEqual(profiler.stats["foo"].bytes, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from StringIO import StringIO
+
+from construct import Struct, Sequence, Field, LazyBound, Container
+from construct import ConstError, FieldError, UBInt8
+from construct.text import (CompiledRegex, NotRegular, compile_regular,
+    StringUpto, Literal, Whitespace, CharRun, DecNumber, Identifier, Line,
+    QuotedString)
+
+param = Struct("param",
+    StringUpto("name", ":\r\n"),
+    Literal(":"),
+    Whitespace(),
+    StringUpto("value", "\r"),
+    Literal("\r\n"),
+)
+
+class TestCompiledRegex(unittest.TestCase):
+
+    def setUp(self):
+        self.param = CompiledRegex(param)
+
+    def test_parse(self):
+        stream = StringIO("Host: example.com\r\nrest")
+        self.assertEqual(self.param.parse_stream(stream),
+            Container(name="Host", value="example.com"))
+        self.assertEqual(stream.read(), "rest")
+
+    def test_parse_adapters(self):
+        con = CompiledRegex(Sequence("foo",
+            DecNumber("number"),
+            Whitespace(),
+            Identifier("symbol"),
+        ))
+        self.assertEqual(con.parse("42 foo_1"), [42, "foo_1"])
+
+    def test_parse_long(self):
+        data = "Cookie: %s\r\n" % ("x" * 100000,)
+        self.assertEqual(self.param.parse(data).value, "x" * 100000)
+        # the window grew for that parse only
+        self.assertEqual(self.param.window, 256)
+
+    def test_failed_match_in_window(self):
+        class Stream(StringIO):
+            def read(self, count = -1):
+                reads.append(count)
+                return StringIO.read(self, count)
+        reads = []
+        stream = Stream("Host example.com\r\n" + "x" * 100000)
+        self.assertRaises(ConstError, self.param.parse_stream, stream)
+        self.assertEqual(max(reads), 256)
+
+    def test_atomic(self):
+        # the run takes every a and b, and never gives back the last b
+        con = Struct("foo", CharRun("ab", "ab"), Literal("b"))
+        self.assertRaises(FieldError, CompiledRegex(con).parse, "aabb")
+
+    def test_error(self):
+        self.assertRaises(ConstError, self.param.parse, "Host example.com\r\n")
+
+    def test_build(self):
+        obj = Container(name="Host", value="example.com")
+        self.assertEqual(self.param.build(obj), "Host: example.com\r\n")
+
+    def test_not_regular(self):
+        self.assertRaises(NotRegular, CompiledRegex,
+            Struct("foo", LazyBound("bar", lambda: param)))
+        self.assertRaises(NotRegular, CompiledRegex,
+            Struct("foo", UBInt8("bar")))
+
+class TestCompileRegular(unittest.TestCase):
+
+    def setUp(self):
+        self.con = Struct("foo",
+            Line("first"),
+            QuotedString("quoted"),
+            Literal(" "),
+            DecNumber("length"),
+            Literal(" "),
+            Field("data", lambda ctx: ctx.length),
+            param,
+        )
+        self.data = 'hello\n"a \\" b" 3 xyzHost: example.com\r\n'
+
+    def test_parse(self):
+        fast = compile_regular(self.con)
+        self.assertEqual(fast.parse(self.data), self.con.parse(self.data))
+
+    def test_build(self):
+        fast = compile_regular(self.con)
+        self.assertEqual(fast.build(fast.parse(self.data)), self.data)
+
+    def test_compiled(self):
+        fast = compile_regular(self.con)
+        self.assertTrue(isinstance(fast.subcons[2].subcon, CompiledRegex))
+        self.assertTrue(isinstance(fast.subcons[4], CompiledRegex))
+        self.assertFalse(isinstance(self.con.subcons[4], CompiledRegex))
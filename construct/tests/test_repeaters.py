@@ -4,6 +4,7 @@ from construct import UBInt8
 from construct import Repeater
 from construct import StrictRepeater, GreedyRepeater, OptionalGreedyRepeater
 from construct import ArrayError, RangeError
+from construct import Struct, Array, Value, Reconfig, Construct, Container
 
 class TestRepeater(unittest.TestCase):
 
@@ -95,3 +96,25 @@ class TestOptionalGreedyRepeater(unittest.TestCase):
 
     def test_build(self):
         self.assertEqual(self.c.build([1, 2]), "\x01\x02")
+
+class TestCopyContext(unittest.TestCase):
+
+    def setUp(self):
+        element = Struct("element", UBInt8("n"), nested = False)
+        element = Reconfig("element", element,
+            setflags = Construct.FLAG_COPY_CONTEXT)
+        self.c = Struct("foo",
+            UBInt8("n"),
+            Array(lambda ctx: ctx.n, element),
+            Value("after", lambda ctx: ctx.n),
+        )
+
+    def test_parse(self):
+        obj = self.c.parse("\x02\x07\x09")
+        self.assertEqual(obj.after, 2)
+        self.assertEqual([e.n for e in obj.element], [7, 9])
+
+    def test_build(self):
+        obj = Container(n = 2, element = [Container(n = 7), Container(n = 9)],
+            after = 2)
+        self.assertEqual(self.c.build(obj), "\x02\x07\x09")
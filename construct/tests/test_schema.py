@@ -0,0 +1,159 @@
+import unittest
+
+from construct import (Struct, Embedded, Switch, Array, Field, CString,
+    UBInt8, UBInt16, Alias, Pass, Container, FieldError)
+from construct.lib import StringIO
+from construct.schema import (subconstructs, walk, reads, context_reads,
+    project, iterparse, fingerprint)
+
+class TestWalk(unittest.TestCase):
+
+    def test_subconstructs(self):
+        a, b = UBInt8("a"), UBInt8("b")
+        self.assertEqual(subconstructs(Struct("foo", a, b)), [a, b])
+        sw = Switch("sw", lambda ctx: 1, {1: a}, default=b)
+        self.assertEqual(set(map(id, subconstructs(sw))), set([id(a), id(b)]))
+
+    def test_walk(self):
+        a = UBInt8("a")
+        s = Struct("foo", a, Struct("bar", a))
+        self.assertEqual([c.name for c in walk(s)], ["foo", "a", "bar"])
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_equal_structures(self):
+        def make():
+            return Struct("foo", UBInt8("length"),
+                Field("data", lambda ctx: ctx.length))
+        self.assertEqual(fingerprint(make()), fingerprint(make()))
+
+    def test_different_structures(self):
+        base = fingerprint(Struct("foo", UBInt8("a")))
+        self.assertNotEqual(base, fingerprint(Struct("foo", UBInt16("a"))))
+        self.assertNotEqual(base, fingerprint(Struct("foo", UBInt8("b"))))
+        self.assertNotEqual(
+            fingerprint(Field("data", lambda ctx: ctx.a)),
+            fingerprint(Field("data", lambda ctx: ctx.b)))
+
+    def test_sets(self):
+        from construct import OneOf
+        # equal sets that iterate in different orders
+        a, b = set([8, 16]), set([16, 8])
+        self.assertNotEqual(list(a), list(b))
+        self.assertEqual(fingerprint(OneOf(UBInt8("x"), a)),
+            fingerprint(OneOf(UBInt8("x"), b)))
+        self.assertNotEqual(fingerprint(OneOf(UBInt8("x"), a)),
+            fingerprint(OneOf(UBInt8("x"), set([8, 17]))))
+
+    def test_recursive(self):
+        from construct import LazyBound, If
+        node = Struct("node", UBInt8("value"),
+            If(lambda ctx: ctx.value, LazyBound("next", lambda: node)))
+        self.assertEqual(len(fingerprint(node)), 40)
+
+class TestContextReads(unittest.TestCase):
+
+    def test_inferred(self):
+        f = Field("data", lambda ctx: ctx._.length * ctx["count"])
+        self.assertEqual(context_reads(f), set(["_", "length", "count"]))
+
+    def test_closure(self):
+        self.assertEqual(context_reads(Alias("foo", "bar")), set(["bar"]))
+
+    def test_declared(self):
+        f = Field("data", reads("length")(lambda ctx: ctx.length + ctx.x))
+        self.assertEqual(context_reads(f), set(["length"]))
+
+class TestProject(unittest.TestCase):
+
+    def setUp(self):
+        self.s = Struct("foo",
+            UBInt8("a"),
+            UBInt8("length"),
+            Field("data", lambda ctx: ctx.length),
+            Embedded(Struct("bar",
+                UBInt8("x"),
+                CString("name"),
+            )),
+            Switch("body", lambda ctx: ctx.a, {
+                1: Struct("one", UBInt16("b"), UBInt8("c")),
+            }, default=Pass),
+            Array(2, Struct("items", UBInt8("d"), UBInt8("e"))),
+        )
+        self.data = "\x01\x02ab\x05foo\x00\x00\x07\x08\x09\x0a\x0b\x0c"
+
+    def test_skips(self):
+        p = project(self.s, ["x"])
+        # the switch is skipped by its size, which depends on "a"
+        self.assertEqual(p.parse(self.data), Container(a=1, length=2, x=5))
+
+    def test_dependencies(self):
+        p = project(self.s, ["body.c"])
+        self.assertEqual(p.parse(self.data),
+            Container(a=1, length=2, body=Container(c=8)))
+
+    def test_unsizeable_skipped_by_parsing(self):
+        p = project(self.s, ["items.e"])
+        self.assertEqual(p.parse(self.data), Container(a=1, length=2,
+            items=[Container(e=10), Container(e=12)]))
+
+    def test_whole(self):
+        p = project(self.s, ["data", "body"])
+        self.assertEqual(p.parse(self.data), Container(a=1, length=2,
+            data="ab", body=Container(b=7, c=8)))
+
+    def test_no_such_field(self):
+        self.assertRaises(ValueError, project, self.s, ["nope"])
+
+    def test_build_unsupported(self):
+        p = project(Struct("foo", UBInt8("a"), UBInt8("b")), ["b"])
+        self.assertRaises(FieldError, p.build, Container(b=5))
+
+class TestIterparse(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        def length(ctx):
+            self.calls.append(ctx.kind)
+            return ctx.length
+        self.record = Struct("record",
+            UBInt8("kind"),
+            UBInt8("length"),
+            Field("data", reads("length")(length)),
+        )
+        self.stream = StringIO("\x01\x02ab\x02\x01c\x01\x00\x02")
+
+    def test_all(self):
+        records = list(iterparse(self.record, self.stream))
+        self.assertEqual([r.data for r in records], ["ab", "c", ""])
+        # the truncated trailing record is left in the stream
+        self.assertEqual(self.stream.read(), "\x02")
+
+    def test_where(self):
+        records = list(iterparse(self.record, self.stream,
+            where=reads("kind")(lambda r: r.kind == 1)))
+        self.assertEqual([r.data for r in records], ["ab", ""])
+
+    def test_where_skips_by_size(self):
+        list(iterparse(self.record, self.stream,
+            where=lambda r: r.kind == 2))
+        # rejected records are skipped by size, which calls the length
+        # function, but never parsed a second time
+        self.assertEqual(self.calls, [1, 2, 1])
+
+    def test_where_undeclared_field(self):
+        records = list(iterparse(self.record, self.stream,
+            where=reads("kind")(lambda r: r.data == "c")))
+        self.assertEqual([r.kind for r in records], [2])
+        self.assertTrue(all(type(r) is Container for r in records))
+
+    def test_where_error(self):
+        calls = []
+        def where(r):
+            calls.append(r.kind)
+            return {1 : True}[r.kind]
+        records = iterparse(self.record, self.stream,
+            where=reads("kind")(where))
+        self.assertRaises(KeyError, list, records)
+        # the error is raised at once, not taken for a missing field
+        self.assertEqual(calls, [1, 2])
@@ -1,6 +1,6 @@
 import unittest
 
-from construct import String, PascalString, CString, UBInt16
+from construct import String, PascalString, CString, UBInt16, ArrayError
 
 class TestString(unittest.TestCase):
 
@@ -81,3 +81,11 @@ class TestCString(unittest.TestCase):
     def test_build_terminator(self):
         s = CString("foo", terminators="XYZ")
         self.assertEqual(s.build("hello"), "helloX")
+
+    def test_parse_encoded(self):
+        s = CString("foo", encoding="utf8")
+        self.assertEqual(s.parse("\xc3\xa9t\xc3\xa9\x00"), u"\xe9t\xe9")
+
+    def test_parse_missing_terminator(self):
+        s = CString("foo")
+        self.assertRaises(ArrayError, s.parse, "hello")
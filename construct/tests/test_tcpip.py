@@ -0,0 +1,182 @@
+import unittest
+
+from construct import Container, ConstructError, UBInt16, UBInt32, Struct
+from construct.protocols.ipstack import ip_stack
+from construct.protocols.application.http import http_request_message
+from construct.protocols.tcpip import (TcpReassembler, StreamParser,
+    ApplicationParser)
+
+client = ("10.0.0.1", 40000)
+server = ("10.0.0.2", 80)
+
+def segment(src, dst, seq, syn = False, fin = False, rst = False):
+    return Container(source = src[1], destination = dst[1], seq = seq,
+        flags = Container(syn = syn, fin = fin, rst = rst))
+
+class Recorder(object):
+    """a consumer factory recording the streams written"""
+
+    def __init__(self):
+        self.streams = {}
+        self.closed = []
+
+    def __call__(self, source, destination):
+        recorder = self
+        class Consumer(object):
+            def write(self, data):
+                recorder.streams[source] = (recorder.streams.get(source, "")
+                    + data)
+            def close(self):
+                recorder.closed.append(source)
+        return Consumer()
+
+class TestTcpReassembler(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = Recorder()
+        self.tcp = TcpReassembler(self.recorder, max_pending = 100)
+
+    def send(self, src, dst, seq, data = "", **flags):
+        self.tcp.feed_segment(src[0], dst[0], segment(src, dst, seq, **flags),
+            data, 0)
+
+    def test_in_order(self):
+        self.send(client, server, 100, syn = True)
+        self.send(server, client, 500, syn = True)
+        self.send(client, server, 101, "hello ")
+        self.send(client, server, 107, "world")
+        self.send(server, client, 501, "reply")
+        self.assertEqual(self.recorder.streams,
+            {client : "hello world", server : "reply"})
+
+    def test_out_of_order_and_retransmits(self):
+        self.send(client, server, 100, syn = True)
+        self.send(client, server, 111, "ccc")
+        self.send(client, server, 106, "bbbbb")
+        self.send(client, server, 101, "aaaaa")
+        self.send(client, server, 101, "aaaaa")
+        self.send(client, server, 106, "bbbbbcc")
+        self.assertEqual(self.recorder.streams[client], "aaaaabbbbbccc")
+        self.assertEqual(self.tcp.retransmits, 2)
+
+    def test_overlap_keeps_first(self):
+        self.send(client, server, 1, "abcdef")
+        self.send(client, server, 4, "XYZghi")
+        self.assertEqual(self.recorder.streams[client], "abcdefghi")
+
+    def test_sequence_wraparound(self):
+        self.send(client, server, 0xfffffffd, "abc")
+        self.send(client, server, 3, "ghi")
+        self.send(client, server, 0, "def")
+        self.assertEqual(self.recorder.streams[client], "abcdefghi")
+
+    def test_fin_closes(self):
+        self.send(client, server, 1, "abc")
+        self.send(client, server, 7, fin = True)
+        self.assertEqual(self.recorder.closed, [])
+        self.send(client, server, 4, "def")
+        self.assertEqual(self.recorder.closed, [client])
+        self.send(server, client, 1, "x", fin = True)
+        self.assertEqual(self.recorder.closed, [client, server])
+        self.assertEqual(len(self.tcp.flows), 0)
+
+    def test_rst_closes(self):
+        self.send(client, server, 1, "abc")
+        self.send(server, client, 1, rst = True)
+        self.assertEqual(sorted(self.recorder.closed), [client, server])
+        self.assertEqual(len(self.tcp.flows), 0)
+
+    def test_gap_abandons(self):
+        self.send(client, server, 1, "a")
+        self.send(client, server, 10, "x" * 101)
+        self.send(client, server, 2, "b")
+        self.assertEqual(self.recorder.streams[client], "a")
+        self.assertEqual(self.tcp.gaps, 1)
+
+    def test_bounded_flows(self):
+        self.tcp.max_flows = 10
+        for port in range(100):
+            self.send(("10.0.0.1", port), server, 1, "a")
+        self.assertEqual(len(self.tcp.flows), 10)
+        self.assertEqual(self.tcp.evicted, 90)
+        self.assertEqual(len(self.recorder.closed), 180)
+
+    def test_evicts_least_recently_active(self):
+        self.tcp.max_flows = 2
+        first = ("10.0.0.1", 1)
+        self.send(first, server, 1, "a")
+        self.send(("10.0.0.1", 2), server, 1, "a")
+        for seq in range(2, 1000):
+            self.send(first, server, seq, "a")
+        self.send(("10.0.0.1", 3), server, 1, "a")
+        self.assertEqual(sorted(src for src, dst in self.tcp.flows),
+            [first, ("10.0.0.1", 3)])
+        # the order of the flows does not keep every segment
+        self.assertTrue(len(self.tcp.order) <= 2 * 2 + 64 + 1)
+
+    def test_idle_eviction(self):
+        self.tcp.feed_segment(client[0], server[0], segment(client, server, 1),
+            "a", 0)
+        self.tcp.feed_segment("10.0.0.3", server[0], segment(client, server, 1),
+            "a", 1000)
+        self.assertEqual(len(self.tcp.flows), 1)
+        self.assertEqual(self.recorder.closed, [client, server])
+
+    def test_feed_ip_stack(self):
+        packet = ("0011508c283c001150886b5708004500003a0000400080060000"
+            "0a0000010a0000029c40005000000001000000005018ffff00000000"
+            "474554202f20485454502f312e300d0a0d0a").decode("hex")
+        self.assertTrue(self.tcp.feed(ip_stack.parse(packet), 0))
+        self.assertEqual(self.recorder.streams[client],
+            "GET / HTTP/1.0\r\n\r\n")
+
+class TestStreamParser(unittest.TestCase):
+
+    def test_pieces(self):
+        objs = []
+        parser = StreamParser(Struct("s", UBInt16("a"), UBInt16("b")),
+            objs.append)
+        data = "\x00\x01\x00\x02\x00\x03\x00\x04\x00"
+        for c in data:
+            parser.write(c)
+        self.assertEqual([(o.a, o.b) for o in objs], [(1, 2), (3, 4)])
+        self.assertRaises(ConstructError, parser.close)
+
+    def test_delivered_before_close(self):
+        messages = []
+        parser = StreamParser(http_request_message, messages.append)
+        parser.write("GET / HTTP/1.1\r\n\r\n")
+        self.assertEqual([obj.url for obj in messages], ["/"])
+        parser.write("GET /a HTTP/1.1\r\nHost: b\r\n\r\n" * 40)
+        self.assertEqual(len(messages), 41)
+        self.assertEqual(parser.buffer, "")
+
+    def test_max_buffer(self):
+        parser = StreamParser(UBInt32("a"), None, max_buffer = 2)
+        parser.write("\x00\x00")
+        self.assertRaises(ConstructError, parser.write, "\x00")
+
+    def test_http(self):
+        messages = []
+        parser = ApplicationParser(
+            lambda src, dst, obj: messages.append((src, obj)))
+        tcp = TcpReassembler(parser)
+        requests = ("POST /a HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+            "GET /b HTTP/1.1\r\n\r\n")
+        replies = ("HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            "2\r\nok\r\n0\r\n\r\n"
+            "HTTP/1.1 200 OK\r\n\r\nto the end")
+        for i in range(0, len(requests), 7):
+            tcp.feed_segment(client[0], server[0], segment(client,
+                server, 1 + i), requests[i:i + 7], 0)
+        for i in range(0, len(replies), 5):
+            tcp.feed_segment(server[0], client[0], segment(server,
+                client, 1 + i), replies[i:i + 5], 0)
+        tcp.close()
+        self.assertEqual([(src, obj.get("url"), obj.data)
+            for src, obj in messages], [
+            (client, "/a", "hello"),
+            (client, "/b", ""),
+            (server, None, "ok"),
+            (server, None, "to the end"),
+        ])
@@ -1,7 +1,9 @@
 import unittest
+from StringIO import StringIO
 
-from construct.text import Whitespace
-from construct import RangeError
+from construct.text import Whitespace, CharRun, QuotedString, QuotedStringError
+from construct.text import DecNumber, HexNumber, Identifier
+from construct import RangeError, FieldError
 
 class TestWhitespace(unittest.TestCase):
 
@@ -13,3 +15,70 @@ class TestWhitespace(unittest.TestCase):
 
     def test_build(self):
         self.assertEqual(Whitespace().build(None), " ")
+
+class TestCharRun(unittest.TestCase):
+
+    def setUp(self):
+        self.cr = CharRun("digits", "0123456789", 1)
+
+    def test_parse(self):
+        stream = StringIO("1234x")
+        self.assertEqual(self.cr.parse_stream(stream), "1234")
+        self.assertEqual(stream.read(), "x")
+
+    def test_parse_long(self):
+        stream = StringIO("7" * 1000 + "x")
+        self.assertEqual(self.cr.parse_stream(stream), "7" * 1000)
+        self.assertEqual(stream.read(), "x")
+
+    def test_parse_too_short(self):
+        self.assertRaises(RangeError, self.cr.parse, "x")
+
+    def test_build(self):
+        self.assertEqual(self.cr.build("12x3"), "12")
+        self.assertRaises(RangeError, self.cr.build, "x")
+
+class TestQuotedString(unittest.TestCase):
+
+    def setUp(self):
+        self.qs = QuotedString("foo")
+
+    def test_parse(self):
+        stream = StringIO('"hello" world')
+        self.assertEqual(self.qs.parse_stream(stream), "hello")
+        self.assertEqual(stream.read(), " world")
+
+    def test_parse_escaped(self):
+        self.assertEqual(self.qs.parse(r'"a\"b\\c\d"'), r'a"b\cd')
+
+    def test_parse_escape_across_chunks(self):
+        data = "a" * 63 + r'\"' + "b" * 100
+        self.assertEqual(self.qs.parse('"%s"' % (data,)),
+            "a" * 63 + '"' + "b" * 100)
+
+    def test_parse_missing_quote(self):
+        self.assertRaises(FieldError, self.qs.parse, '"hello')
+        qs = QuotedString("foo", allow_eof=True)
+        self.assertEqual(qs.parse('"hello'), "hello")
+
+    def test_build(self):
+        self.assertEqual(self.qs.build(r'a"b\c'), r'"a\"b\\c"')
+
+    def test_build_no_escape(self):
+        qs = QuotedString("foo", esc_char=None)
+        self.assertRaises(QuotedStringError, qs.build, 'a"b')
+
+class TestNumbers(unittest.TestCase):
+
+    def test_dec(self):
+        self.assertEqual(DecNumber("foo").parse("1234"), 1234)
+        self.assertEqual(DecNumber("foo").build(1234), "1234")
+        self.assertEqual(DecNumber("foo").build(0), "0")
+
+    def test_hex(self):
+        self.assertEqual(HexNumber("foo").parse("fF"), 255)
+
+    def test_identifier(self):
+        stream = StringIO("_foo12 bar")
+        self.assertEqual(Identifier("foo").parse_stream(stream), "_foo12")
+        self.assertEqual(stream.read(), " bar")
@@ -0,0 +1,73 @@
+import unittest
+
+from construct import Struct, UBInt8, Field, Const, Trace, ConstError
+from construct.debug import hooks, HookRegistry
+
+
+foo = Struct("foo",
+    Trace(UBInt8("length")),
+    Trace(Field("data", lambda ctx: ctx.length)),
+    Trace(Const(UBInt8("end"), 0)),
+)
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+
+    def tearDown(self):
+        hooks.clear()
+
+    def record(self, event):
+        def callback(con, offset, *args):
+            self.events.append((event, con.name, offset) + args)
+        hooks.register(event, callback)
+        return callback
+
+    def test_disabled(self):
+        self.assertFalse(hooks.enabled)
+        self.assertEqual(foo.parse("\x02ab\x00").data, "ab")
+
+    def test_parse(self):
+        self.record("on_parse_enter")
+        self.record("on_parse_exit")
+        foo.parse("\x02ab\x00")
+        self.assertEqual(self.events, [
+            ("on_parse_enter", "length", 0),
+            ("on_parse_exit", "length", 1, 2),
+            ("on_parse_enter", "data", 1),
+            ("on_parse_exit", "data", 3, "ab"),
+            ("on_parse_enter", "end", 3),
+            ("on_parse_exit", "end", 4, 0),
+        ])
+
+    def test_build(self):
+        self.record("on_build_enter")
+        foo.build(foo.parse("\x01a\x00"))
+        self.assertEqual(self.events, [
+            ("on_build_enter", "length", 0, 1),
+            ("on_build_enter", "data", 1, "a"),
+            ("on_build_enter", "end", 2, 0),
+        ])
+
+    def test_error(self):
+        self.record("on_error")
+        self.assertRaises(ConstError, foo.parse, "\x01a\x05")
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(self.events[0][:3], ("on_error", "end", 2))
+        self.assertTrue(isinstance(self.events[0][3], ConstError))
+
+    def test_unregister(self):
+        callback = self.record("on_parse_enter")
+        self.assertTrue(hooks.enabled)
+        hooks.unregister("on_parse_enter", callback)
+        self.assertFalse(hooks.enabled)
+        foo.parse("\x00\x00")
+        self.assertEqual(self.events, [])
+
+    def test_unknown_event(self):
+        self.assertRaises(ValueError, HookRegistry().register, "on_foo",
+            lambda: None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,3 @@
 from common import *
 from ast import *
-
-
+from regular import *
@@ -2,11 +2,10 @@
 common constructs for typical programming languages (numbers, strings, ...)
 """
 from construct.core import (Construct, ConstructError, FieldError,
-    SizeofError)
-from construct.adapters import (Adapter, StringAdapter, IndexingAdapter,
+    SizeofError, RangeError, TerminatedField, _scan_position)
+from construct.adapters import (Adapter, StringAdapter,
     ConstAdapter, OneOf, NoneOf)
-from construct.macros import (Field, OptionalGreedyRange, GreedyRange,
-    Sequence, Optional)
+from construct.macros import Field, Sequence, Optional
 
 
 #===============================================================================
@@ -40,8 +39,7 @@ class QuotedString(Construct):
     QuotedString("foo", start_quote = "{", end_quote = "}", esc_char = None)
     """
     __slots__ = [
-        "start_quote", "end_quote", "char", "esc_char", "encoding",
-        "allow_eof"
+        "start_quote", "end_quote", "esc_char", "encoding", "allow_eof"
     ]
     def __init__(self, name, start_quote = '"', end_quote = None,
                  esc_char = '\\', encoding = None, allow_eof = False):
@@ -49,33 +47,60 @@ class QuotedString(Construct):
         if end_quote is None:
             end_quote = start_quote
         self.start_quote = Literal(start_quote)
-        self.char = Char("char")
         self.end_quote = end_quote
         self.esc_char = esc_char
         self.encoding = encoding
         self.allow_eof = allow_eof
 
+    def _find(self, chunk, start):
+        # the first escape char or closing quote at or after start
+        index = chunk.find(self.end_quote, start)
+        if self.esc_char is not None:
+            end = len(chunk) if index < 0 else index
+            i = chunk.find(self.esc_char, start, end)
+            if i >= 0:
+                index = i
+        return index
+
     def _parse(self, stream, context):
         self.start_quote._parse(stream, context)
+        pos, size = _start_scan(stream)
         text = []
         escaped = False
-        try:
-            while True:
-                ch = self.char._parse(stream, context)
-                if ch == self.esc_char:
-                    if escaped:
-                        text.append(ch)
-                        escaped = False
-                    else:
+        while True:
+            chunk = stream.read(size)
+            if not chunk:
+                if not self.allow_eof:
+                    raise FieldError("missing closing quote")
+                break
+            i = 0
+            if escaped:
+                # an escaped char is taken as is
+                text.append(chunk[0])
+                escaped = False
+                i = 1
+            index = self._find(chunk, i)
+            while index >= 0:
+                text.append(chunk[i:index])
+                if chunk[index] == self.esc_char:
+                    if index + 1 == len(chunk):
                         escaped = True
-                elif ch == self.end_quote and not escaped:
-                    break
+                        i = len(chunk)
+                        break
+                    text.append(chunk[index + 1])
+                    i = index + 2
+                    index = self._find(chunk, i)
                 else:
-                    text.append(ch)
-                    escaped = False
-        except FieldError:
-            if not self.allow_eof:
-                raise
+                    _end_scan(stream, pos, index + 1)
+                    text = "".join(text)
+                    if self.encoding is not None:
+                        text = text.decode(self.encoding)
+                    return text
+            else:
+                text.append(chunk[i:])
+            if pos is not None:
+                pos += len(chunk)
+                size = min(size * 2, TerminatedField.max_chunksize)
         text = "".join(text)
         if self.encoding is not None:
             text = text.decode(self.encoding)
@@ -85,21 +110,88 @@ class QuotedString(Construct):
         self.start_quote._build(None, stream, context)
         if self.encoding:
             obj = obj.encode(self.encoding)
-        for ch in obj:
-            if ch == self.esc_char:
-                self.char._build(self.esc_char, stream, context)
-            elif ch == self.end_quote:
-                if self.esc_char is None:
-                    raise QuotedStringError("found ending quote in data, "
-                        "but no escape char defined", ch)
-                else:
-                    self.char._build(self.esc_char, stream, context)
-            self.char._build(ch, stream, context)
-        self.char._build(self.end_quote, stream, context)
+        if self.esc_char is None:
+            if self.end_quote in obj:
+                raise QuotedStringError("found ending quote in data, "
+                    "but no escape char defined", self.end_quote)
+        else:
+            obj = obj.replace(self.esc_char, self.esc_char * 2)
+            if self.end_quote != self.esc_char:
+                obj = obj.replace(self.end_quote,
+                    self.esc_char + self.end_quote)
+        stream.write(obj + self.end_quote)
+
+    def _sizeof(self, context):
+        raise SizeofError("can't calculate size")
+
+class CharRun(Construct):
+    """
+    A run of characters of a given charset. The run is matched a chunk at a
+    time rather than a character at a time, and the stream is positioned
+    right after it. Parses and builds strings.
+
+    Parameters:
+    * name - the name of the field
+    * charset - the set of valid characters
+    * mincount - the minimal number of characters. default is 0.
+
+    Example:
+    CharRun("digits", "0123456789", 1)
+    """
+    __slots__ = ["charset", "mincount"]
+    def __init__(self, name, charset, mincount = 0):
+        Construct.__init__(self, name)
+        self.charset = "".join(sorted(set(charset)))
+        self.mincount = mincount
+        self._set_flag(self.FLAG_DYNAMIC)
+
+    def _parse(self, stream, context):
+        pos, size = _start_scan(stream)
+        if pos is None:
+            raise FieldError("cannot match a run in a stream that cannot "
+                "seek")
+        run = []
+        while True:
+            chunk = stream.read(size)
+            rest = chunk.lstrip(self.charset)
+            if rest or len(chunk) < size:
+                run.append(chunk[:len(chunk) - len(rest)])
+                break
+            run.append(chunk)
+            pos += len(chunk)
+            size = min(size * 2, TerminatedField.max_chunksize)
+        _end_scan(stream, pos, len(run[-1]))
+        run = "".join(run)
+        if len(run) < self.mincount:
+            raise RangeError("expected at least %d, found %d" %
+                (self.mincount, len(run)))
+        return run
+
+    def _build(self, obj, stream, context):
+        obj = "".join(obj)
+        rest = obj.lstrip(self.charset)
+        if len(obj) - len(rest) < self.mincount:
+            raise RangeError("expected at least %d, found %d" %
+                (self.mincount, len(obj) - len(rest)))
+        # like the repeaters, build up to the first invalid character
+        stream.write(obj[:len(obj) - len(rest)])
 
     def _sizeof(self, context):
         raise SizeofError("can't calculate size")
 
+def _start_scan(stream):
+    """the position to scan from and the size of the first chunk. streams
+    that cannot tell their position are scanned a byte at a time."""
+    pos = _scan_position(stream)
+    if pos is None:
+        return None, 1
+    return pos, TerminatedField.chunksize
+
+def _end_scan(stream, pos, length):
+    """position the stream after the scanned text"""
+    if pos is not None:
+        stream.seek(pos + length)
+
 
 #===============================================================================
 # macros
@@ -129,11 +221,7 @@ def Whitespace(charset = " \t", optional = True):
       is space and tab.
     * optional - whether or not whitespace is optional. default is True.
     """
-    con = CharOf(None, charset)
-    if optional:
-        con = OptionalGreedyRange(con)
-    else:
-        con = GreedyRange(con)
+    con = CharRun(None, charset, mincount = 0 if optional else 1)
     return WhitespaceAdapter(con, build_char = charset[0])
 
 def Literal(text):
@@ -182,7 +270,8 @@ def HexDigit(name):
 
 def Word(name):
     """a sequence of letters"""
-    return StringAdapter(GreedyRange(Alpha(name)))
+    return CharRun(name,
+        'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ', 1)
 
 class TextualIntAdapter(Adapter):
     """
@@ -209,9 +298,11 @@ class TextualIntAdapter(Adapter):
             n = obj
         r = self.radix
         digs = self.digits
-        while n > 0:
+        while True:
             n, d = divmod(n, r)
             chars.append(digs[d])
+            if n == 0:
+                break
         # obj2 = "".join(reversed(chars))
         # filler = digs[0] * (self._sizeof(context) - len(obj2))
         # return filler + obj2
@@ -221,15 +312,15 @@ class TextualIntAdapter(Adapter):
 
 def DecNumber(name):
     """decimal number"""
-    return TextualIntAdapter(GreedyRange(Digit(name)))
+    return TextualIntAdapter(CharRun(name, '0123456789', 1))
 
 def BinNumber(name):
     """binary number"""
-    return TextualIntAdapter(GreedyRange(BinDigit(name)), 2)
+    return TextualIntAdapter(CharRun(name, '01', 1), 2)
 
 def HexNumber(name):
     """hexadecimal number"""
-    return TextualIntAdapter(GreedyRange(HexDigit(name)), 16)
+    return TextualIntAdapter(CharRun(name, '0123456789abcdefABCDEF', 1), 16)
 
 class TextualFloatAdapter(Adapter):
     def _decode(self, obj, context):
@@ -256,14 +347,14 @@ class TextualFloatAdapter(Adapter):
 def FloatNumber(name):
     return TextualFloatAdapter(
         Sequence(name,
-            GreedyRange(Digit("whole")),
+            CharRun("whole", '0123456789', 1),
             Literal("."),
-            GreedyRange(Digit("frac")),
+            CharRun("frac", '0123456789', 1),
             Optional(
                 Sequence("exp",
                     Literal("e"),
                     Optional(CharOf("sign", "+-")),
-                    GreedyRange(Digit("value")),
+                    CharRun("value", '0123456789', 1),
                 )
             )
         )
@@ -279,14 +370,12 @@ def StringUpto(name, terminators, consume_terminator = False, allow_eof = True):
     * allow_eof - whether to allow EOF to terminate the string. the default
       is True. this option is applicable only if consume_terminator is set.
     """
-    con = StringAdapter(OptionalGreedyRange(CharNoneOf(name, terminators)))
-    if not consume_terminator:
-        return con
-    if allow_eof:
-        term = Optional(CharOf(None, terminators))
-    else:
-        term = CharOf(None, terminators)
-    return IndexingAdapter(Sequence("foo", con, term), index = 0)
+    return StringAdapter(
+        TerminatedField(name, terminators,
+            consume_terminator = consume_terminator,
+            allow_eof = allow_eof or not consume_terminator,
+        )
+    )
 
 def Line(name, consume_terminator = True, allow_eof = True):
     r"""a textual line (up to "\n")
@@ -326,6 +415,6 @@ def Identifier(name,
     return IdentifierAdapter(
         Sequence(name,
             CharOf("head", headset),
-            OptionalGreedyRange(CharOf("tail", tailset)),
+            CharRun("tail", tailset),
         )
     )
@@ -0,0 +1,385 @@
+"""
+compilation of regular text grammars into regular expressions
+
+many text grammars are sequences of literals, character runs and strings up
+to a terminator, with no recursion and no choices. such a grammar can be
+matched by a single regular expression, which is much faster than parsing
+it a construct (and often a character) at a time. the values of the fields
+are taken from the named groups of the match, and decoded by the adapters of
+the grammar, so the parsed objects are the same.
+
+the repeaters of construct never give back what they matched, while those
+of regular expressions backtrack; every run is therefore made atomic, by
+matching it in a lookahead and consuming it with a backreference.
+"""
+import re
+from copy import copy
+
+from construct.core import (Construct, ConstructError, Subconstruct,
+    Adapter, StaticField, Struct, Sequence, Select, Switch, Reconfig)
+from construct.adapters import StringAdapter
+from construct.lib import Container, ListContainer, Context
+
+
+#===============================================================================
+# compilation
+#===============================================================================
+class NotRegular(Exception):
+    """raised for constructs that cannot be compiled to a regular
+    expression"""
+    __slots__ = []
+
+def _charclass(chars, negate = False):
+    chars = set(chars)
+    if not chars or not all(isinstance(c, str) and len(c) == 1
+            for c in chars):
+        raise NotRegular("not a set of characters", chars)
+    return "[%s%s]" % ("^" if negate else "",
+        "".join(re.escape(c) for c in sorted(chars)))
+
+class _Compiler(object):
+    """translates a construct into a pattern and a decoder, which takes the
+    match and the context and returns the parsed object"""
+    def __init__(self):
+        self.groups = 0
+
+    def group(self):
+        self.groups += 1
+        return "g%d" % (self.groups,)
+
+    def atomic(self, pattern):
+        """a named group that matches pattern, and never gives back what
+        it matched"""
+        name = self.group()
+        return "(?=(?P<%s>%s))(?P=%s)" % (name, pattern, name), name
+
+    def compile(self, con):
+        for cls in type(con).__mro__:
+            method = getattr(self, "_compile_" + cls.__name__, None)
+            if method is not None:
+                return method(con)
+        raise NotRegular("not a regular construct", con)
+
+    def _compile_StaticField(self, con):
+        if type(con) is not StaticField:
+            raise NotRegular("not a text field", con)
+        name = self.group()
+        return "(?P<%s>.{%d})" % (name, con.length), \
+            lambda m, ctx: m.group(name)
+
+    def _compile_ConstAdapter(self, con):
+        if (type(con.subcon) is StaticField and isinstance(con.value, str)
+                and len(con.value) == con.subcon.length):
+            value = con.value
+            return re.escape(value), lambda m, ctx: value
+        return self._compile_Adapter(con)
+
+    def _compile_OneOf(self, con):
+        if type(con.subcon) is StaticField and con.subcon.length == 1:
+            name = self.group()
+            return "(?P<%s>%s)" % (name, _charclass(con.valids)), \
+                lambda m, ctx: m.group(name)
+        return self._compile_Adapter(con)
+
+    def _compile_NoneOf(self, con):
+        if type(con.subcon) is StaticField and con.subcon.length == 1:
+            name = self.group()
+            return "(?P<%s>%s)" % (name,
+                _charclass(con.invalids, negate = True)), \
+                lambda m, ctx: m.group(name)
+        return self._compile_Adapter(con)
+
+    def _compile_CharRun(self, con):
+        pattern, name = self.atomic("%s{%d,}" % (_charclass(con.charset),
+            con.mincount))
+        return pattern, lambda m, ctx: m.group(name)
+
+    def _compile_TerminatedField(self, con):
+        terms = _charclass(con.terminators)
+        pattern, name = self.atomic(_charclass(con.terminators, True) + "*")
+        end = r"\Z" if con.allow_eof else None
+        if con.include_terminator:
+            term = self.group()
+            pattern += "(?P<%s>%s)" % (term,
+                terms if end is None else terms + "|" + end)
+            return pattern, lambda m, ctx: m.group(name) + (m.group(term)
+                or "")
+        if con.consume_terminator:
+            pattern += terms if end is None else "(?:%s|%s)" % (terms, end)
+        else:
+            pattern += "(?=%s)" % (terms if end is None else
+                terms + "|" + end,)
+        return pattern, lambda m, ctx: m.group(name)
+
+    def _compile_Adapter(self, con):
+        if type(con)._parse.im_func is not Adapter._parse.im_func:
+            raise NotRegular("adapter with its own parsing", con)
+        pattern, decode = self.compile(con.subcon)
+        if type(con) is StringAdapter and not con.encoding:
+            # the groups are strings already
+            return pattern, decode
+        return pattern, lambda m, ctx: con._decode(decode(m, ctx), ctx)
+
+    def _compile_Reconfig(self, con):
+        if con.conflags & con.FLAG_EMBED:
+            raise NotRegular("embedded", con)
+        return self.compile(con.subcon)
+
+    def _compile_Value(self, con):
+        return "", lambda m, ctx: con.func(ctx)
+
+    def _compile_Pass(self, con):
+        return "", lambda m, ctx: None
+
+    def _compile_Struct(self, con):
+        if type(con) not in (Struct, Sequence):
+            raise NotRegular("not a plain struct", con)
+        patterns = []
+        fields = []
+        for sc in con.subcons:
+            if sc.conflags & con.FLAG_EMBED:
+                raise NotRegular("embedded", sc)
+            pattern, decode = self.compile(sc)
+            patterns.append(pattern)
+            fields.append((sc.name, decode))
+        nested = con.nested
+        if type(con) is Sequence:
+            def decode(m, context):
+                if "<obj>" in context:
+                    obj = context["<obj>"]
+                    del context["<obj>"]
+                else:
+                    obj = ListContainer()
+                    if nested:
+                        context = Context(_ = context)
+                for name, field in fields:
+                    subobj = field(m, context)
+                    if name is not None:
+                        obj.append(subobj)
+                        context[name] = subobj
+                return obj
+        else:
+            def decode(m, context):
+                if "<obj>" in context:
+                    obj = context["<obj>"]
+                    del context["<obj>"]
+                else:
+                    obj = Container()
+                    if nested:
+                        context = Context(_ = context)
+                for name, field in fields:
+                    subobj = field(m, context)
+                    if name is not None:
+                        obj[name] = subobj
+                        context[name] = subobj
+                return obj
+        return "".join(patterns), decode
+
+    def partial(self, con):
+        """a pattern that matches the start of what con matches, when the
+        data ends before the match does"""
+        for cls in type(con).__mro__:
+            method = getattr(self, "_partial_" + cls.__name__, None)
+            if method is not None:
+                return method(con)
+        raise NotRegular("not a regular construct", con)
+
+    def _partial_StaticField(self, con):
+        return r".{0,%d}\Z" % (con.length,)
+
+    def _partial_ConstAdapter(self, con):
+        if (type(con.subcon) is StaticField and isinstance(con.value, str)
+                and len(con.value) == con.subcon.length):
+            return "(?:%s)" % ("|".join(re.escape(con.value[:i]) + r"\Z"
+                for i in range(len(con.value) + 1)),)
+        return self._partial_Adapter(con)
+
+    def _partial_OneOf(self, con):
+        if type(con.subcon) is StaticField and con.subcon.length == 1:
+            return r"\Z"
+        return self._partial_Adapter(con)
+
+    _partial_NoneOf = _partial_OneOf
+
+    def _partial_CharRun(self, con):
+        return r"%s*\Z" % (_charclass(con.charset),)
+
+    def _partial_TerminatedField(self, con):
+        return r"%s*\Z" % (_charclass(con.terminators, True),)
+
+    def _partial_Adapter(self, con):
+        return self.partial(con.subcon)
+
+    def _partial_Reconfig(self, con):
+        return self.partial(con.subcon)
+
+    def _partial_Value(self, con):
+        return r"\Z"
+
+    def _partial_Pass(self, con):
+        return r"\Z"
+
+    def _partial_Struct(self, con):
+        # either a field ends with the data, or it matches in full and the
+        # rest of the struct is partial; every field appears once in full,
+        # so the groups keep unique names
+        pattern = r"\Z"
+        for sc in reversed(con.subcons):
+            pattern = "(?:%s|%s%s)" % (self.partial(sc),
+                self.compile(sc)[0], pattern)
+        return pattern
+
+
+#===============================================================================
+# constructs
+#===============================================================================
+class CompiledRegex(Subconstruct):
+    """
+    A regular text grammar, parsed by matching a single regular expression
+    against a window of the stream. If the expression does not match, or
+    the adapters of the grammar reject the values, the grammar is parsed
+    as usual (so errors are those of the grammar). Building is done by the
+    grammar.
+
+    Notes:
+    * requires a seekable stream.
+    * raises NotRegular if the grammar cannot be compiled; see
+      compile_regular for compiling only the regular parts of a grammar.
+
+    Parameters:
+    * subcon - the grammar (a Struct or Sequence of literals, characters,
+      character runs, strings up to a terminator and adapters of those)
+    * window - the initial number of bytes matched against. the window
+      grows, for the parse at hand, when the match reaches its end or a
+      failed match could go on past it, up to max_window bytes.
+
+    Example:
+    http_param = CompiledRegex(Struct("params",
+        StringUpto("name", ":\\r\\n"),
+        Literal(":"),
+        Whitespace(),
+        StringUpto("value", "\\r"),
+        Literal("\\r\\n"),
+    ))
+    """
+    __slots__ = ["regex", "partial", "decoder", "window"]
+    max_window = 1 << 16
+    def __init__(self, subcon, window = 256):
+        Subconstruct.__init__(self, subcon)
+        self._compile()
+        self.window = window
+    def _compile(self):
+        pattern, self.decoder = _Compiler().compile(self.subcon)
+        self.regex = re.compile(pattern, re.DOTALL)
+        self.partial = re.compile(_Compiler().partial(self.subcon),
+            re.DOTALL)
+    def __getstate__(self):
+        attrs = Subconstruct.__getstate__(self)
+        del attrs["regex"]
+        del attrs["partial"]
+        del attrs["decoder"]
+        return attrs
+    def __setstate__(self, attrs):
+        Subconstruct.__setstate__(self, attrs)
+        self._compile()
+    def _parse(self, stream, context):
+        pos = stream.tell()
+        # the decoder takes the object of an embedding struct out of the
+        # context; it must be put back if the grammar is parsed after all
+        embedding = context.get("<obj>")
+        size = self.window
+        while True:
+            data = stream.read(size)
+            m = self.regex.match(data)
+            if len(data) < size:
+                # the window holds the rest of the stream
+                break
+            if m is not None and m.end() < len(data):
+                break
+            if m is None and self.partial.match(data) is None:
+                # the match failed before the end of the window
+                break
+            # the match reaches the end of the window, or failed there:
+            # either may be different with more data
+            if size >= self.max_window:
+                m = None
+                break
+            stream.seek(pos)
+            size *= 4
+        if m is not None:
+            try:
+                obj = self.decoder(m, context)
+            except ConstructError:
+                pass
+            else:
+                stream.seek(pos + m.end())
+                return obj
+        stream.seek(pos)
+        if embedding is not None:
+            context["<obj>"] = embedding
+        return self.subcon._parse(stream, context)
+
+def _is_regular(con):
+    try:
+        _Compiler().compile(con)
+    except NotRegular:
+        return False
+    return True
+
+def _optimize(con, memo):
+    if id(con) in memo:
+        return memo[id(con)]
+    memo[id(con)] = con
+    if type(con) in (Struct, Sequence):
+        if _is_regular(con):
+            new = CompiledRegex(con)
+        else:
+            new = copy(con)
+            new.subcons = tuple(_optimize_run(con, memo))
+    elif isinstance(con, (Select, Struct)):
+        new = copy(con)
+        new.subcons = tuple(_optimize(sc, memo) for sc in con.subcons)
+    elif isinstance(con, Switch):
+        new = copy(con)
+        new.cases = dict((key, _optimize(sc, memo))
+            for key, sc in con.cases.iteritems())
+        if isinstance(con.default, Construct):
+            new.default = _optimize(con.default, memo)
+    elif isinstance(con, Subconstruct):
+        new = copy(con)
+        new.subcon = _optimize(con.subcon, memo)
+    else:
+        new = con
+    memo[id(con)] = new
+    return new
+
+def _optimize_run(con, memo):
+    """the subcons of a struct that is not regular as a whole, with every
+    run of regular subcons compiled into an embedded struct"""
+    run = []
+    for sc in con.subcons + (None,):
+        if (sc is not None and not sc.conflags & con.FLAG_EMBED and
+                _is_regular(sc)):
+            run.append(sc)
+            continue
+        if len(run) > 1:
+            yield Reconfig(None, CompiledRegex(type(con)(None, *run)),
+                setflags = Construct.FLAG_EMBED)
+        elif run:
+            yield _optimize(run[0], memo)
+        run = []
+        if sc is not None:
+            yield _optimize(sc, memo)
+
+def compile_regular(con):
+    """
+    Compile the regular parts of a grammar into regular expressions (see
+    CompiledRegex): every Struct or Sequence that is regular as a whole,
+    and every run of two or more regular fields within the others. The
+    given grammar is not modified; a new one is returned, which parses into
+    the same objects.
+
+    Example:
+    fast_http_session = compile_regular(http_session)
+    """
+    return _optimize(con, {})
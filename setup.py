@@ -5,7 +5,7 @@ from setuptools import find_packages, setup
 setup(
     name="construct",
     version="2.06",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     license="Public Domain",
     description="a powerful declarative parser for binary data",
     long_description=open("README.rst").read(),